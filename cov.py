@@ -17,6 +17,7 @@ Regression script for RISC-V random instruction generator
 """
 
 import argparse
+import concurrent.futures
 import os
 import re
 import sys
@@ -26,6 +27,7 @@ from scripts.lib import *
 from scripts.spike_log_to_trace_csv import *
 from scripts.ovpsim_log_to_trace_csv import *
 from scripts.sail_log_to_trace_csv import *
+from scripts.riscv_cov_db import *
 from types import SimpleNamespace
 
 LOGGER = logging.getLogger()
@@ -99,17 +101,17 @@ def sim_cov(out, cfg, cwd, opts_vec, opts_cov, csv_list):
     batch_cnt = 1
     sim_cmd_list = []
     if argv.batch_size > 0:
-        batch_cnt = (len(csv_list) + argv.batch_size - 1) / argv.batch_size
+        batch_cnt = (len(csv_list) + argv.batch_size - 1) // argv.batch_size
         logging.info(
             "Batch size: {}, Batch cnt: {}".format(argv.batch_size, batch_cnt))
     for i in range(len(csv_list)):
         file_idx = 0
         trace_idx = i
         if argv.batch_size > 0:
-            file_idx = i / argv.batch_size
+            file_idx = i // argv.batch_size
             trace_idx = i % argv.batch_size
         if argv.simulator == "pyflow":
-            if i == 0:
+            if not trace_csv_opts:
                 trace_csv_opts += (" --trace_csv={}".format(csv_list[i]))
             else:
                 trace_csv_opts += (",{}".format(csv_list[i]))
@@ -134,6 +136,89 @@ def sim_cov(out, cfg, cwd, opts_vec, opts_cov, csv_list):
             csv_list)))
 
 
+def merge_cov(out, cov_index=None):
+    """Merge the coverage databases written by the coverage batches
+
+    Args:
+      out                 : Output directory
+      cov_index           : Persistent coverage database the batches are
+                            folded into, None to only merge the batches
+    """
+    merged_db = "{}/cov_merged{}".format(out, COV_DB_EXT)
+    db_list = find_cov_db([out], exclude=[merged_db])
+    if cov_index is not None:
+        cov_index.update(db_list)
+        db_list = cov_index.get_shards()
+    if not db_list:
+        logging.info("No coverage database found under {}".format(out))
+        return
+    merge_cov_db(db_list, merged_db, "{}/CoverageSummary.txt".format(out))
+
+
+def find_files(path, ext):
+    """Find all the files with a given extension under a directory
+
+    Args:
+      path : Directory to search
+      ext  : File extension, or tuple of file extensions
+
+    Returns:
+      Sorted list of the file paths
+    """
+    file_list = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.endswith(ext):
+                file_list.append(os.path.join(root, name))
+    return sorted(file_list)
+
+
+def convert_trace_log(iss, log, csv, stop_on_first_error,
+                      dont_truncate_after_first_ecall):
+    """Convert one ISS log to a full instruction trace, run in a worker"""
+    if iss == "spike":
+        process_spike_sim_log(log, csv, 1)
+    elif iss == "ovpsim":
+        process_ovpsim_sim_log(log, csv, stop_on_first_error,
+                               dont_truncate_after_first_ecall, 1)
+    return log
+
+
+def convert_trace_logs(argv, log_list, csv_list):
+    """Convert the ISS logs to instruction traces in a process pool
+
+    Logs whose trace is already newer than the log itself are skipped.
+
+    Args:
+      argv     : Configuration arguments
+      log_list : ISS logs
+      csv_list : Instruction trace of each ISS log
+    """
+    todo = []
+    for log, csv in zip(log_list, csv_list):
+        if os.path.isfile(csv) and \
+                os.path.getmtime(csv) >= os.path.getmtime(log):
+            logging.debug("Skip up-to-date trace : {}".format(csv))
+            continue
+        todo.append((log, csv))
+    # Like the --jobs option of run.py, 0 or less means no limit
+    jobs = argv.jobs if argv.jobs > 0 else os.cpu_count()
+    logging.info("Converting {} {} logs with {} jobs, {} up-to-date".format(
+        len(todo), argv.iss, jobs, len(log_list) - len(todo)))
+    if not todo:
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(jobs, len(todo))) as pool:
+        futures = [pool.submit(convert_trace_log, argv.iss, log, csv,
+                               argv.stop_on_first_error,
+                               argv.dont_truncate_after_first_ecall)
+                   for log, csv in todo]
+        for i, future in enumerate(
+                concurrent.futures.as_completed(futures)):
+            logging.info("Processed {} log[{}/{}] : {}".format(
+                argv.iss, i + 1, len(todo), future.result()))
+
+
 def collect_cov(out, cfg, cwd):
     """Collect functional coverage from the instruction trace
 
@@ -144,8 +229,9 @@ def collect_cov(out, cfg, cwd):
     """
     # Convert key dictionary to argv variable
     argv = SimpleNamespace(**cfg)
-    log_list = []
-    csv_list = []
+    trace_ext = ".csv"
+    if argv.trace_format == "columnar":
+        trace_ext = TRACE_COLUMNAR_EXT
     if not argv.dir:
         logging.error("Missing directory of trace log files")
         sys.exit(RET_FAIL)
@@ -160,37 +246,28 @@ def collect_cov(out, cfg, cwd):
         already been converted to CSV files by the post_compare step of the
         flow. """
         trace_log = ("{}/{}_trace_log".format(out, argv.core))
-        run_cmd("find {} -name \"*.csv\" | sort > {}".format(argv.dir, trace_log))
+        log_list = find_files(argv.dir, trace_ext)
+        csv_list = list(log_list)
     else:
         trace_log = ("{}/{}_trace_log".format(out, argv.iss))
-        run_cmd("find {} -name \"*.log\" | sort > {}".format(argv.dir, trace_log))
-    with open(trace_log) as f:
-        for line in f:
-            line = line.rstrip()
-            log_list.append(line)
-            csv = line[0:-4] + ".csv"
-            csv_list.append(csv)
+        # The ISS logs may be kept gzip or zstd compressed
+        log_list = find_files(argv.dir, (".log", ".log.gz", ".log.zst"))
+        csv_list = [log[0:log.rfind(".log")] + trace_ext for log in log_list]
+    with open(trace_log, "w") as f:
+        for log in log_list:
+            f.write(log + "\n")
     if argv.steps == "all" or re.match("csv", argv.steps):
-        for i in range(len(log_list)):
-            log = log_list[i]
-            csv = csv_list[i]
-            # If a core target is defined, prioritize over ISS
-            if argv.core:
-                logging.info("Process {} log[{}/{}] : {}".format(
-                    argv.core, i + 1, len(log_list), log))
-            else:
+        # If a core target is defined, prioritize over ISS
+        if argv.core:
+            for i in range(len(log_list)):
                 logging.info("Process {} log[{}/{}] : {}".format(
-                    argv.iss, i + 1, len(log_list), log))
-                if argv.iss == "spike":
-                    process_spike_sim_log(log, csv, 1)
-                elif argv.iss == "ovpsim":
-                    process_ovpsim_sim_log(log, csv, argv.stop_on_first_error,
-                                           argv.dont_truncate_after_first_ecall,
-                                           1)
-                else:
-                    logging.error(
-                        "Full trace for {} is not supported yet".format(argv.iss))
-                    sys.exit(RET_FAIL)
+                    argv.core, i + 1, len(log_list), log_list[i]))
+        else:
+            if argv.iss not in ["spike", "ovpsim"]:
+                logging.error(
+                    "Full trace for {} is not supported yet".format(argv.iss))
+                sys.exit(RET_FAIL)
+            convert_trace_logs(argv, log_list, csv_list)
     if argv.steps == "all" or re.match("cov", argv.steps):
         opts_vec = ""
         opts_cov = ""
@@ -199,12 +276,27 @@ def collect_cov(out, cfg, cwd):
         if argv.coverage_options:
             opts_cov = ("{}".format(argv.coverage_options))
         if argv.compliance_mode:
-            opts_cov += " +define+COMPLIANCE_MODE"
-        # Building the coverage collection framework
-        if argv.simulator != "pyflow":
-            build_cov(out, cfg, cwd, opts_vec, opts_cov)
-        # Simulation the coverage collection
-        sim_cov(out, cfg, cwd, opts_vec, opts_cov, csv_list)
+            if argv.simulator == "pyflow":
+                opts_cov += " --compliance_mode"
+            else:
+                opts_cov += " +define+COMPLIANCE_MODE"
+        # Only sample the traces which are new or changed since the last run
+        cov_index = None
+        if argv.cov_db:
+            if argv.simulator != "pyflow":
+                logging.error("Incremental coverage is only supported by "
+                              "the pyflow simulator")
+                sys.exit(RET_FAIL)
+            cov_index = RiscvCoverageIndex(argv.cov_db)
+            csv_list = cov_index.get_stale_traces(csv_list)
+        if csv_list:
+            # Building the coverage collection framework
+            if argv.simulator != "pyflow":
+                build_cov(out, cfg, cwd, opts_vec, opts_cov)
+            # Simulation the coverage collection
+            sim_cov(out, cfg, cwd, opts_vec, opts_cov, csv_list)
+        # Merge the coverage of all the batches
+        merge_cov(out, cov_index)
 
 
 def setup_parser():
@@ -266,8 +358,20 @@ def setup_parser():
                         dest="dont_truncate_after_first_ecall",
                         action="store_true", default=False,
                         help="Do not truncate log and csv file on first ecall")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Number of ISS logs converted in parallel, "
+                             "0 or less means the number of CPUs, default "
+                             "to the number of CPUs")
+    parser.add_argument("--trace_format", type=str, default="csv",
+                        choices=["csv", "columnar"],
+                        help="Format of the instruction trace converted from "
+                             "the ISS logs")
     parser.add_argument("--noclean", action="store_true", default=False,
                         help="Do not clean the output of the previous runs")
+    parser.add_argument("--cov_db", type=str, default="",
+                        help="Directory of a persistent coverage database, "
+                             "only the traces which are new or changed since "
+                             "the previous run are sampled (pyflow only)")
     parser.add_argument("--vector_options", type=str, default="",
                         help="Enable Vectors and set options")
     parser.add_argument("--coverage_options", type=str, default="",
@@ -168,6 +168,8 @@ class ibex_asm_program_gen(riscv_asm_program_gen):
             # Shuffle the sub programs and insert to the instruction stream
             self.insert_sub_program(self.sub_program[hart], self.instr_stream)
             logging.info("Main/sub program generation...done")
+            self.main_program[hart].instr_string_list.clear()
+            self.flush_instr_stream()
             # program end
             self.gen_program_end(hart)
             if not cfg.bare_program_mode:
@@ -175,6 +177,7 @@ class ibex_asm_program_gen(riscv_asm_program_gen):
                 if rcs.support_debug_mode:
                     self.gen_debug_rom(hart)
                 self.gen_section(pkg_ins.hart_prefix(hart) + "instr_end", ["nop"])
+            self.flush_instr_stream()
         for hart in range(cfg.num_of_harts):
             # Starting point of data section
             self.gen_data_page_begin(hart)
@@ -191,6 +194,7 @@ class ibex_asm_program_gen(riscv_asm_program_gen):
                 self.gen_kernel_sections(hart)
                 # Page table
                 self.gen_page_table_section(hart)
+            self.flush_instr_stream()
 
     # Generate the interrupt and trap handler for different privileged mode.
     # The trap handler checks the xCAUSE to determine the type of the exception and jumps to
@@ -14,8 +14,10 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 import sys
 import logging
 import vsc
+from bitstring import BitArray
 from pygen_src.isa.riscv_instr import riscv_instr
-from pygen_src.riscv_instr_pkg import pkg_ins, riscv_instr_name_t, riscv_instr_group_t
+from pygen_src.riscv_instr_pkg import (pkg_ins, riscv_instr_name_t, riscv_instr_group_t,
+                                       riscv_reg_t)
 
 
 @vsc.randobj
@@ -69,3 +71,30 @@ class riscv_amo_instr(riscv_instr):
         if self.comment != "":
             asm_str = "{} #{}".format(asm_str, self.comment)
         return asm_str.lower()
+
+    def get_opcode(self):
+        return (BitArray(uint = 47, length = 7).bin)
+
+    def get_func3(self):
+        if self.group == riscv_instr_group_t.RV32A:
+            return (BitArray(uint = 2, length = 3).bin)
+        return (BitArray(uint = 3, length = 3).bin)
+
+    def get_func5(self):
+        name = self.instr_name.name[:-2]
+        func5 = {"AMOADD": 0, "AMOSWAP": 1, "LR": 2, "SC": 3, "AMOXOR": 4, "AMOOR": 8,
+                 "AMOAND": 12, "AMOMIN": 16, "AMOMAX": 20, "AMOMINU": 24, "AMOMAXU": 28}
+        if name not in func5:
+            logging.critical("Unsupported instruction %0s", self.instr_name.name)
+            sys.exit(1)
+        return (BitArray(uint = func5[name], length = 5).bin)
+
+    # Convert the instruction to its machine code as a hex string
+    def convert2bin(self, prefix = ""):
+        rs2 = self.rs2
+        if self.instr_name in [riscv_instr_name_t.LR_W, riscv_instr_name_t.LR_D]:
+            rs2 = riscv_reg_t.ZERO
+        binary = (int(self.get_func5(), 2) << 27 | self.aq << 26 | self.rl << 25 | rs2 << 20 |
+                  self.rs1 << 15 | int(self.get_func3(), 2) << 12 | self.rd << 7 |
+                  int(self.get_opcode(), 2))
+        return prefix + "{:08x}".format(binary)
@@ -12,9 +12,11 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 
 """
 
+import sys
 import math
 import logging
 import vsc
+from bitstring import BitArray
 from importlib import import_module
 from pygen_src.isa.riscv_instr import riscv_instr
 from pygen_src.riscv_instr_pkg import (pkg_ins, riscv_instr_category_t, riscv_reg_t,
@@ -101,24 +103,148 @@ class riscv_b_instr(riscv_instr):
         return asm_str_final.lower()
 
     def get_opcode(self):
-        # TODO
-        pass
+        name = self.instr_name.name
+        if name in ["ANDN", "ORN", "XNOR", "GORC", "SLO", "SRO", "ROL", "ROR", "SBCLR",
+                    "SBSET", "SBINV", "SBEXT", "GREV", "CMIX", "CMOV", "FSL", "FSR", "CLMUL",
+                    "CLMULR", "CLMULH", "MIN", "MAX", "MINU", "MAXU", "SHFL", "UNSHFL", "BDEP",
+                    "BEXT", "PACK", "PACKU", "PACKH", "BMATOR", "BMATXOR", "BFP"]:
+            return (BitArray(uint = 51, length = 7).bin)
+        elif name in ["SLOI", "SROI", "RORI", "SBCLRI", "SBSETI", "SBINVI", "SBEXTI", "GORCI",
+                      "GREVI", "FSRI", "CLZ", "CTZ", "PCNT", "BMATFLIP", "SEXT_B", "SEXT_H",
+                      "CRC32_B", "CRC32_H", "CRC32_W", "CRC32_D", "CRC32C_B", "CRC32C_H",
+                      "CRC32C_W", "CRC32C_D", "SHFLI", "UNSHFLI"]:
+            return (BitArray(uint = 19, length = 7).bin)
+        elif name in ["ADDIWU", "SLLIU_W", "SLOIW", "SROIW", "RORIW", "SBCLRIW", "SBSETIW",
+                      "SBINVIW", "GORCIW", "GREVIW", "FSRIW", "CLZW", "CTZW", "PCNTW"]:
+            return (BitArray(uint = 27, length = 7).bin)
+        elif name in ["ADDWU", "SUBWU", "ADDUW", "SUBUW", "SLOW", "SROW", "ROLW", "RORW",
+                      "SBCLRW", "SBSETW", "SBINVW", "SBEXTW", "GORCW", "GREVW", "FSLW", "FSRW",
+                      "CLMULW", "CLMULRW", "CLMULHW", "SHFLW", "UNSHFLW", "BDEPW", "BEXTW",
+                      "PACKW", "PACKUW", "BFPW"]:
+            return (BitArray(uint = 59, length = 7).bin)
+        else:
+            logging.critical("Unsupported instruction %0s", name)
+            sys.exit(1)
 
     def get_func3(self):
-        # TODO
-        pass
+        name = self.instr_name.name
+        if name in ["ADDWU", "SUBWU", "ADDUW", "SUBUW"]:
+            return (BitArray(uint = 0, length = 3).bin)
+        elif name in ["SLO", "ROL", "SBCLR", "SBSET", "SBINV", "SLOI", "SBCLRI", "SBSETI",
+                      "SBINVI", "CMIX", "FSL", "CLZ", "CTZ", "PCNT", "BMATFLIP", "SEXT_B",
+                      "SEXT_H", "CRC32_B", "CRC32_H", "CRC32_W", "CRC32_D", "CRC32C_B",
+                      "CRC32C_H", "CRC32C_W", "CRC32C_D", "CLMUL", "SHFL", "SHFLI", "SLLIU_W",
+                      "SLOW", "ROLW", "SBCLRW", "SBSETW", "SBINVW", "SLOIW", "SBCLRIW",
+                      "SBSETIW", "SBINVIW", "FSLW", "CLZW", "CTZW", "PCNTW", "CLMULW",
+                      "SHFLW"]:
+            return (BitArray(uint = 1, length = 3).bin)
+        elif name in ["CLMULR", "CLMULRW"]:
+            return (BitArray(uint = 2, length = 3).bin)
+        elif name in ["CLMULH", "BMATOR", "BMATXOR", "CLMULHW"]:
+            return (BitArray(uint = 3, length = 3).bin)
+        elif name in ["XNOR", "MIN", "PACK", "PACKU", "ADDIWU", "PACKW", "PACKUW"]:
+            return (BitArray(uint = 4, length = 3).bin)
+        elif name in ["SRO", "ROR", "SBEXT", "GORC", "GREV", "SROI", "RORI", "SBEXTI", "GORCI",
+                      "GREVI", "CMOV", "FSR", "FSRI", "MAX", "UNSHFL", "UNSHFLI", "SROW",
+                      "RORW", "SBEXTW", "GORCW", "GREVW", "SROIW", "RORIW", "GORCIW", "GREVIW",
+                      "FSRW", "FSRIW", "UNSHFLW"]:
+            return (BitArray(uint = 5, length = 3).bin)
+        elif name in ["ORN", "MINU", "BDEP", "BEXT", "BDEPW", "BEXTW"]:
+            return (BitArray(uint = 6, length = 3).bin)
+        elif name in ["ANDN", "MAXU", "PACKH", "BFP", "BFPW"]:
+            return (BitArray(uint = 7, length = 3).bin)
+        else:
+            logging.critical("Unsupported instruction %0s", name)
+            sys.exit(1)
 
+    # Bits [31:27] of the instruction
     def get_func5(self):
-        # TODO
-        pass
+        name = self.instr_name.name
+        if name in ["CLMUL", "CLMULR", "CLMULH", "MIN", "MAX", "MINU", "MAXU", "SHFL",
+                    "UNSHFL", "BEXT", "PACK", "PACKH", "BMATOR", "SHFLI", "UNSHFLI", "ADDWU",
+                    "ADDUW", "SLLIU_W", "CLMULW", "CLMULRW", "CLMULHW", "SHFLW", "UNSHFLW",
+                    "BEXTW", "PACKW"]:
+            return (BitArray(uint = 1, length = 5).bin)
+        elif name in ["SLO", "SRO", "SLOI", "SROI", "SLOW", "SROW", "SLOIW", "SROIW"]:
+            return (BitArray(uint = 4, length = 5).bin)
+        elif name in ["SBSET", "GORC", "SBSETI", "GORCI", "SBSETW", "GORCW", "SBSETIW",
+                      "GORCIW"]:
+            return (BitArray(uint = 5, length = 5).bin)
+        elif name in ["ANDN", "ORN", "XNOR"]:
+            return (BitArray(uint = 8, length = 5).bin)
+        elif name in ["SBCLR", "SBEXT", "SBCLRI", "SBEXTI", "BDEP", "PACKU", "BMATXOR", "BFP",
+                      "SUBWU", "SUBUW", "SBCLRW", "SBEXTW", "SBCLRIW", "BDEPW", "PACKUW",
+                      "BFPW"]:
+            return (BitArray(uint = 9, length = 5).bin)
+        elif name in ["ROL", "ROR", "RORI", "CLZ", "CTZ", "PCNT", "BMATFLIP", "SEXT_B",
+                      "SEXT_H", "CRC32_B", "CRC32_H", "CRC32_W", "CRC32_D", "CRC32C_B",
+                      "CRC32C_H", "CRC32C_W", "CRC32C_D", "ROLW", "RORW", "RORIW", "CLZW",
+                      "CTZW", "PCNTW"]:
+            return (BitArray(uint = 12, length = 5).bin)
+        elif name in ["SBINV", "GREV", "SBINVI", "GREVI", "SBINVW", "GREVW", "SBINVIW",
+                      "GREVIW"]:
+            return (BitArray(uint = 13, length = 5).bin)
+        else:
+            logging.critical("Unsupported instruction %0s", name)
+            sys.exit(1)
 
+    # Bits [26:25] of the instruction
     def get_func2(self):
-        # TODO
-        pass
+        name = self.instr_name.name
+        if name in ["CLMUL", "CLMULR", "CLMULH", "MIN", "MAX", "MINU", "MAXU", "ADDWU",
+                    "SUBWU", "CLMULW", "CLMULRW", "CLMULHW"]:
+            return (BitArray(uint = 1, length = 2).bin)
+        elif name in ["FSL", "FSR", "FSRI", "FSLW", "FSRW", "FSRIW"]:
+            return (BitArray(uint = 2, length = 2).bin)
+        elif name in ["CMIX", "CMOV"]:
+            return (BitArray(uint = 3, length = 2).bin)
+        else:
+            return (BitArray(uint = 0, length = 2).bin)
 
-    # Convert the instruction to assembly code
-    def convert2bin(self, prefix):
-        pass
+    # Convert the instruction to its machine code as a hex string
+    def convert2bin(self, prefix = ""):
+        name = self.instr_name.name
+        opcode = int(self.get_opcode(), 2)
+        func3 = int(self.get_func3(), 2) << 12
+        if name in ["CMIX", "CMOV", "FSL", "FSR", "FSLW", "FSRW"]:
+            # convert2asm prints "rd, rs1, rs2, rs3" while the assembler syntax is
+            # "rd, rs2, rs1, rs3" for cmix/cmov and "rd, rs1, rs3, rs2" for fsl/fsr
+            if name in ["CMIX", "CMOV"]:
+                src1, src2, src3 = self.rs2, self.rs1, self.rs3
+            else:
+                src1, src2, src3 = self.rs1, self.rs3, self.rs2
+            binary = (src3 << 27 | int(self.get_func2(), 2) << 25 | src2 << 20 |
+                      src1 << 15 | func3 | self.rd << 7 | opcode)
+        elif name in ["FSRI", "FSRIW"]:
+            imm_mask = 0x1f if name == "FSRIW" else 0x3f
+            binary = (self.rs3 << 27 | int(self.get_func2(), 2) << 25 |
+                      (self.imm & imm_mask) << 20 | self.rs1 << 15 | func3 | self.rd << 7 |
+                      opcode)
+        elif name == "ADDIWU":
+            binary = (self.imm & 0xfff) << 20 | self.rs1 << 15 | func3 | self.rd << 7 | opcode
+        elif name in ["CLZ", "CTZ", "PCNT", "BMATFLIP", "SEXT_B", "SEXT_H", "CRC32_B",
+                      "CRC32_H", "CRC32_W", "CRC32_D", "CRC32C_B", "CRC32C_H", "CRC32C_W",
+                      "CRC32C_D", "CLZW", "CTZW", "PCNTW"]:
+            # Unary operations select the operation through the rs2 field
+            func_rs2 = {"CLZ": 0, "CTZ": 1, "PCNT": 2, "BMATFLIP": 3, "SEXT_B": 4,
+                        "SEXT_H": 5, "CRC32_B": 16, "CRC32_H": 17, "CRC32_W": 18, "CRC32_D": 19,
+                        "CRC32C_B": 24, "CRC32C_H": 25, "CRC32C_W": 26, "CRC32C_D": 27,
+                        "CLZW": 0, "CTZW": 1, "PCNTW": 2}[name]
+            binary = (int(self.get_func5(), 2) << 27 | int(self.get_func2(), 2) << 25 |
+                      func_rs2 << 20 | self.rs1 << 15 | func3 | self.rd << 7 | opcode)
+        elif self.format == riscv_instr_format_t.I_FORMAT:
+            if name in ["SHFLI", "UNSHFLI"]:
+                imm_mask = 0x1f if self.XLEN != 32 else 0xf
+            elif name.endswith("IW"):
+                imm_mask = 0x1f
+            else:
+                imm_mask = 0x3f if self.XLEN != 32 else 0x1f
+            binary = (int(self.get_func5(), 2) << 27 | (self.imm & imm_mask) << 20 |
+                      self.rs1 << 15 | func3 | self.rd << 7 | opcode)
+        else:
+            binary = (int(self.get_func5(), 2) << 27 | int(self.get_func2(), 2) << 25 |
+                      self.rs2 << 20 | self.rs1 << 15 | func3 | self.rd << 7 | opcode)
+        return prefix + "{:08x}".format(binary)
 
     def is_supported(self, cfg):
         return (cfg.enable_b_extension and
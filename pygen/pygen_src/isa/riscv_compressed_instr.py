@@ -11,8 +11,10 @@ distributed under the License is distributed on an "AS IS" BASIS,
 WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 """
 
+import sys
 import logging
 import vsc
+from bitstring import BitArray
 from pygen_src.isa.riscv_instr import riscv_instr
 from pygen_src.riscv_instr_pkg import (riscv_instr_name_t, riscv_instr_format_t,
                                        riscv_instr_category_t, riscv_reg_t, imm_t, pkg_ins)
@@ -20,6 +22,12 @@ from pygen_src.riscv_instr_pkg import (riscv_instr_name_t, riscv_instr_format_t,
 
 @vsc.randobj
 class riscv_compressed_instr(riscv_instr):
+    fast_rand_constraints = riscv_instr.fast_rand_constraints + [
+        "rvc_csr_c", "imm_val_c", "jal_c", "no_hint_illegal_instr_c"]
+    # Registers reachable through the three-bit rs1, rs2 and rd fields
+    compressed_gpr = (riscv_reg_t.S0, riscv_reg_t.S1, riscv_reg_t.A0, riscv_reg_t.A1,
+                      riscv_reg_t.A2, riscv_reg_t.A3, riscv_reg_t.A4, riscv_reg_t.A5)
+
     def __init__(self):
         super().__init__()
         self.imm_align = 0
@@ -98,6 +106,45 @@ class riscv_compressed_instr(riscv_instr):
         with vsc.if_then(self.instr_name == riscv_instr_name_t.C_LUI):
             self.rd != riscv_reg_t.SP
 
+    # Legal register table matching rvc_csr_c and no_hint_illegal_instr_c
+    def get_legal_gpr(self):
+        rs1_regs, rs2_regs, rd_regs = super().get_legal_gpr()
+        if self.format in [riscv_instr_format_t.CIW_FORMAT, riscv_instr_format_t.CL_FORMAT,
+                           riscv_instr_format_t.CS_FORMAT, riscv_instr_format_t.CB_FORMAT,
+                           riscv_instr_format_t.CA_FORMAT]:
+            rs1_regs = rs2_regs = rd_regs = self.compressed_gpr
+        if self.instr_name == riscv_instr_name_t.C_ADDI16SP:
+            rd_regs = [reg for reg in rd_regs if reg == riscv_reg_t.SP]
+        if self.instr_name in [riscv_instr_name_t.C_JR, riscv_instr_name_t.C_JALR]:
+            rs1_regs = [reg for reg in rs1_regs if reg != riscv_reg_t.ZERO]
+            rs2_regs = [reg for reg in rs2_regs if reg == riscv_reg_t.ZERO]
+        if self.instr_name in [riscv_instr_name_t.C_ADDI, riscv_instr_name_t.C_ADDIW,
+                               riscv_instr_name_t.C_LI, riscv_instr_name_t.C_LUI,
+                               riscv_instr_name_t.C_SLLI, riscv_instr_name_t.C_SLLI64,
+                               riscv_instr_name_t.C_LQSP, riscv_instr_name_t.C_LDSP,
+                               riscv_instr_name_t.C_MV, riscv_instr_name_t.C_ADD,
+                               riscv_instr_name_t.C_LWSP]:
+            rd_regs = [reg for reg in rd_regs if reg != riscv_reg_t.ZERO]
+        if self.instr_name in [riscv_instr_name_t.C_ADD, riscv_instr_name_t.C_MV]:
+            rs2_regs = [reg for reg in rs2_regs if reg != riscv_reg_t.ZERO]
+        if self.instr_name == riscv_instr_name_t.C_LUI:
+            rd_regs = [reg for reg in rd_regs if reg != riscv_reg_t.SP]
+        return (rs1_regs, rs2_regs, rd_regs)
+
+    # Random imm value satisfying imm_val_c
+    def get_rand_imm(self):
+        while True:
+            imm = super().get_rand_imm()
+            if self.imm_type not in [imm_t.NZIMM, imm_t.NZUIMM]:
+                return imm
+            if self.instr_name in [riscv_instr_name_t.C_LUI, riscv_instr_name_t.C_SRAI,
+                                   riscv_instr_name_t.C_SRLI, riscv_instr_name_t.C_SLLI]:
+                imm &= 0x1f
+            if self.instr_name == riscv_instr_name_t.C_ADDI4SPN:
+                imm &= ~0x3
+            if imm & 0x3f:
+                return imm
+
     def set_imm_len(self):
         if self.format in [riscv_instr_format_t.CI_FORMAT, riscv_instr_format_t.CSS_FORMAT]:
             self.imm_len = 6
@@ -215,14 +262,128 @@ class riscv_compressed_instr(riscv_instr):
                 asm_str = asm_str + " #" + self.comment
         return asm_str.lower()
 
-    # TODO
-    def conver2bin(self, prefix=""):
-        pass
+    # Convert the instruction to its 16-bit machine code as a hex string
+    def convert2bin(self, prefix=""):
+        name = self.instr_name.name
+        opcode = int(self.get_c_opcode(), 2)
+        func3 = int(self.get_func3(), 2) << 13
+        if self.format == riscv_instr_format_t.CIW_FORMAT:
+            binary = (func3 | self.imm_bits(5, 4) << 11 | self.imm_bits(9, 6) << 7 |
+                      self.imm_bits(2, 2) << 6 | self.imm_bits(3, 3) << 5 |
+                      self.get_c_gpr(self.rd) << 2 | opcode)
+        elif self.format in [riscv_instr_format_t.CL_FORMAT, riscv_instr_format_t.CS_FORMAT]:
+            if name in ["C_SUB", "C_XOR", "C_OR", "C_AND", "C_SUBW", "C_ADDW"]:
+                binary = self.get_ca_bin(name, opcode, func3)
+            else:
+                if self.format == riscv_instr_format_t.CL_FORMAT:
+                    reg = self.get_c_gpr(self.rd)
+                else:
+                    reg = self.get_c_gpr(self.rs2)
+                if name in ["C_LD", "C_SD", "C_FLD", "C_FSD"]:
+                    imm_lo = self.imm_bits(7, 6)
+                else:
+                    imm_lo = self.imm_bits(2, 2) << 1 | self.imm_bits(6, 6)
+                binary = (func3 | self.imm_bits(5, 3) << 10 | self.get_c_gpr(self.rs1) << 7 |
+                          imm_lo << 5 | reg << 2 | opcode)
+        elif self.format == riscv_instr_format_t.CA_FORMAT:
+            binary = self.get_ca_bin(name, opcode, func3)
+        elif self.format == riscv_instr_format_t.CI_FORMAT:
+            if name == "C_NOP":
+                binary = func3 | opcode
+            elif name == "C_EBREAK":
+                binary = func3 | 1 << 12 | opcode
+            elif name == "C_ADDI16SP":
+                binary = (func3 | self.imm_bits(9, 9) << 12 | riscv_reg_t.SP << 7 |
+                          self.imm_bits(4, 4) << 6 | self.imm_bits(6, 6) << 5 |
+                          self.imm_bits(8, 7) << 3 | self.imm_bits(5, 5) << 2 | opcode)
+            elif name in ["C_LWSP", "C_FLWSP"]:
+                binary = (func3 | self.imm_bits(5, 5) << 12 | self.rd << 7 |
+                          self.imm_bits(4, 2) << 4 | self.imm_bits(7, 6) << 2 | opcode)
+            elif name in ["C_LDSP", "C_FLDSP"]:
+                binary = (func3 | self.imm_bits(5, 5) << 12 | self.rd << 7 |
+                          self.imm_bits(4, 3) << 5 | self.imm_bits(8, 6) << 2 | opcode)
+            else:
+                binary = (func3 | self.imm_bits(5, 5) << 12 | self.rd << 7 |
+                          self.imm_bits(4, 0) << 2 | opcode)
+        elif self.format == riscv_instr_format_t.CSS_FORMAT:
+            if name in ["C_SDSP", "C_FSDSP"]:
+                imm_field = self.imm_bits(5, 3) << 3 | self.imm_bits(8, 6)
+            else:
+                imm_field = self.imm_bits(5, 2) << 2 | self.imm_bits(7, 6)
+            binary = func3 | imm_field << 7 | self.rs2 << 2 | opcode
+        elif self.format == riscv_instr_format_t.CB_FORMAT:
+            if name in ["C_BEQZ", "C_BNEZ"]:
+                binary = (func3 | self.imm_bits(8, 8) << 12 | self.imm_bits(4, 3) << 10 |
+                          self.get_c_gpr(self.rs1) << 7 | self.imm_bits(7, 6) << 5 |
+                          self.imm_bits(2, 1) << 3 | self.imm_bits(5, 5) << 2 | opcode)
+            else:
+                func2 = {"C_SRLI": 0b00, "C_SRAI": 0b01, "C_ANDI": 0b10}[name]
+                binary = (func3 | self.imm_bits(5, 5) << 12 | func2 << 10 |
+                          self.get_c_gpr(self.rs1) << 7 | self.imm_bits(4, 0) << 2 | opcode)
+        elif self.format == riscv_instr_format_t.CR_FORMAT:
+            if name in ["C_JR", "C_JALR"]:
+                binary = func3 | (name == "C_JALR") << 12 | self.rs1 << 7 | opcode
+            else:
+                binary = func3 | (name == "C_ADD") << 12 | self.rd << 7 | self.rs2 << 2 | opcode
+        elif self.format == riscv_instr_format_t.CJ_FORMAT:
+            binary = (func3 | self.imm_bits(11, 11) << 12 | self.imm_bits(4, 4) << 11 |
+                      self.imm_bits(9, 8) << 9 | self.imm_bits(10, 10) << 8 |
+                      self.imm_bits(6, 6) << 7 | self.imm_bits(7, 7) << 6 |
+                      self.imm_bits(3, 1) << 3 | self.imm_bits(5, 5) << 2 | opcode)
+        else:
+            logging.critical("Unsupported format %0s", self.format.name)
+            sys.exit(1)
+        return prefix + "{:04x}".format(binary)
+
+    # CA format: c.sub, c.xor, c.or, c.and, c.subw, c.addw
+    def get_ca_bin(self, name, opcode, func3):
+        func6 = 0b100111 if name in ["C_SUBW", "C_ADDW"] else 0b100011
+        func2 = {"C_SUB": 0b00, "C_XOR": 0b01, "C_OR": 0b10, "C_AND": 0b11,
+                 "C_SUBW": 0b00, "C_ADDW": 0b01}[name]
+        return (func6 << 10 | self.get_c_gpr(self.rd) << 7 | func2 << 5 |
+                self.get_c_gpr(self.rs2) << 2 | opcode)
+
+    # Return imm[msb:lsb]
+    def imm_bits(self, msb, lsb):
+        return (self.imm >> lsb) & ((1 << (msb - lsb + 1)) - 1)
 
-    # TODO
     def get_c_opcode(self):
-        pass
+        name = self.instr_name.name
+        if name in ["C_ADDI4SPN", "C_FLD", "C_LQ", "C_LW", "C_FLW", "C_LD", "C_FSD", "C_SQ",
+                    "C_SW", "C_FSW", "C_SD"]:
+            return (BitArray(uint = 0, length = 2).bin)
+        elif name in ["C_NOP", "C_ADDI", "C_JAL", "C_ADDIW", "C_LI", "C_ADDI16SP", "C_LUI",
+                      "C_SRLI", "C_SRLI64", "C_SRAI", "C_SRAI64", "C_ANDI", "C_SUB", "C_XOR",
+                      "C_OR", "C_AND", "C_SUBW", "C_ADDW", "C_J", "C_BEQZ", "C_BNEZ"]:
+            return (BitArray(uint = 1, length = 2).bin)
+        elif name in ["C_SLLI", "C_SLLI64", "C_FLDSP", "C_LQSP", "C_LWSP", "C_FLWSP",
+                      "C_LDSP", "C_JR", "C_MV", "C_EBREAK", "C_JALR", "C_ADD", "C_FSDSP",
+                      "C_SQSP", "C_SWSP", "C_FSWSP", "C_SDSP"]:
+            return (BitArray(uint = 2, length = 2).bin)
+        else:
+            logging.critical("Unsupported instruction %0s", name)
+            sys.exit(1)
 
-    # TODO
     def get_func3(self):
-        pass
+        name = self.instr_name.name
+        if name in ["C_ADDI4SPN", "C_ADDI", "C_NOP", "C_SLLI", "C_SLLI64"]:
+            return (BitArray(uint = 0, length = 3).bin)
+        elif name in ["C_FLD", "C_LQ", "C_JAL", "C_ADDIW", "C_FLDSP", "C_LQSP"]:
+            return (BitArray(uint = 1, length = 3).bin)
+        elif name in ["C_LW", "C_LI", "C_LWSP"]:
+            return (BitArray(uint = 2, length = 3).bin)
+        elif name in ["C_FLW", "C_LD", "C_ADDI16SP", "C_LUI", "C_FLWSP", "C_LDSP"]:
+            return (BitArray(uint = 3, length = 3).bin)
+        elif name in ["C_SRLI", "C_SRLI64", "C_SRAI", "C_SRAI64", "C_ANDI", "C_SUB", "C_XOR",
+                      "C_OR", "C_AND", "C_SUBW", "C_ADDW", "C_JR", "C_MV", "C_EBREAK",
+                      "C_JALR", "C_ADD"]:
+            return (BitArray(uint = 4, length = 3).bin)
+        elif name in ["C_FSD", "C_SQ", "C_J", "C_FSDSP", "C_SQSP"]:
+            return (BitArray(uint = 5, length = 3).bin)
+        elif name in ["C_SW", "C_BEQZ", "C_SWSP"]:
+            return (BitArray(uint = 6, length = 3).bin)
+        elif name in ["C_FSW", "C_SD", "C_BNEZ", "C_FSWSP", "C_SDSP"]:
+            return (BitArray(uint = 7, length = 3).bin)
+        else:
+            logging.critical("Unsupported instruction %0s", name)
+            sys.exit(1)
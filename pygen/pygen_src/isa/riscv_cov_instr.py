@@ -63,6 +63,12 @@ class riscv_cov_instr:
     data parsed from the CSV file fill different fields of an instruction """
     # class attr. to keep track of reg_name:reg_value throughout the program
     gpr_state = {}
+    # class attr. caching the attributes assign_attributes derives from
+    # the instruction name, keyed by riscv_instr_name_t
+    static_attrs = {}
+    static_attr_names = ["format", "category", "group", "imm_type", "imm_len",
+                         "has_rs1", "has_rs2", "has_rd", "has_imm", "has_fs1",
+                         "has_fs2", "has_fs3", "has_fd"]
 
     def __init__(self):
         # Program counter (PC) of the instruction
@@ -137,13 +143,18 @@ class riscv_cov_instr:
         self.fd = 0
 
     def assign_attributes(self):
-        attr_list = get_attr_list(self.instr)
-        self.format = attr_list[0]
-        self.category = attr_list[1]
-        self.group = attr_list[2]
-        self.imm_type = imm_t.IMM
-        if len(attr_list) > 3:
-            self.imm_type = attr_list[3]
+        attrs = riscv_cov_instr.static_attrs.get(self.instr)
+        if attrs is None:
+            self.decode_attributes()
+            attrs = {name: getattr(self, name)
+                     for name in riscv_cov_instr.static_attr_names}
+            riscv_cov_instr.static_attrs[self.instr] = attrs
+        else:
+            self.__dict__.update(attrs)
+
+    def decode_attributes(self):
+        (self.format, self.category, self.group,
+         self.imm_type) = instr_attr_table[self.instr]
         self.set_imm_len()
         self.set_mode()
         if self.group.name in ["RV32D", "RV32F"]:
@@ -565,7 +576,11 @@ class riscv_cov_instr:
             logging.error("Unsupported format {}".format(self.format.name))
 
     def update_dst_regs(self, reg_name, val_str):
-        riscv_cov_instr.gpr_state[reg_name] = get_val(val_str, hexa=1)
+        self.update_dst_reg_val(reg_name, get_val(val_str, hexa=1))
+
+    # Same as update_dst_regs, with the register value already decoded
+    def update_dst_reg_val(self, reg_name, val):
+        riscv_cov_instr.gpr_state[reg_name] = val
         self.rd = self.get_gpr(reg_name)
         self.rd_value.set_val(self.get_gpr_state(reg_name))
 
@@ -11,8 +11,10 @@ distributed under the License is distributed on an "AS IS" BASIS,
 WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 """
 
+import sys
 import logging
 import vsc
+from bitstring import BitArray
 from pygen_src.isa.riscv_instr import riscv_instr
 from pygen_src.isa.riscv_cov_instr import riscv_cov_instr, operand_sign_e
 from pygen_src.riscv_instr_pkg import (pkg_ins, riscv_fpr_t, riscv_instr_format_t,
@@ -73,6 +75,114 @@ class riscv_floating_point_instr(riscv_instr):
             asm_str = asm_str + " #" + self.comment
         return asm_str.lower()
 
+    def get_opcode(self):
+        name = self.instr_name.name
+        if name in ["FLW", "FLD"]:
+            return (BitArray(uint = 7, length = 7).bin)
+        elif name in ["FSW", "FSD"]:
+            return (BitArray(uint = 39, length = 7).bin)
+        elif name in ["FMADD_S", "FMADD_D"]:
+            return (BitArray(uint = 67, length = 7).bin)
+        elif name in ["FMSUB_S", "FMSUB_D"]:
+            return (BitArray(uint = 71, length = 7).bin)
+        elif name in ["FNMSUB_S", "FNMSUB_D"]:
+            return (BitArray(uint = 75, length = 7).bin)
+        elif name in ["FNMADD_S", "FNMADD_D"]:
+            return (BitArray(uint = 79, length = 7).bin)
+        else:
+            return (BitArray(uint = 83, length = 7).bin)
+
+    # Fixed func3 of the instruction, the dynamic rounding mode is used for the rest
+    def get_func3(self):
+        name = self.instr_name.name
+        if name in ["FSGNJ_S", "FSGNJ_D", "FMIN_S", "FMIN_D", "FLE_S", "FLE_D", "FMV_X_W",
+                    "FMV_X_D", "FMV_W_X", "FMV_D_X", "FCVT_D_S", "FCVT_D_W", "FCVT_D_WU"]:
+            return (BitArray(uint = 0, length = 3).bin)
+        elif name in ["FSGNJN_S", "FSGNJN_D", "FMAX_S", "FMAX_D", "FLT_S", "FLT_D",
+                      "FCLASS_S", "FCLASS_D"]:
+            return (BitArray(uint = 1, length = 3).bin)
+        elif name in ["FSGNJX_S", "FSGNJX_D", "FEQ_S", "FEQ_D", "FLW", "FSW"]:
+            return (BitArray(uint = 2, length = 3).bin)
+        elif name in ["FLD", "FSD"]:
+            return (BitArray(uint = 3, length = 3).bin)
+        else:
+            return (BitArray(uint = 7, length = 3).bin)
+
+    # func7 of OP-FP instructions, the two LSBs hold the format field
+    def get_func7(self):
+        operation, *types = self.instr_name.name.split("_")
+        if operation == "FCVT":
+            dst, src = types
+            if dst in ["S", "D"]:
+                fmt = dst
+                func5 = 0b01000 if src in ["S", "D"] else 0b11010
+            else:
+                fmt = src
+                func5 = 0b11000
+        elif operation == "FMV":
+            dst, src = types
+            if dst == "X":
+                fmt = src
+                func5 = 0b11100
+            else:
+                fmt = dst
+                func5 = 0b11110
+        else:
+            fmt = types[0]
+            func5 = {"FADD": 0b00000, "FSUB": 0b00001, "FMUL": 0b00010, "FDIV": 0b00011,
+                     "FSQRT": 0b01011, "FSGNJ": 0b00100, "FSGNJN": 0b00100,
+                     "FSGNJX": 0b00100, "FMIN": 0b00101, "FMAX": 0b00101, "FEQ": 0b10100,
+                     "FLT": 0b10100, "FLE": 0b10100, "FCLASS": 0b11100}[operation]
+        return (BitArray(uint = func5 << 2 | (fmt == "D"), length = 7).bin)
+
+    # Value of the rs2 field of OP-FP instructions which take a single source operand
+    def get_rs2_field(self):
+        operation, *types = self.instr_name.name.split("_")
+        if operation == "FCVT":
+            dst, src = types
+            if dst in ["S", "D"] and src in ["S", "D"]:
+                return ["S", "D"].index(src)
+            return ["W", "WU", "L", "LU"].index(src if dst in ["S", "D"] else dst)
+        elif operation in ["FMV", "FCLASS", "FSQRT"]:
+            return 0
+        return self.fs2
+
+    # Convert the instruction to its machine code as a hex string
+    def convert2bin(self, prefix = ""):
+        name = self.instr_name.name
+        opcode = int(self.get_opcode(), 2)
+        func3 = int(self.get_func3(), 2)
+        # Integer register operands share the fs1/fd fields
+        if name in ["FMV_W_X", "FMV_D_X", "FCVT_S_W", "FCVT_S_WU", "FCVT_S_L", "FCVT_S_LU",
+                    "FCVT_D_W", "FCVT_D_WU", "FCVT_D_L", "FCVT_D_LU"]:
+            src1 = self.rs1
+        else:
+            src1 = self.fs1
+        if (self.category == riscv_instr_category_t.COMPARE or
+                name in ["FMV_X_W", "FMV_X_D", "FCLASS_S", "FCLASS_D", "FCVT_W_S",
+                         "FCVT_WU_S", "FCVT_L_S", "FCVT_LU_S", "FCVT_W_D", "FCVT_WU_D",
+                         "FCVT_L_D", "FCVT_LU_D"]):
+            dst = self.rd
+        else:
+            dst = self.fd
+        if name in ["FLW", "FLD"]:
+            binary = ((self.imm & 0xfff) << 20 | self.rs1 << 15 | func3 << 12 |
+                      self.fd << 7 | opcode)
+        elif name in ["FSW", "FSD"]:
+            binary = (((self.imm >> 5) & 0x7f) << 25 | self.fs2 << 20 | self.rs1 << 15 |
+                      func3 << 12 | (self.imm & 0x1f) << 7 | opcode)
+        elif self.format == riscv_instr_format_t.R4_FORMAT:
+            fmt = 1 if name.endswith("_D") else 0
+            binary = (self.fs3 << 27 | fmt << 25 | self.fs2 << 20 | self.fs1 << 15 |
+                      func3 << 12 | self.fd << 7 | opcode)
+        elif self.format in [riscv_instr_format_t.I_FORMAT, riscv_instr_format_t.R_FORMAT]:
+            binary = (int(self.get_func7(), 2) << 25 | self.get_rs2_field() << 20 |
+                      src1 << 15 | func3 << 12 | dst << 7 | opcode)
+        else:
+            logging.critical("Unsupported floating point format: %0s", self.format.name)
+            sys.exit(1)
+        return prefix + "{:08x}".format(binary)
+
     def set_rand_mode(self):
         self.has_rs1 = 0
         self.has_rs2 = 0
@@ -15,6 +15,8 @@ import copy
 import sys
 import random
 import vsc
+from vsc.types import type_base
+from vsc.constraints import constraint_t, dynamic_constraint_t
 from imp import reload
 from collections import defaultdict
 from bitstring import BitArray
@@ -44,6 +46,18 @@ class riscv_instr:
     instr_category = defaultdict(list)
     basic_instr = []
     instr_template = {}
+    # Pristine instance of every registered instruction, built once per process and cloned
+    # into instr_template for every test
+    instr_prototype = {}
+
+    # Resolved candidate instructions keyed by get_rand_instr filter arguments
+    instr_select_index = {}
+
+    # Constraint blocks fast_randomize reproduces without the solver, and whether each
+    # instruction class can be randomized that way
+    fast_rand_constraints = ["imm_c", "csr_c"]
+    fast_rand_support = {}
+    all_gpr = tuple(riscv_reg_t)
 
     # Privileged CSR filter
     exclude_reg = []
@@ -133,6 +147,45 @@ class riscv_instr:
                 setattr(result, k, copy.deepcopy(v, memo))
         return result
 
+    # Cheap replacement for deepcopy when instantiating an instruction from its template.
+    # Every PyVSC field gets its own field object and scalar model so the rand operands of
+    # the copy never alias the template; the composite model, which holds the constraint
+    # expressions, is rebuilt on first use against the copied fields instead of being
+    # deep-copied expression by expression.
+    def clone(self):
+        cls = self.__class__
+        result = cls.__new__(cls)
+        for k, v in self.__dict__.items():
+            if k in ["_ro_int", "tname"]:
+                continue
+            elif k == "_int_field_info":
+                v = copy.copy(v)
+                v.model = None
+                v.parent = None
+            elif isinstance(v, type_base):
+                v = copy.copy(v)
+                v._int_field_info = copy.copy(v._int_field_info)
+                model = v._int_field_info.model
+                if model is not None:
+                    model = copy.copy(model)
+                    model.parent = None
+                    model.var = None
+                    model.val = copy.copy(model.val)
+                    v._int_field_info.model = model
+            elif isinstance(v, (list, dict, set)):
+                v = copy.deepcopy(v)
+            result.__dict__[k] = v
+        return result
+
+    # Instantiate every supported instruction once. Forked test workers inherit the
+    # prototypes, so the PyVSC objects are not constructed again for every test.
+    @classmethod
+    def create_instr_prototypes(cls):
+        for instr_name, instr_group in cls.instr_registry.items():
+            if instr_name in rcs.unsupported_instr or instr_name in cls.instr_prototype:
+                continue
+            cls.instr_prototype[instr_name] = cls.create_instr(instr_name, instr_group)
+
     # Create the list of instructions based on the supported ISA extensions and configuration
     # of the generator
     @classmethod
@@ -140,10 +193,14 @@ class riscv_instr:
         cls.instr_names.clear()
         cls.instr_group.clear()
         cls.instr_category.clear()
-        for instr_name, instr_group in cls.instr_registry.items():
+        cls.instr_select_index.clear()
+        cls.create_instr_prototypes()
+        for instr_name in cls.instr_registry:
             if instr_name in rcs.unsupported_instr:
                 continue
-            instr_inst = cls.create_instr(instr_name, instr_group)
+            # A fresh copy per test, so that nothing a previous test left in the
+            # templates leaks into the next one
+            instr_inst = cls.instr_prototype[instr_name].clone()
             cls.instr_template[instr_name] = instr_inst
 
             if not instr_inst.is_supported(cfg):
@@ -170,6 +227,8 @@ class riscv_instr:
                 cls.instr_names.append(instr_name)
         cls.build_basic_instruction_list(cfg)
         cls.create_csr_filter(cfg)
+        # Unfiltered selection, used by most of the directed streams
+        cls.get_instr_candidates()
 
     @classmethod
     def create_instr(cls, instr_name, instr_group):
@@ -221,62 +280,100 @@ class riscv_instr:
             else:                                               # User Mode
                 cls.include_reg.append("USCRATCH")
 
+    # Return the instructions get_rand_instr picks from for the given filters. The result is
+    # resolved once per distinct filter and cached until the next create_instr_list call.
     @classmethod
-    def get_rand_instr(cls, include_instr=[], exclude_instr=[],
-                       include_category=[], exclude_category=[],
-                       include_group=[], exclude_group=[]):
-        idx = BitArray(uint = 0, length = 32)
-        name = ""
+    def get_instr_candidates(cls, include_instr=[], exclude_instr=[],
+                             include_category=[], exclude_category=[],
+                             include_group=[], exclude_group=[]):
+        key = (cls.filter_key(include_instr, True), cls.filter_key(exclude_instr, True),
+               cls.filter_key(include_category), cls.filter_key(exclude_category),
+               cls.filter_key(include_group), cls.filter_key(exclude_group))
+        candidates = cls.instr_select_index.get(key)
+        if candidates is not None:
+            return candidates
+        include_instr, exclude_instr = key[0], key[1]
         allowed_instr = []
         disallowed_instr = []
-        # allowed_categories = []
-        for items in include_category:
+        for items in key[2]:
             allowed_instr.extend(cls.instr_category[items])
-        for items in exclude_category:
+        for items in key[3]:
             if items in cls.instr_category:
                 disallowed_instr.extend(cls.instr_category[items])
-        for items in include_group:
+        for items in key[4]:
             allowed_instr.extend(cls.instr_group[items])
-        for items in exclude_group:
+        for items in key[5]:
             if items in cls.instr_group:
                 disallowed_instr.extend(cls.instr_group[items])
-
         disallowed_instr.extend(exclude_instr)
 
-        # TODO Randomization logic needs to be frame with PyVSC library
         if len(disallowed_instr) == 0:
-            try:
-                if len(include_instr) > 0:
-                    if len(include_instr) == 1:
-                        idx = 0
-                    else:
-                        idx = random.randrange(0, len(include_instr) - 1)
-                    name = include_instr[idx]
-                elif len(allowed_instr) > 0:
-                    idx = random.randrange(0, len(allowed_instr) - 1)
-                    name = allowed_instr[idx]
-                else:
-                    idx = random.randrange(0, len(cls.instr_names) - 1)
-                    name = cls.instr_names[idx]
-            except Exception:
-                logging.critical("[%s] Cannot generate random instruction", riscv_instr.__name__)
-                sys.exit(1)
+            if len(include_instr) > 0:
+                candidates = include_instr
+            elif len(allowed_instr) > 0:
+                candidates = tuple(allowed_instr)
+            else:
+                candidates = tuple(cls.instr_names)
         else:
-            try:
-                name = random.choice(cls.instr_names)
-                if len(include_instr) > 0:
-                    name = random.choice(include_instr)
-                if len(allowed_instr) > 0:
-                    name = random.choice(allowed_instr)
-            except Exception:
-                logging.critical("[%s] Cannot generate random instruction", riscv_instr.__name__)
-                sys.exit(1)
+            # Same as the SV generator: the name has to be a supported instruction inside
+            # every non-empty include list and outside the disallowed list
+            disallowed_instr = set(disallowed_instr)
+            include_instr = set(include_instr)
+            allowed_instr = set(allowed_instr)
+            candidates = tuple(name for name in cls.instr_names
+                               if name not in disallowed_instr and
+                               (len(include_instr) == 0 or name in include_instr) and
+                               (len(allowed_instr) == 0 or name in allowed_instr))
+        cls.instr_select_index[key] = candidates
+        return candidates
+
+    @staticmethod
+    def filter_key(items, is_instr=False):
+        # Instruction names are passed both as riscv_instr_name_t and as strings, and some
+        # callers nest lists of names; flatten them into a hashable tuple of enum values.
+        key = []
+        for item in items:
+            if isinstance(item, (list, tuple)):
+                key.extend(riscv_instr.filter_key(item, is_instr))
+            elif is_instr and isinstance(item, str):
+                key.append(riscv_instr_name_t[item])
+            elif not is_instr and not isinstance(item, str):
+                key.append(item.name)
+            else:
+                key.append(item)
+        return tuple(key)
+
+    @classmethod
+    def get_rand_instr(cls, include_instr=[], exclude_instr=[],
+                       include_category=[], exclude_category=[],
+                       include_group=[], exclude_group=[]):
+        candidates = cls.get_instr_candidates(include_instr, exclude_instr,
+                                              include_category, exclude_category,
+                                              include_group, exclude_group)
+        if len(candidates) == 0:
+            logging.critical("[%s] Cannot generate random instruction", riscv_instr.__name__)
+            sys.exit(1)
+        name = random.choice(candidates)
         # rs1 rs2 values are overwriting and the last generated values are
         # getting assigned for a particular instruction hence creating different
         # object address and id to ratain the randomly generated values.
-        instr_h = copy.deepcopy(cls.instr_template[name])
+        instr_h = cls.instr_template[name].clone()
         return instr_h
 
+    # Same as n get_rand_instr calls with identical filters, resolving the filters only once
+    @classmethod
+    def get_rand_instr_batch(cls, n, include_instr=[], exclude_instr=[],
+                             include_category=[], exclude_category=[],
+                             include_group=[], exclude_group=[]):
+        candidates = cls.get_instr_candidates(include_instr, exclude_instr,
+                                              include_category, exclude_category,
+                                              include_group, exclude_group)
+        if len(candidates) == 0:
+            logging.critical("[%s] Cannot generate random instruction", riscv_instr.__name__)
+            sys.exit(1)
+        return [cls.instr_template[name].clone()
+                for name in random.choices(candidates, k=n)]
+
     @classmethod
     def get_load_store_instr(cls, load_store_instr):
         instr_h = riscv_instr()
@@ -323,6 +420,69 @@ class riscv_instr:
             if self.category != riscv_instr_category_t.CSR:
                 self.csr.rand_mode = False
 
+    # Instructions without extra rand fields whose constraints are all covered by
+    # get_legal_gpr and get_rand_imm can skip the solver under --fast_gpr_randomization
+    def can_fast_randomize(self):
+        cls = self.__class__
+        support = riscv_instr.fast_rand_support.get(cls)
+        if support is None:
+            constraints = set(k for c in cls.__mro__ for k, v in vars(c).items()
+                              if isinstance(v, (constraint_t, dynamic_constraint_t)))
+            rand_fields = set(k for k, v in self.__dict__.items()
+                              if isinstance(v, type_base) and v._int_field_info.is_rand)
+            support = (constraints <= set(cls.fast_rand_constraints) and
+                       rand_fields <= set(["rs1", "rs2", "rd", "imm", "csr"]))
+            riscv_instr.fast_rand_support[cls] = support
+        return support
+
+    # Legal rs1, rs2 and rd values under the constraints of the instruction itself
+    def get_legal_gpr(self):
+        return (self.all_gpr, self.all_gpr, self.all_gpr)
+
+    # Random imm value satisfying imm_c
+    def get_rand_imm(self):
+        imm = random.getrandbits(32)
+        if self.instr_name in [riscv_instr_name_t.SLLIW, riscv_instr_name_t.SRLIW,
+                               riscv_instr_name_t.SRAIW]:
+            imm &= ~(0x7f << 5)
+        elif self.instr_name in [riscv_instr_name_t.SLLI, riscv_instr_name_t.SRLI,
+                                 riscv_instr_name_t.SRAI]:
+            if self.XLEN == 32:
+                imm &= ~(0x7f << 5)
+            else:
+                imm &= ~(0x3f << 6)
+        return imm
+
+    # Randomize the operands by drawing them from the legal register tables instead of
+    # calling the solver. When avail_regs is not empty every GPR operand is picked from it,
+    # rd (and rs1 of CB format instructions) never takes a reserved_rd register.
+    # Returns 0 without touching the instruction if an operand has no legal value left.
+    def fast_randomize(self, avail_regs = [], reserved_rd = []):
+        rs1_regs, rs2_regs, rd_regs = self.get_legal_gpr()
+        if len(avail_regs) > 0:
+            rs1_regs = [reg for reg in rs1_regs if reg in avail_regs]
+            rs2_regs = [reg for reg in rs2_regs if reg in avail_regs]
+            rd_regs = [reg for reg in rd_regs if reg in avail_regs]
+        if len(reserved_rd) > 0:
+            rd_regs = [reg for reg in rd_regs if reg not in reserved_rd]
+            if self.format == riscv_instr_format_t.CB_FORMAT:
+                rs1_regs = [reg for reg in rs1_regs if reg not in reserved_rd]
+        if ((self.has_rs1 and len(rs1_regs) == 0) or (self.has_rs2 and len(rs2_regs) == 0) or
+                (self.has_rd and len(rd_regs) == 0)):
+            return 0
+        if self.has_rs1:
+            self.rs1 = random.choice(rs1_regs)
+        if self.has_rs2:
+            self.rs2 = random.choice(rs2_regs)
+        if self.has_rd:
+            self.rd = random.choice(rd_regs)
+        if self.has_imm:
+            self.imm = self.get_rand_imm()
+        if self.category == riscv_instr_category_t.CSR:
+            self.csr = random.getrandbits(12)
+        self.post_randomize()
+        return 1
+
     def set_imm_len(self):
         if self.format.name in ["U_FORMAT", "J_FORMAT"]:
             self.imm_len = 20
@@ -369,7 +529,7 @@ class riscv_instr:
                     asm_str = '{} {}, {} ({})'.format(
                         asm_str, self.rd.name, self.get_imm(), self.rs1.name)
                 elif self.category == riscv_instr_category_t.CSR:
-                    asm_str = '{} {}, 0x{}, {}'.format(
+                    asm_str = '{} {}, 0x{:x}, {}'.format(
                         asm_str, self.rd.name, self.csr, self.get_imm())
                 else:
                     asm_str = '{} {}, {}, {}'.format(
@@ -392,7 +552,7 @@ class riscv_instr:
 
             elif self.format == riscv_instr_format_t.R_FORMAT:
                 if self.category == riscv_instr_category_t.CSR:
-                    asm_str = '{} {}, 0x{}, {}'.format(
+                    asm_str = '{} {}, 0x{:x}, {}'.format(
                         asm_str, self.rd.name, self.csr, self.rs1.name)
                 elif self.instr_name == riscv_instr_name_t.SFENCE_VMA:
                     asm_str = "sfence.vma x0, x0"
@@ -412,105 +572,164 @@ class riscv_instr:
         return asm_str.lower()
 
     def get_opcode(self):
-        if self.instr_name == "LUI":
+        name = self.instr_name.name
+        if name == "LUI":
             return (BitArray(uint = 55, length = 7).bin)
-        elif self.instr_name == "AUIPC":
+        elif name == "AUIPC":
             return (BitArray(uint = 23, length = 7).bin)
-        elif self.instr_name == "JAL":
-            return (BitArray(uint = 23, length = 7).bin)
-        elif self.instr_name == "JALR":
+        elif name == "JAL":
             return (BitArray(uint = 111, length = 7).bin)
-        elif self.instr_name in ["BEQ", "BNE", "BLT", "BGE", "BLTU", "BGEU"]:
+        elif name == "JALR":
             return (BitArray(uint = 103, length = 7).bin)
-        elif self.instr_name in ["LB", "LH", "LW", "LBU", "LHU", "LWU", "LD"]:
+        elif name in ["BEQ", "BNE", "BLT", "BGE", "BLTU", "BGEU"]:
             return (BitArray(uint = 99, length = 7).bin)
-        elif self.instr_name in ["SB", "SH", "SW", "SD"]:
+        elif name in ["LB", "LH", "LW", "LBU", "LHU", "LWU", "LD"]:
+            return (BitArray(uint = 3, length = 7).bin)
+        elif name in ["SB", "SH", "SW", "SD"]:
             return (BitArray(uint = 35, length = 7).bin)
-        elif self.instr_name in ["ADDI", "SLTI", "SLTIU", "XORI", "ORI", "ANDI",
-                                 "SLLI", "SRLI", "SRAI", "NOP"]:
+        elif name in ["ADDI", "SLTI", "SLTIU", "XORI", "ORI", "ANDI",
+                      "SLLI", "SRLI", "SRAI", "NOP"]:
             return (BitArray(uint = 19, length = 7).bin)
-        elif self.instr_name in ["ADD", "SUB", "SLL", "SLT", "SLTU", "XOR", "SRL",
-                                 "SRA", "OR", "AND", "MUL", "MULH", "MULHSU", "MULHU",
-                                 "DIV", "DIVU", "REM", "REMU"]:
+        elif name in ["ADD", "SUB", "SLL", "SLT", "SLTU", "XOR", "SRL",
+                      "SRA", "OR", "AND", "MUL", "MULH", "MULHSU", "MULHU",
+                      "DIV", "DIVU", "REM", "REMU"]:
             return (BitArray(uint = 51, length = 7).bin)
-        elif self.instr_name in ["ADDIW", "SLLIW", "SRLIW", "SRAIW"]:
+        elif name in ["ADDIW", "SLLIW", "SRLIW", "SRAIW"]:
             return (BitArray(uint = 27, length = 7).bin)
-        elif self.instr_name in ["MULH", "MULHSU", "MULHU", "DIV", "DIVU", "REM", "REMU"]:
-            return (BitArray(uint = 51, length = 7).bin)
-        elif self.instr_name in ["FENCE", "FENCE_I"]:
+        elif name in ["FENCE", "FENCE_I"]:
             return (BitArray(uint = 15, length = 7).bin)
-        elif self.instr_name in ["ECALL", "EBREAK", "CSRRW", "CSRRS", "CSRRC", "CSRRWI",
-                                 "CSRRSI", "CSRRCI"]:
+        elif name in ["ECALL", "EBREAK", "CSRRW", "CSRRS", "CSRRC", "CSRRWI",
+                      "CSRRSI", "CSRRCI"]:
             return (BitArray(uint = 115, length = 7).bin)
-        elif self.instr_name in ["ADDW", "SUBW", "SLLW", "SRLW", "SRAW", "MULW", "DIVW",
-                                 "DIVUW", "REMW", "REMUW"]:
+        elif name in ["ADDW", "SUBW", "SLLW", "SRLW", "SRAW", "MULW", "DIVW",
+                      "DIVUW", "REMW", "REMUW"]:
             return (BitArray(uint = 59, length = 7).bin)
-        elif self.instr_name in ["ECALL", "EBREAK", "URET", "SRET", "MRET", "DRET", "WFI",
-                                 "SFENCE_VMA"]:
+        elif name in ["URET", "SRET", "MRET", "DRET", "WFI", "SFENCE_VMA"]:
             return (BitArray(uint = 115, length = 7).bin)
         else:
-            logging.critical("Unsupported instruction %0s", self.instr_name)
+            logging.critical("Unsupported instruction %0s", name)
             sys.exit(1)
 
     def get_func3(self):
-        if self.instr_name in ["JALR", "BEQ", "LB", "SB", "ADDI", "NOP", "ADD", "SUB",
-                               "FENCE", "ECALL", "EBREAK", "ADDIW", "ADDW", "SUBW", "MUL",
-                               "MULW", "ECALL", "EBREAK", "URET", "SRET", "MRET", "DRET",
-                               "WFI", "SFENCE_VMA"]:
+        name = self.instr_name.name
+        if name in ["JALR", "BEQ", "LB", "SB", "ADDI", "NOP", "ADD", "SUB",
+                    "FENCE", "ECALL", "EBREAK", "ADDIW", "ADDW", "SUBW", "MUL",
+                    "MULW", "URET", "SRET", "MRET", "DRET", "WFI", "SFENCE_VMA"]:
             return (BitArray(uint = 0, length = 3).bin)
-        elif self.instr_name in ["BNE", "LH", "SH", "SLLI", "SLL", "FENCE_I", "CSRRW", "SLLIW",
-                                 "SLLW", "MULH"]:
+        elif name in ["BNE", "LH", "SH", "SLLI", "SLL", "FENCE_I", "CSRRW", "SLLIW",
+                      "SLLW", "MULH"]:
             return (BitArray(uint = 1, length = 3).bin)
-        elif self.instr_name in ["LW", "SW", "SLTI", "SLT", "CSRRS", "MULHS"]:
+        elif name in ["LW", "SW", "SLTI", "SLT", "CSRRS", "MULHSU"]:
             return (BitArray(uint = 2, length = 3).bin)
-        elif self.instr_name in ["SLTIU", "SLTU", "CSRRC", "LD", "SD", "MULHU"]:
+        elif name in ["SLTIU", "SLTU", "CSRRC", "LD", "SD", "MULHU"]:
             return (BitArray(uint = 3, length = 3).bin)
-        elif self.instr_name in ["BLT", "LBU", "XORI", "XOR", "DIV", "DIVW"]:
+        elif name in ["BLT", "LBU", "XORI", "XOR", "DIV", "DIVW"]:
             return (BitArray(uint = 4, length = 3).bin)
-        elif self.instr_name in ["BGE", "LHU", "SRLI", "SRAI", "SRL", "SRA", "CSRRWI", "SRLIW",
-                                 "SRAIW", "SRLW",
-                                 "SRAW", "DIVU", "DIVUW"]:
+        elif name in ["BGE", "LHU", "SRLI", "SRAI", "SRL", "SRA", "CSRRWI", "SRLIW",
+                      "SRAIW", "SRLW", "SRAW", "DIVU", "DIVUW"]:
             return (BitArray(uint = 5, length = 3).bin)
-        elif self.instr_name in ["BLTU", "ORI", "OR", "CSRRSI", "LWU", "REM", "REMW"]:
+        elif name in ["BLTU", "ORI", "OR", "CSRRSI", "LWU", "REM", "REMW"]:
             return (BitArray(uint = 6, length = 3).bin)
-        elif self.instr_name in ["BGEU", "ANDI", "AND", "CSRRCI", "REMU", "REMUW"]:
+        elif name in ["BGEU", "ANDI", "AND", "CSRRCI", "REMU", "REMUW"]:
             return (BitArray(uint = 7, length = 3).bin)
         else:
-            logging.critical("Unsupported instruction %0s", self.instr_name)
+            logging.critical("Unsupported instruction %0s", name)
             sys.exit(1)
 
     def get_func7(self):
-        if self.instr_name in ["SLLI", "SRLI", "ADD", "SLL", "SLT", "SLTU", "XOR",
-                               "SRL", "OR", "AND", "FENCE", "FENCE_I", "SLLIW",
-                               "SRLIW", "ADDW", "SLLW", "SRLW", "ECALL", "EBREAK", "URET"]:
+        name = self.instr_name.name
+        if name in ["SLLI", "SRLI", "ADD", "SLL", "SLT", "SLTU", "XOR",
+                    "SRL", "OR", "AND", "FENCE", "FENCE_I", "SLLIW",
+                    "SRLIW", "ADDW", "SLLW", "SRLW", "ECALL", "EBREAK", "URET"]:
             return (BitArray(uint = 0, length = 7).bin)
-        elif self.instr_name in ["SUB", "SRA", "SRAIW", "SUBW", "SRAW"]:
+        elif name in ["SUB", "SRA", "SRAI", "SRAIW", "SUBW", "SRAW"]:
             return (BitArray(uint = 32, length = 7).bin)
-        elif self.instr_name in ["MUL", "MULH", "MULHSU", "MULHU", "DIV", "DIVU", "REM",
-                                 "REMU", "MULW", "DIVW", "DIVUW", "REMW", "REMUW"]:
+        elif name in ["MUL", "MULH", "MULHSU", "MULHU", "DIV", "DIVU", "REM",
+                      "REMU", "MULW", "DIVW", "DIVUW", "REMW", "REMUW"]:
             return (BitArray(uint = 1, length = 7).bin)
-        elif self.instr_name in ["SRET", "WFI"]:
+        elif name in ["SRET", "WFI"]:
             return (BitArray(uint = 8, length = 7).bin)
-        elif self.instr_name == "MRET":
+        elif name == "MRET":
             return (BitArray(uint = 24, length = 7).bin)
-        elif self.instr_name == "DRET":
+        elif name == "DRET":
             return (BitArray(uint = 61, length = 7).bin)
-        elif self.instr_name == "SFENCE_VMA":
+        elif name == "SFENCE_VMA":
             return (BitArray(uint = 9, length = 7).bin)
         else:
-            logging.critical("Unsupported instruction %0s", self.instr_name)
+            logging.critical("Unsupported instruction %0s", name)
             sys.exit(1)
 
-    def convert2bin(self):
-        pass  # TODO
+    # Convert the instruction to its machine code as a hex string. The operand fields are
+    # interpreted the same way convert2asm prints them, e.g. the imm of LUI/AUIPC is the
+    # 20-bit upper immediate and the imm of branches and jumps is the byte offset.
+    def convert2bin(self, prefix = ""):
+        name = self.instr_name.name
+        rs1 = self.rs1.value
+        rs2 = self.rs2.value
+        rd = self.rd.value
+        imm = self.imm
+        if self.format == riscv_instr_format_t.J_FORMAT:
+            binary = (((imm >> 20) & 0x1) << 31 | ((imm >> 1) & 0x3ff) << 21 |
+                      ((imm >> 11) & 0x1) << 20 | ((imm >> 12) & 0xff) << 12 |
+                      rd << 7 | int(self.get_opcode(), 2))
+        elif self.format == riscv_instr_format_t.U_FORMAT:
+            binary = (imm & 0xfffff) << 12 | rd << 7 | int(self.get_opcode(), 2)
+        elif self.format == riscv_instr_format_t.I_FORMAT:
+            if name == "FENCE":
+                # fence iorw, iorw
+                binary = 0x0ff0000f
+            elif name == "FENCE_I":
+                binary = 0x0000100f
+            elif self.category == riscv_instr_category_t.CSR:
+                binary = (self.csr << 20 | (imm & 0x1f) << 15 |
+                          int(self.get_func3(), 2) << 12 | rd << 7 | int(self.get_opcode(), 2))
+            elif name in ["ECALL", "EBREAK", "URET", "SRET", "MRET", "DRET", "WFI"]:
+                func12 = {"ECALL": 0b00000, "EBREAK": 0b00001, "URET": 0b00010,
+                          "SRET": 0b00010, "MRET": 0b00010, "DRET": 0b10010,
+                          "WFI": 0b00101}[name]
+                binary = (int(self.get_func7(), 2) << 25 | func12 << 20 |
+                          int(self.get_opcode(), 2))
+            elif name in ["SLLI", "SRLI", "SRAI", "SLLIW", "SRLIW", "SRAIW"]:
+                shamt_mask = 0x3f if (self.XLEN != 32 and not name.endswith("W")) else 0x1f
+                binary = (int(self.get_func7(), 2) << 25 | (imm & shamt_mask) << 20 |
+                          rs1 << 15 | int(self.get_func3(), 2) << 12 | rd << 7 |
+                          int(self.get_opcode(), 2))
+            elif name == "NOP":
+                binary = int(self.get_opcode(), 2)
+            else:
+                binary = ((imm & 0xfff) << 20 | rs1 << 15 | int(self.get_func3(), 2) << 12 |
+                          rd << 7 | int(self.get_opcode(), 2))
+        elif self.format == riscv_instr_format_t.S_FORMAT:
+            binary = (((imm >> 5) & 0x7f) << 25 | rs2 << 20 | rs1 << 15 |
+                      int(self.get_func3(), 2) << 12 | (imm & 0x1f) << 7 |
+                      int(self.get_opcode(), 2))
+        elif self.format == riscv_instr_format_t.B_FORMAT:
+            binary = (((imm >> 12) & 0x1) << 31 | ((imm >> 5) & 0x3f) << 25 | rs2 << 20 |
+                      rs1 << 15 | int(self.get_func3(), 2) << 12 | ((imm >> 1) & 0xf) << 8 |
+                      ((imm >> 11) & 0x1) << 7 | int(self.get_opcode(), 2))
+        elif self.format == riscv_instr_format_t.R_FORMAT:
+            if self.category == riscv_instr_category_t.CSR:
+                binary = (self.csr << 20 | rs1 << 15 | int(self.get_func3(), 2) << 12 |
+                          rd << 7 | int(self.get_opcode(), 2))
+            elif name == "SFENCE_VMA":
+                # Always printed as "sfence.vma x0, x0"
+                binary = int(self.get_func7(), 2) << 25 | int(self.get_opcode(), 2)
+            else:
+                binary = (int(self.get_func7(), 2) << 25 | rs2 << 20 | rs1 << 15 |
+                          int(self.get_func3(), 2) << 12 | rd << 7 | int(self.get_opcode(), 2))
+        else:
+            logging.critical("Unsupported format %0s", self.format.name)
+            sys.exit(1)
+        return prefix + "{:08x}".format(binary)
 
     def get_instr_name(self):
         get_instr_name = self.instr_name.name
         get_instr_name = get_instr_name.replace("_", ".")
         return get_instr_name
 
+    # Index of a register in the three-bit rs1', rs2' and rd' fields of compressed instructions
     def get_c_gpr(self, gpr):
-        return self.gpr
+        return gpr & 0x7
 
     def get_imm(self):
         return self.imm_str
@@ -519,8 +738,15 @@ class riscv_instr:
         if(self.has_label and not(self.is_branch_target) and self.is_local_numeric_label):
             self.has_label = 0
 
-    def do_copy(self):
-        pass  # TODO
+    # Copy the instruction attributes and operands of rhs into this instruction
+    def do_copy(self, rhs):
+        for attr in ["group", "format", "category", "instr_name", "imm_type", "imm_len",
+                     "csr", "rs2", "rs1", "rd", "imm", "imm_mask", "imm_str", "is_compressed",
+                     "has_rs2", "has_rs1", "has_rd", "has_imm", "is_illegal_instr",
+                     "is_hint_instr", "is_floating_point", "comment", "label",
+                     "is_local_numeric_label", "is_branch_target", "has_label", "atomic",
+                     "branch_assigned", "process_load_store"]:
+            setattr(self, attr, getattr(rhs, attr))
 
     def update_imm_str(self):
         self.imm_str = str(self.uintToInt(self.imm))
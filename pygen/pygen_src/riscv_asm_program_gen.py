@@ -11,6 +11,7 @@ distributed under the License is distributed on an "AS IS" BASIS,
 WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 """
 
+import os
 import logging
 import random
 import copy
@@ -27,6 +28,7 @@ from pygen_src.riscv_signature_pkg import (signature_type_t, core_status_t,
                                            test_result_t)
 from pygen_src.riscv_instr_gen_config import cfg
 from pygen_src.riscv_data_page_gen import riscv_data_page_gen
+from pygen_src.riscv_binary_gen import riscv_binary_gen
 from pygen_src.riscv_privileged_common_seq import riscv_privileged_common_seq
 from pygen_src.riscv_utils import factory
 rcs = import_module("pygen_src.target." + cfg.argv.target + ".riscv_core_setting")
@@ -45,7 +47,11 @@ rcs = import_module("pygen_src.target." + cfg.argv.target + ".riscv_core_setting
 class riscv_asm_program_gen:
 
     def __init__(self):
+        # Lines of the section being generated, written to asm_file as soon as the
+        # section is done when the test file is opened before gen_program()
         self.instr_stream = []
+        self.asm_file = None
+        self.test_name = None
         # Directed instruction ratio, occurance per 1000 instructions
         self.directed_instr_stream_ratio = {}
         self.hart = 0
@@ -133,6 +139,8 @@ class riscv_asm_program_gen:
             # Shuffle the sub programs and insert to the instruction stream
             self.insert_sub_program(self.sub_program[hart], self.instr_stream)
             logging.info("Main/sub program generation...done")
+            self.main_program[hart].instr_string_list.clear()
+            self.flush_instr_stream()
             # program end
             self.gen_program_end(hart)
             if not cfg.bare_program_mode:
@@ -140,6 +148,7 @@ class riscv_asm_program_gen:
                 if rcs.support_debug_mode:
                     self.gen_debug_rom(hart)
                 self.gen_section(pkg_ins.hart_prefix(hart) + "instr_end", ["nop"])
+            self.flush_instr_stream()
         for hart in range(cfg.num_of_harts):
             # Starting point of data section
             self.gen_data_page_begin(hart)
@@ -156,6 +165,7 @@ class riscv_asm_program_gen:
                 self.gen_kernel_sections(hart)
                 # Page table
                 self.gen_page_table_section(hart)
+            self.flush_instr_stream()
 
     # ----------------------------------------------------------------------------------
     # Generate kernel program/data/stack sections
@@ -255,6 +265,7 @@ class riscv_asm_program_gen:
                 self.sub_program[i].post_process_instr()
                 self.sub_program[i].generate_instr_stream()
                 instr_list.extend((self.sub_program[i].instr_string_list))
+                self.sub_program[i].instr_string_list.clear()
 
     # ----------------------------------------------------------------------------------
     # Major sections - init, stack, data, test_done etc.
@@ -289,8 +300,15 @@ class riscv_asm_program_gen:
 
     def gen_data_page(self, hart, is_kernel = 0, amo = 0):
         self.data_page_gen = riscv_data_page_gen()
-        self.data_page_gen.gen_data_page(hart, cfg.data_page_pattern, is_kernel, amo)
+        # The data files are named after the test, known once the test file is opened
+        data_file_prefix = None
+        if cfg.data_page_incbin and self.test_name is not None:
+            data_file_prefix = os.path.splitext(self.test_name)[0]
+        self.data_page_gen.gen_data_page(hart, cfg.data_page_pattern, is_kernel, amo,
+                                         data_file_prefix)
         self.instr_stream.extend(self.data_page_gen.data_page_str)
+        self.data_page_gen.data_page_str.clear()
+        self.flush_instr_stream()
 
     def gen_stack_section(self, hart):
         hart_prefix_string = pkg_ins.hart_prefix(hart)
@@ -1072,14 +1090,41 @@ class riscv_asm_program_gen:
         # TODO
         pass
 
+    # Open the test file before gen_program(), so that every section is written out as
+    # soon as it is generated instead of keeping the whole program in memory. The
+    # program is written to <test_name>.tmp and renamed by gen_test_file once it is
+    # complete, a failed generation doesn't leave a truncated or stale test behind
+    def open_test_file(self, test_name):
+        self.test_name = test_name
+        if os.path.exists(test_name):
+            os.remove(test_name)
+        self.asm_file = open(test_name + ".tmp", "w", buffering = 1 << 20)
+
+    # Write the lines of the finished sections to the test file, if it is open
+    def flush_instr_stream(self):
+        if self.asm_file is None:
+            return
+        if self.instr_stream:
+            self.asm_file.write("\n".join(self.instr_stream))
+            self.asm_file.write("\n")
+        self.instr_stream.clear()
+
     # Write the generated program to a file
     def gen_test_file(self, test_name):
-        file = open(test_name, "w+")
-        for items in self.instr_stream:
-            file.write("{}\n".format(items))
-
-        file.close()
+        if self.asm_file is None:
+            self.open_test_file(test_name)
+        self.flush_instr_stream()
+        self.asm_file.close()
+        os.replace(self.asm_file.name, test_name)
+        self.asm_file = None
         logging.info("{} is generated".format(test_name))
+        if cfg.direct_binary:
+            binary_gen = riscv_binary_gen()
+            with open(test_name, "r") as asm_file:
+                binary_gen.assemble(asm_file, os.path.dirname(test_name))
+            test_prefix = os.path.splitext(test_name)[0]
+            binary_gen.write_elf("{}.o".format(test_prefix))
+            binary_gen.write_bin("{}.bin".format(test_prefix))
 
     # Helper function to generate the proper sequence of handshake instructions
     # to signal the testbench (see riscv_signature_pkg.sv)
@@ -0,0 +1,1316 @@
+"""
+Copyright 2020 Google LLC
+Copyright 2020 PerfectVIPs Inc.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+"""
+
+import os
+import re
+import struct
+import logging
+from importlib import import_module
+from collections import defaultdict
+from pygen_src.riscv_instr_gen_config import cfg
+from pygen_src.riscv_instr_pkg import (riscv_instr_name_t, riscv_instr_group_t,
+                                       riscv_instr_format_t, riscv_instr_category_t,
+                                       riscv_reg_t, riscv_fpr_t, privileged_reg_t)
+from pygen_src.isa.riscv_instr import riscv_instr
+rcs = import_module("pygen_src.target." + cfg.argv.target + ".riscv_core_setting")
+
+
+# Linker script and include directory run.py hands to GCC
+RISCV_DV_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                              "..", ".."))
+LINK_SCRIPT = os.path.join(RISCV_DV_ROOT, "scripts", "link.ld")
+INCLUDE_DIRS = [os.path.join(RISCV_DV_ROOT, "user_extension")]
+
+GPR_INDEX = {reg.name.lower(): reg.value for reg in riscv_reg_t}
+GPR_INDEX.update({"x{}".format(i): i for i in range(32)})
+GPR_INDEX["fp"] = riscv_reg_t.S0.value
+FPR_INDEX = {reg.name.lower(): reg.value for reg in riscv_fpr_t}
+FPR_INDEX.update({"f{}".format(i): i for i in range(32)})
+
+COMPRESSED_GROUPS = [riscv_instr_group_t.RV32C, riscv_instr_group_t.RV64C,
+                     riscv_instr_group_t.RV32FC, riscv_instr_group_t.RV32DC,
+                     riscv_instr_group_t.RV128C]
+FP_GROUPS = [riscv_instr_group_t.RV32F, riscv_instr_group_t.RV64F,
+             riscv_instr_group_t.RV32D, riscv_instr_group_t.RV64D]
+AMO_GROUPS = [riscv_instr_group_t.RV32A, riscv_instr_group_t.RV64A]
+B_GROUPS = [riscv_instr_group_t.RV32B, riscv_instr_group_t.RV64B]
+
+# Floating point instructions with an integer destination or an integer source
+FP_TO_INT_INSTR = ["FMV_X_W", "FMV_X_D", "FCVT_W_S", "FCVT_WU_S", "FCVT_L_S", "FCVT_LU_S",
+                   "FCVT_L_D", "FCVT_LU_D", "FCVT_W_D", "FCVT_WU_D"]
+FP_FROM_INT_INSTR = ["FMV_W_X", "FMV_D_X", "FCVT_S_W", "FCVT_S_WU", "FCVT_S_L", "FCVT_D_L",
+                     "FCVT_S_LU", "FCVT_D_W", "FCVT_D_LU", "FCVT_D_WU"]
+
+INVERSE_BRANCH = {"BEQ": "BNE", "BNE": "BEQ", "BLT": "BGE", "BGE": "BLT",
+                  "BLTU": "BGEU", "BGEU": "BLTU"}
+
+# Instructions only encodable as compressed instructions on RV32
+RV32_ONLY_COMPRESSED = ["C_JAL", "C_FLW", "C_FSW", "C_FLWSP", "C_FSWSP"]
+
+NOP_BIN = 0x00000013
+C_NOP_BIN = 0x0001
+
+# ELF constants
+EM_RISCV = 243
+ET_EXEC = 2
+PT_LOAD = 1
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_NOBITS = 8
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHN_ABS = 0xfff1
+STB_LOCAL = 0
+STB_GLOBAL = 1
+EF_RISCV_RVC = 0x1
+
+
+def is_c_gpr(reg):
+    return 8 <= reg <= 15
+
+
+def is_simm(value, bits):
+    return -(1 << (bits - 1)) <= value < (1 << (bits - 1))
+
+
+def to_signed(value, bits):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def align_up(value, align):
+    return (value + align - 1) // align * align
+
+
+# ----------------------------------------------------------------------------------
+# Input section of the program image
+# ----------------------------------------------------------------------------------
+class riscv_binary_section:
+    def __init__(self, name, flags):
+        self.name = name
+        self.is_code = "x" in flags
+        self.is_writable = "w" in flags
+        self.nobits = name == ".bss" or name.startswith(".bss.")
+        # Items are ["bytes", data], ["label", name], ["align", bytes, insn_align],
+        # ["data", size, symbol, addend], ["branch", name, fields, symbol, addend, size, rvc]
+        # and ["pcrel", name, fields, hi_reg, symbol, addend]
+        self.items = []
+        self.align = 1
+        self.size = 0
+        self.addr = 0
+        self.data = bytearray()
+
+    def add_bytes(self, data):
+        if self.items and self.items[-1][0] == "bytes":
+            self.items[-1][1].extend(data)
+        else:
+            self.items.append(["bytes", bytearray(data)])
+
+
+# Raised on assembly errors, the generator reports it as a failed test
+class AssemblerError(ValueError):
+    pass
+
+
+# ----------------------------------------------------------------------------------
+# Binary program generator
+# Assembles the generated program without the GCC toolchain and links it following
+# scripts/link.ld. It accepts the GNU assembler subset the generator emits and makes the
+# same choices GCC does with its default -mrelax: instructions are compressed under the same
+# syntax rules as GAS, "li" expands like the GAS load_const macro, branches to labels are
+# relaxed to the shortest form in reach, and code alignment is padded with nops followed by
+# a c.nop like ld leaves them. Orphan sections follow .text or .data like ld places them.
+# ----------------------------------------------------------------------------------
+class riscv_binary_gen:
+    mnemonic_table = {}
+
+    def __init__(self):
+        self.sections = {}
+        self.section = None
+        # Directory of the assembly file, searched for the included files
+        self.asm_dir = "."
+        self.section_stack = []
+        self.rvc = (riscv_instr_group_t.RV32C in rcs.supported_isa and
+                    not cfg.disable_compressed_instr)
+        self.has_rvc = self.rvc
+        self.option_stack = []
+        self.label_section = {}
+        self.label_offset = {}
+        self.global_symbols = []
+        self.numeric_label_cnt = defaultdict(int)
+        self.symbols = {}
+        self.entry = "_start"
+        self.output_sections = []
+        self.instr_cache = {}
+        self.stmt = ""
+        self.pseudo_instr = {
+            "nop": self.gen_nop, "li": self.gen_li, "la": self.gen_la, "lla": self.gen_la,
+            "mv": self.gen_mv, "not": self.gen_not, "neg": self.gen_neg,
+            "negw": self.gen_neg, "sext.w": self.gen_sext_w, "seqz": self.gen_set_zero,
+            "snez": self.gen_set_zero, "sltz": self.gen_set_zero, "sgtz": self.gen_set_zero,
+            "j": self.gen_j, "jal": self.gen_jal, "jr": self.gen_jr, "jalr": self.gen_jalr,
+            "ret": self.gen_ret, "beqz": self.gen_branch_zero, "bnez": self.gen_branch_zero,
+            "blez": self.gen_branch_zero, "bgez": self.gen_branch_zero,
+            "bltz": self.gen_branch_zero, "bgtz": self.gen_branch_zero,
+            "bgt": self.gen_branch_swap, "ble": self.gen_branch_swap,
+            "bgtu": self.gen_branch_swap, "bleu": self.gen_branch_swap,
+            "csrr": self.gen_csr, "csrw": self.gen_csr, "csrs": self.gen_csr,
+            "csrc": self.gen_csr, "csrwi": self.gen_csr, "csrsi": self.gen_csr,
+            "csrci": self.gen_csr, "frcsr": self.gen_fcsr, "fscsr": self.gen_fcsr,
+            "frrm": self.gen_fcsr, "fsrm": self.gen_fcsr, "fsrmi": self.gen_fcsr,
+            "frflags": self.gen_fcsr, "fsflags": self.gen_fcsr, "fsflagsi": self.gen_fcsr,
+            "fmv.s": self.gen_fsgnj, "fmv.d": self.gen_fsgnj, "fneg.s": self.gen_fsgnj,
+            "fneg.d": self.gen_fsgnj, "fabs.s": self.gen_fsgnj, "fabs.d": self.gen_fsgnj,
+            "ebreak": self.gen_ebreak, "sfence.vma": self.gen_sfence_vma}
+        if not riscv_binary_gen.mnemonic_table:
+            riscv_binary_gen.mnemonic_table = self.get_mnemonic_table()
+
+    # Map every assembly mnemonic of the instruction templates to its instruction name, and
+    # the aq/rl bits selected by the suffix of AMO instructions
+    @staticmethod
+    def get_mnemonic_table():
+        table = {}
+        for instr_name, instr in riscv_instr.instr_template.items():
+            if instr.group in AMO_GROUPS:
+                mnemonic = "{}.{}".format(instr_name.name[:-2].lower(),
+                                          "w" if instr.group == riscv_instr_group_t.RV32A
+                                          else "d")
+                for suffix, aq, rl in [("", 0, 0), (".aq", 1, 0), (".rl", 0, 1),
+                                       (".aqrl", 1, 1)]:
+                    table[mnemonic + suffix] = (instr_name.name, {"aq": aq, "rl": rl})
+            else:
+                table[instr_name.name.replace("_", ".").lower()] = (instr_name.name, {})
+        return table
+
+    def error(self, msg):
+        raise AssemblerError("{}: {}".format(msg, self.stmt.strip()))
+
+    # ------------------------------------------------------------------------------
+    # Assembler front end
+    # ------------------------------------------------------------------------------
+
+    # Assemble and link the program, instr_stream holds the lines of the assembly file
+    def assemble(self, instr_stream, asm_dir = "."):
+        self.asm_dir = asm_dir
+        statements = list(self.get_statements(instr_stream, asm_dir))
+        self.process_statements(statements)
+        for section in self.sections.values():
+            self.relax_section(section)
+        self.place_sections()
+        for section in self.sections.values():
+            self.gen_section_data(section)
+
+    # Split the source lines into statements, with comments removed and included files
+    # expanded in place
+    def get_statements(self, lines, asm_dir):
+        for line in lines:
+            for text in line.split("\n"):
+                if '"' not in text and "#" not in text and "/" not in text:
+                    statements = text.split(";")
+                else:
+                    statements = self.split_line(text)
+                for stmt in statements:
+                    stmt = stmt.strip()
+                    if not stmt:
+                        continue
+                    if stmt.startswith(".include"):
+                        yield from self.get_include_statements(stmt, asm_dir)
+                    else:
+                        yield stmt
+
+    # Split a line on ';' outside of strings, dropping '#' and '//' comments
+    @staticmethod
+    def split_line(text):
+        statements = []
+        current = []
+        quoted = False
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == '"':
+                quoted = not quoted
+            elif not quoted:
+                if char == "#" or text.startswith("//", i):
+                    break
+                if char == ";":
+                    statements.append("".join(current))
+                    current = []
+                    i += 1
+                    continue
+            current.append(char)
+            i += 1
+        statements.append("".join(current))
+        return statements
+
+    def get_include_statements(self, stmt, asm_dir):
+        self.stmt = stmt
+        file_name = stmt[len(".include"):].strip().strip('"')
+        for path in [asm_dir] + INCLUDE_DIRS:
+            file_path = os.path.join(path, file_name)
+            if os.path.isfile(file_path):
+                with open(file_path, "r") as f:
+                    lines = f.read().splitlines()
+                return list(self.get_statements(lines, os.path.dirname(file_path)))
+        self.error("Cannot find include file {}".format(file_name))
+
+    def process_statements(self, statements):
+        i = 0
+        while i < len(statements):
+            stmt = statements[i]
+            if stmt.startswith(".rept"):
+                # Collect the body up to the matching .endr
+                depth = 1
+                end = i + 1
+                while end < len(statements):
+                    if statements[end].startswith(".rept"):
+                        depth += 1
+                    elif statements[end].startswith(".endr"):
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    end += 1
+                self.stmt = stmt
+                if end == len(statements):
+                    self.error("Missing .endr")
+                count = self.get_imm(stmt[len(".rept"):].strip())
+                body = statements[i + 1:end]
+                for _ in range(count):
+                    self.process_statements(body)
+                i = end + 1
+                continue
+            self.process_statement(stmt)
+            i += 1
+
+    def process_statement(self, stmt):
+        self.stmt = stmt
+        # Leading labels
+        while True:
+            m = re.match(r"([A-Za-z_.$][\w.$]*|\d+)\s*:", stmt)
+            if m is None:
+                break
+            self.add_label(m.group(1))
+            stmt = stmt[m.end():].strip()
+        if not stmt:
+            return
+        m = re.match(r"(\S+)\s*(.*)", stmt)
+        mnemonic = m.group(1).lower()
+        args = m.group(2).strip()
+        if mnemonic.startswith("."):
+            self.process_directive(mnemonic, args)
+        else:
+            self.process_instr(mnemonic, self.split_operands(args))
+
+    # Operands are comma separated, "imm (reg)" is accepted for "imm(reg)"
+    @staticmethod
+    def split_operands(args):
+        if not args:
+            return []
+        args = re.sub(r"\s+\(", "(", args)
+        ops = []
+        for op in args.split(","):
+            ops.extend(op.split())
+        return ops
+
+    def get_section(self, name, flags = None):
+        if name not in self.sections:
+            if flags is None:
+                flags = "ax" if name == ".text" or name.startswith(".text.") else "aw"
+            self.sections[name] = riscv_binary_section(name, flags)
+        return self.sections[name]
+
+    def get_current_section(self):
+        if self.section is None:
+            self.section = self.get_section(".text")
+        return self.section
+
+    def add_label(self, name):
+        if name.isdigit():
+            label = ".L{}_{}".format(name, self.numeric_label_cnt[name])
+            self.numeric_label_cnt[name] += 1
+            name = label
+        elif name in self.label_section:
+            self.error("Symbol {} is already defined".format(name))
+        section = self.get_current_section()
+        self.label_section[name] = section
+        section.items.append(["label", name])
+
+    def process_directive(self, directive, args):
+        if directive == ".section" or directive == ".pushsection":
+            if directive == ".pushsection":
+                self.section_stack.append(self.section)
+            parts = [part.strip() for part in args.split(",")]
+            flags = parts[1].strip('"') if len(parts) > 1 else None
+            self.section = self.get_section(parts[0], flags)
+        elif directive == ".popsection":
+            if not self.section_stack:
+                self.error(".popsection without .pushsection")
+            self.section = self.section_stack.pop()
+        elif directive in [".text", ".data", ".bss"]:
+            self.section = self.get_section(directive)
+        elif directive in [".align", ".p2align", ".balign"]:
+            value = self.get_imm(args.split(",")[0])
+            align = value if directive == ".balign" else 1 << value
+            section = self.get_current_section()
+            section.align = max(section.align, align)
+            section.items.append(["align", align, 2 if self.rvc else 4])
+        elif directive in [".globl", ".global"]:
+            for name in args.split(","):
+                self.global_symbols.append(name.strip())
+        elif directive == ".option":
+            if args == "rvc":
+                self.rvc = True
+                self.has_rvc = True
+            elif args == "norvc":
+                self.rvc = False
+            elif args == "push":
+                self.option_stack.append(self.rvc)
+            elif args == "pop":
+                if not self.option_stack:
+                    self.error(".option pop without .option push")
+                self.rvc = self.option_stack.pop()
+        elif directive in [".byte", ".2byte", ".half", ".short", ".4byte", ".word", ".long",
+                           ".8byte", ".dword", ".quad"]:
+            size = {".byte": 1, ".2byte": 2, ".half": 2, ".short": 2, ".4byte": 4,
+                    ".word": 4, ".long": 4, ".8byte": 8, ".dword": 8, ".quad": 8}[directive]
+            self.add_data(size, args)
+        elif directive in [".zero", ".space", ".skip"]:
+            values = [self.get_imm(value) for value in args.split(",")]
+            fill = values[1] & 0xff if len(values) > 1 else 0
+            self.get_current_section().add_bytes(bytes([fill]) * values[0])
+        elif directive == ".incbin":
+            self.add_incbin(args)
+        elif directive in [".type", ".size", ".file", ".ident", ".attribute"]:
+            pass
+        else:
+            self.error("Unsupported directive {}".format(directive))
+
+    # .incbin "file"[, skip[, count]], a relative path is searched like the include files
+    def add_incbin(self, args):
+        values = args.split(",")
+        file_name = values[0].strip().strip('"')
+        for path in [".", self.asm_dir] + INCLUDE_DIRS:
+            file_path = os.path.join(path, file_name)
+            if os.path.isfile(file_path):
+                break
+        else:
+            self.error("Cannot find incbin file {}".format(file_name))
+        with open(file_path, "rb") as f:
+            data = f.read()
+        skip = self.get_imm(values[1].strip()) if len(values) > 1 else 0
+        count = self.get_imm(values[2].strip()) if len(values) > 2 else len(data) - skip
+        self.get_current_section().add_bytes(data[skip:skip + count])
+
+    def add_data(self, size, args):
+        section = self.get_current_section()
+        data = bytearray()
+        for value in args.split(","):
+            value = value.strip()
+            symbol, addend = self.get_target(value)
+            if symbol is None:
+                data.extend((addend & ((1 << (size * 8)) - 1)).to_bytes(size, "little"))
+            else:
+                if data:
+                    section.add_bytes(data)
+                    data = bytearray()
+                section.items.append(["data", size, symbol, addend])
+        if data:
+            section.add_bytes(data)
+
+    # ------------------------------------------------------------------------------
+    # Operands
+    # ------------------------------------------------------------------------------
+
+    def get_imm(self, op):
+        op = op.strip()
+        m = re.match(r"^([+-]?)(0[xX][0-9a-fA-F]+|0[bB][01]+|0[0-7]*|[1-9][0-9]*)$", op)
+        if m is None:
+            self.error("Illegal immediate {}".format(op))
+        value = m.group(2).lower()
+        if value.startswith("0x"):
+            value = int(value, 16)
+        elif value.startswith("0b"):
+            value = int(value, 2)
+        elif value.startswith("0"):
+            value = int(value, 8)
+        else:
+            value = int(value)
+        return -value if m.group(1) == "-" else value
+
+    def get_gpr(self, op):
+        reg = GPR_INDEX.get(op.lower())
+        if reg is None:
+            self.error("Illegal register {}".format(op))
+        return reg
+
+    def get_fpr(self, op):
+        reg = FPR_INDEX.get(op.lower())
+        if reg is None:
+            self.error("Illegal floating point register {}".format(op))
+        return reg
+
+    def get_csr(self, op):
+        if op.upper() in privileged_reg_t.__members__:
+            return privileged_reg_t[op.upper()].value
+        return self.get_imm(op)
+
+    # Return (symbol, addend) of a label reference, or (None, value) of a constant
+    def get_target(self, op):
+        m = re.match(r"^(\d+)([fb])$", op)
+        if m:
+            cnt = self.numeric_label_cnt[m.group(1)]
+            if m.group(2) == "b":
+                if cnt == 0:
+                    self.error("Undefined local label {}".format(op))
+                cnt -= 1
+            return (".L{}_{}".format(m.group(1), cnt), 0)
+        m = re.match(r"^([A-Za-z_.$][\w.$]*)\s*(?:([+-])\s*(\w+))?$", op)
+        if m:
+            addend = 0
+            if m.group(3):
+                addend = self.get_imm(m.group(3))
+                if m.group(2) == "-":
+                    addend = -addend
+            return (m.group(1), addend)
+        return (None, self.get_imm(op))
+
+    # Split "imm(reg)" into its offset and base register
+    def get_mem_operand(self, op):
+        m = re.match(r"^(.*)\((\w+)\)$", op)
+        if m is None:
+            return None
+        offset = m.group(1).strip()
+        return (self.get_imm(offset) if offset else 0, m.group(2))
+
+    # Operands of an instruction in the order convert2asm prints them
+    @staticmethod
+    def get_operand_spec(instr):
+        name = instr.instr_name.name
+        if instr.group in AMO_GROUPS:
+            return ["rd", "amo"] if name in ["LR_W", "LR_D"] else ["rd", "rs2", "amo"]
+        if instr.group in FP_GROUPS:
+            if instr.format == riscv_instr_format_t.I_FORMAT:
+                if instr.category == riscv_instr_category_t.LOAD:
+                    return ["fd", "mem"]
+                if name in FP_TO_INT_INSTR:
+                    return ["rd", "fs1"]
+                if name in FP_FROM_INT_INSTR:
+                    return ["fd", "rs1"]
+                return ["fd", "fs1"]
+            if instr.format == riscv_instr_format_t.S_FORMAT:
+                return ["fs2", "mem"]
+            if instr.format == riscv_instr_format_t.R_FORMAT:
+                if instr.category == riscv_instr_category_t.COMPARE:
+                    return ["rd", "fs1", "fs2"]
+                if name in ["FCLASS_S", "FCLASS_D"]:
+                    return ["rd", "fs1"]
+                return ["fd", "fs1", "fs2"]
+            return ["fd", "fs1", "fs2", "fs3"]
+        if instr.group in COMPRESSED_GROUPS:
+            if instr.category == riscv_instr_category_t.SYSTEM or name == "C_NOP":
+                return []
+            if instr.format in [riscv_instr_format_t.CI_FORMAT, riscv_instr_format_t.CIW_FORMAT]:
+                if name == "C_ADDI16SP":
+                    return ["sp", "imm"]
+                if name == "C_ADDI4SPN":
+                    return ["rd", "sp", "imm"]
+                if instr.category == riscv_instr_category_t.LOAD:
+                    return ["rd", "spmem"]
+                return ["rd", "imm"]
+            if instr.format == riscv_instr_format_t.CL_FORMAT:
+                return ["rd", "mem"]
+            if instr.format == riscv_instr_format_t.CS_FORMAT:
+                if instr.category == riscv_instr_category_t.STORE:
+                    return ["rs2", "mem"]
+                return ["rd", "rs2"]
+            if instr.format == riscv_instr_format_t.CA_FORMAT:
+                return ["rd", "rs2"]
+            if instr.format == riscv_instr_format_t.CB_FORMAT:
+                return ["rs1", "target" if name in ["C_BEQZ", "C_BNEZ"] else "imm"]
+            if instr.format == riscv_instr_format_t.CSS_FORMAT:
+                return ["rs2", "spmem"]
+            if instr.format == riscv_instr_format_t.CR_FORMAT:
+                return ["rs1"] if name in ["C_JR", "C_JALR"] else ["rd", "rs2"]
+            return ["target"]
+        if instr.group in B_GROUPS:
+            if name in ["FSRI", "FSRIW"]:
+                return ["rd", "rs1", "rs3", "imm"]
+            if instr.format == riscv_instr_format_t.R_FORMAT and not instr.has_rs2:
+                return ["rd", "rs1"]
+            if instr.format == riscv_instr_format_t.R4_FORMAT:
+                return ["rd", "rs1", "rs2", "rs3"]
+        if instr.category == riscv_instr_category_t.SYSTEM:
+            return []
+        if instr.format == riscv_instr_format_t.J_FORMAT:
+            return ["rd", "target"]
+        if instr.format == riscv_instr_format_t.U_FORMAT:
+            return ["rd", "imm"]
+        if instr.format == riscv_instr_format_t.I_FORMAT:
+            if name in ["NOP", "WFI", "FENCE", "FENCE_I"]:
+                return []
+            if instr.category == riscv_instr_category_t.LOAD:
+                return ["rd", "mem"]
+            if instr.category == riscv_instr_category_t.CSR:
+                return ["rd", "csr", "imm"]
+            return ["rd", "rs1", "imm"]
+        if instr.format == riscv_instr_format_t.S_FORMAT:
+            return ["rs2", "mem"]
+        if instr.format == riscv_instr_format_t.B_FORMAT:
+            return ["rs1", "rs2", "target"]
+        if instr.category == riscv_instr_category_t.CSR:
+            return ["rd", "csr", "rs1"]
+        if name == "SFENCE_VMA":
+            return ["rs1", "rs2"]
+        return ["rd", "rs1", "rs2"]
+
+    # ------------------------------------------------------------------------------
+    # Instructions
+    # ------------------------------------------------------------------------------
+
+    def process_instr(self, mnemonic, ops):
+        handler = self.pseudo_instr.get(mnemonic)
+        if handler is not None and handler(mnemonic, ops):
+            return
+        entry = self.mnemonic_table.get(mnemonic)
+        if entry is None:
+            self.error("Unsupported instruction {}".format(mnemonic))
+        name, fields = entry[0], dict(entry[1])
+        instr = riscv_instr.instr_template[riscv_instr_name_t[name]]
+        spec = self.get_operand_spec(instr)
+        # Loads and stores of a symbol address it relative to the pc, "lw rd, sym" and
+        # "sw rs2, sym, rt"
+        if ("mem" in spec and instr.category in [riscv_instr_category_t.LOAD,
+                                                 riscv_instr_category_t.STORE] and
+                instr.group not in COMPRESSED_GROUPS and len(ops) in [2, 3] and
+                self.get_mem_operand(ops[1]) is None):
+            self.gen_symbol_load_store(name, spec, ops)
+            return
+        if len(ops) != len(spec):
+            self.error("Wrong number of operands")
+        any_reg = instr.group in [riscv_instr_group_t.RV32FC, riscv_instr_group_t.RV32DC]
+        target = None
+        for kind, op in zip(spec, ops):
+            if kind in ["rd", "rs1", "rs2", "rs3"]:
+                if any_reg and op.lower() in FPR_INDEX:
+                    fields[kind] = FPR_INDEX[op.lower()]
+                else:
+                    fields[kind] = self.get_gpr(op)
+            elif kind in ["fd", "fs1", "fs2", "fs3"]:
+                fields[kind] = self.get_fpr(op)
+            elif kind == "imm":
+                fields["imm"] = self.get_imm(op)
+            elif kind == "csr":
+                fields["csr"] = self.get_csr(op)
+            elif kind == "target":
+                target = self.get_target(op)
+            elif kind == "sp":
+                if self.get_gpr(op) != riscv_reg_t.SP:
+                    self.error("Expected sp operand")
+            elif kind == "spmem":
+                mem = self.get_mem_operand(op)
+                if mem is None:
+                    fields["imm"] = self.get_imm(op)
+                elif self.get_gpr(mem[1]) == riscv_reg_t.SP:
+                    fields["imm"] = mem[0]
+                else:
+                    self.error("Expected sp base register")
+            else:
+                mem = self.get_mem_operand(op)
+                if mem is None or (kind == "amo" and mem[0] != 0):
+                    self.error("Illegal memory operand {}".format(op))
+                fields["imm"] = mem[0]
+                fields["rs1"] = self.get_gpr(mem[1])
+        if target is None:
+            self.add_instr(name, fields, self.rvc and not name.startswith("C_"))
+        elif name in ["C_BEQZ", "C_BNEZ"]:
+            fields["rs2"] = 0
+            self.add_branch("BEQ" if name == "C_BEQZ" else "BNE", fields, target, True)
+        elif name in ["C_J", "C_JAL"]:
+            fields["rd"] = 0 if name == "C_J" else 1
+            self.add_branch("JAL", fields, target, True)
+        else:
+            # beq/bne rs1', x0 match c.beqz/c.bnez in GAS
+            rvc = (self.rvc and name in ["BEQ", "BNE"] and fields["rs2"] == 0 and
+                   is_c_gpr(fields["rs1"]))
+            self.add_branch(name, fields, target, rvc)
+
+    def gen_symbol_load_store(self, name, spec, ops):
+        fields = {}
+        if spec[0] in ["fd", "fs2"]:
+            fields[spec[0]] = self.get_fpr(ops[0])
+        else:
+            fields[spec[0]] = self.get_gpr(ops[0])
+        if len(ops) == 3:
+            hi_reg = self.get_gpr(ops[2])
+        elif spec[0] == "rd":
+            hi_reg = fields["rd"]
+        else:
+            self.error("Missing temporary register")
+        symbol, addend = self.get_target(ops[1])
+        if symbol is None:
+            self.error("Illegal memory operand {}".format(ops[1]))
+        fields["rs1"] = hi_reg
+        self.get_current_section().items.append(["pcrel", name, fields, hi_reg,
+                                                 symbol, addend])
+
+    # Add an instruction, compress is set when GAS would pick a compressed encoding for
+    # the same syntax
+    def add_instr(self, name, fields, compress = False):
+        if compress:
+            compressed = self.get_compressed(name, fields)
+            if compressed is not None:
+                name, fields = compressed
+        self.get_current_section().add_bytes(self.encode(name, fields))
+
+    def add_branch(self, name, fields, target, rvc):
+        symbol, addend = target
+        rvc = rvc and self.has_template("C_J" if name == "JAL" else "C_BEQZ")
+        if rvc and name == "JAL" and fields["rd"] == 1 and rcs.XLEN != 32:
+            rvc = False
+        if symbol is None:
+            # Constant offset from the branch itself
+            reach = 1 << 11 if name == "JAL" else 1 << 8
+            size = 2 if rvc and -reach <= addend < reach else 4
+            self.get_current_section().add_bytes(self.encode_branch(name, fields, addend, size))
+        else:
+            self.get_current_section().items.append(["branch", name, fields, symbol, addend,
+                                                     2 if rvc else 4, rvc])
+
+    def has_template(self, name):
+        if rcs.XLEN != 32 and name in RV32_ONLY_COMPRESSED:
+            return False
+        return riscv_instr_name_t[name] in riscv_instr.instr_template
+
+    # Encode an instruction with the convert2bin of a cached instance of its class
+    def encode(self, name, fields):
+        instr = self.instr_cache.get(name)
+        if instr is None:
+            if not self.has_template(name):
+                self.error("Unsupported instruction {}".format(name))
+            instr = riscv_instr.instr_template[riscv_instr_name_t[name]].clone()
+            self.instr_cache[name] = instr
+        for field, value in fields.items():
+            if field in ["rd", "rs1", "rs2", "rs3"]:
+                value = riscv_reg_t(value)
+            elif field in ["fd", "fs1", "fs2", "fs3"]:
+                value = riscv_fpr_t(value)
+            elif field == "imm":
+                value &= 0xffffffff
+            setattr(instr, field, value)
+        return int(instr.convert2bin(), 16).to_bytes(2 if name.startswith("C_") else 4,
+                                                     "little")
+
+    # Return the compressed instruction GAS assembles the instruction to, or None. GAS
+    # only compresses the operand forms of its aliases, unlike llvm-mc which also turns
+    # "add rd, rs, zero" into c.mv and "jalr x0, rs, 0" into c.jr
+    def get_compressed(self, name, fields):
+        rd = fields.get("rd", 0)
+        rs1 = fields.get("rs1", 0)
+        rs2 = fields.get("rs2", 0)
+        imm = fields.get("imm", 0)
+        result = None
+        if name == "ADDI":
+            if is_c_gpr(rd) and rs1 == 2 and imm > 0 and imm % 4 == 0 and imm < 1024:
+                result = ("C_ADDI4SPN", {"rd": rd, "imm": imm})
+            elif rd == rs1 and rd != 0 and imm != 0 and is_simm(imm, 6):
+                result = ("C_ADDI", {"rd": rd, "imm": imm})
+            elif rd == 0 and rs1 == 0 and imm == 0:
+                result = ("C_NOP", {})
+            elif rd == 2 and rs1 == 2 and imm != 0 and imm % 16 == 0 and is_simm(imm, 10):
+                result = ("C_ADDI16SP", {"imm": imm})
+            elif rs1 == 0 and rd != 0 and is_simm(imm, 6):
+                result = ("C_LI", {"rd": rd, "imm": imm})
+        elif name == "ADDIW":
+            if rd == rs1 and rd != 0 and is_simm(imm, 6):
+                result = ("C_ADDIW", {"rd": rd, "imm": imm})
+        elif name == "LUI":
+            if rd not in [0, 2] and (0 < imm < 32 or 0xfffe0 <= imm <= 0xfffff):
+                result = ("C_LUI", {"rd": rd, "imm": imm})
+        elif name == "ADD":
+            if rd != 0 and rd == rs1 and rs2 != 0:
+                result = ("C_ADD", {"rd": rd, "rs2": rs2})
+            elif rd != 0 and rd == rs2 and rs1 != 0:
+                result = ("C_ADD", {"rd": rd, "rs2": rs1})
+            elif rd != 0 and rs1 == 0 and rs2 != 0:
+                result = ("C_MV", {"rd": rd, "rs2": rs2})
+        elif name in ["SUB", "XOR", "OR", "AND", "SUBW", "ADDW"]:
+            if is_c_gpr(rd) and rd == rs1 and is_c_gpr(rs2):
+                result = ("C_" + name, {"rd": rd, "rs2": rs2})
+            elif (name not in ["SUB", "SUBW"] and is_c_gpr(rd) and rd == rs2 and
+                  is_c_gpr(rs1)):
+                result = ("C_" + name, {"rd": rd, "rs2": rs1})
+        elif name == "SLLI":
+            if rd == rs1 and rd != 0 and imm != 0:
+                result = ("C_SLLI", {"rd": rd, "imm": imm})
+        elif name in ["SRLI", "SRAI"]:
+            if is_c_gpr(rd) and rd == rs1 and imm != 0:
+                result = ("C_" + name, {"rs1": rs1, "imm": imm})
+        elif name == "ANDI":
+            if is_c_gpr(rd) and rd == rs1 and is_simm(imm, 6):
+                result = ("C_ANDI", {"rs1": rs1, "imm": imm})
+        elif name in ["LW", "LD", "FLW", "FLD"]:
+            scale = 4 if name in ["LW", "FLW"] else 8
+            dst = fields["fd"] if name.startswith("F") else rd
+            if imm >= 0 and imm % scale == 0:
+                if rs1 == 2 and imm < scale * 64 and (dst != 0 or name.startswith("F")):
+                    result = ("C_{}SP".format(name), {"rd": dst, "imm": imm})
+                elif (is_c_gpr(rs1) and (is_c_gpr(dst) or name.startswith("F") and
+                                         8 <= dst <= 15) and imm < scale * 32):
+                    result = ("C_" + name, {"rd": dst, "rs1": rs1, "imm": imm})
+        elif name in ["SW", "SD", "FSW", "FSD"]:
+            scale = 4 if name in ["SW", "FSW"] else 8
+            src = fields["fs2"] if name.startswith("F") else rs2
+            if imm >= 0 and imm % scale == 0:
+                if rs1 == 2 and imm < scale * 64:
+                    result = ("C_{}SP".format(name), {"rs2": src, "imm": imm})
+                elif is_c_gpr(rs1) and is_c_gpr(src) and imm < scale * 32:
+                    result = ("C_" + name, {"rs1": rs1, "rs2": src, "imm": imm})
+        if result is None or not self.has_template(result[0]):
+            return None
+        return result
+
+    # Encode a branch or jump of the given size, offset is relative to its first byte
+    def encode_branch(self, name, fields, offset, size):
+        if name == "JAL":
+            if size == 2:
+                return self.encode("C_J" if fields["rd"] == 0 else "C_JAL", {"imm": offset})
+            if not is_simm(offset, 21):
+                self.error("Jump target out of range")
+            return self.encode("JAL", {"rd": fields["rd"], "imm": offset})
+        if size == 2:
+            return self.encode("C_BEQZ" if name == "BEQ" else "C_BNEZ",
+                               {"rs1": fields["rs1"], "imm": offset})
+        if size == 4:
+            return self.encode(name, {"rs1": fields["rs1"], "rs2": fields["rs2"],
+                                      "imm": offset})
+        # Branch over a jump to the target with the inverse condition
+        if size == 6:
+            skip = self.encode("C_BNEZ" if name == "BEQ" else "C_BEQZ",
+                               {"rs1": fields["rs1"], "imm": 6})
+        else:
+            skip = self.encode(INVERSE_BRANCH[name], {"rs1": fields["rs1"],
+                                                      "rs2": fields["rs2"], "imm": 8})
+        return skip + self.encode_branch("JAL", {"rd": 0}, offset - len(skip), 4)
+
+    # ------------------------------------------------------------------------------
+    # Pseudo instructions, a handler returns False to fall back to the real instruction
+    # ------------------------------------------------------------------------------
+
+    def gen_nop(self, mnemonic, ops):
+        self.add_instr("ADDI", {"rd": 0, "rs1": 0, "imm": 0}, self.rvc)
+        return True
+
+    def gen_li(self, mnemonic, ops):
+        if len(ops) != 2:
+            self.error("Wrong number of operands")
+        rd = self.get_gpr(ops[0])
+        value = self.get_imm(ops[1])
+        if rcs.XLEN == 32:
+            if 0 <= value < (1 << 32):
+                value = to_signed(value, 32)
+        else:
+            value = to_signed(value, 64)
+        if self.rvc and is_simm(value, 32) and value & 0xfff == 0 and rd not in [0, 2]:
+            upper = (value & 0xffffffff) >> 12
+            if 0 < upper < 32 or 0xfffe0 <= upper <= 0xfffff:
+                self.add_instr("C_LUI", {"rd": rd, "imm": upper})
+                return True
+        if self.rvc and rd != 0 and is_simm(value, 6):
+            self.add_instr("C_LI", {"rd": rd, "imm": value})
+        elif is_simm(value, 12):
+            self.add_instr("ADDI", {"rd": rd, "rs1": 0, "imm": value})
+        else:
+            self.load_const(rd, value)
+        return True
+
+    # The GAS load_const macro
+    def load_const(self, rd, value):
+        lower = to_signed(value, 12)
+        upper = to_signed(value - lower, 64)
+        if rcs.XLEN > 32 and not is_simm(value, 32):
+            # Reduce to a signed 32-bit constant using SLLI and ADDI
+            shift = 12
+            while (upper >> shift) & 1 == 0:
+                shift += 1
+            self.load_const(rd, upper >> shift)
+            self.add_instr("SLLI", {"rd": rd, "rs1": rd, "imm": shift}, self.rvc)
+            if lower != 0:
+                self.add_instr("ADDI", {"rd": rd, "rs1": rd, "imm": lower}, self.rvc)
+        else:
+            hi_reg = 0
+            if upper != 0:
+                self.add_instr("LUI", {"rd": rd, "imm": (upper & 0xffffffff) >> 12}, self.rvc)
+                hi_reg = rd
+            if lower != 0 or hi_reg == 0:
+                self.add_instr("ADDI" if rcs.XLEN == 32 else "ADDIW",
+                               {"rd": rd, "rs1": hi_reg, "imm": lower}, self.rvc)
+
+    def gen_la(self, mnemonic, ops):
+        if len(ops) != 2:
+            self.error("Wrong number of operands")
+        rd = self.get_gpr(ops[0])
+        symbol, addend = self.get_target(ops[1])
+        if symbol is None:
+            self.error("Illegal symbol {}".format(ops[1]))
+        self.get_current_section().items.append(["pcrel", "ADDI", {"rd": rd, "rs1": rd}, rd,
+                                                 symbol, addend])
+        return True
+
+    def gen_mv(self, mnemonic, ops):
+        rd, rs = self.get_gpr(ops[0]), self.get_gpr(ops[1])
+        if self.rvc and rd != 0 and rs != 0:
+            self.add_instr("C_MV", {"rd": rd, "rs2": rs})
+        else:
+            self.add_instr("ADDI", {"rd": rd, "rs1": rs, "imm": 0})
+        return True
+
+    def gen_not(self, mnemonic, ops):
+        self.add_instr("XORI", {"rd": self.get_gpr(ops[0]), "rs1": self.get_gpr(ops[1]),
+                                "imm": -1})
+        return True
+
+    def gen_neg(self, mnemonic, ops):
+        self.add_instr("SUB" if mnemonic == "neg" else "SUBW",
+                       {"rd": self.get_gpr(ops[0]), "rs1": 0, "rs2": self.get_gpr(ops[1])})
+        return True
+
+    def gen_sext_w(self, mnemonic, ops):
+        self.add_instr("ADDIW", {"rd": self.get_gpr(ops[0]), "rs1": self.get_gpr(ops[1]),
+                                 "imm": 0}, self.rvc)
+        return True
+
+    def gen_set_zero(self, mnemonic, ops):
+        rd, rs = self.get_gpr(ops[0]), self.get_gpr(ops[1])
+        if mnemonic == "seqz":
+            self.add_instr("SLTIU", {"rd": rd, "rs1": rs, "imm": 1})
+        elif mnemonic == "snez":
+            self.add_instr("SLTU", {"rd": rd, "rs1": 0, "rs2": rs})
+        elif mnemonic == "sltz":
+            self.add_instr("SLT", {"rd": rd, "rs1": rs, "rs2": 0})
+        else:
+            self.add_instr("SLT", {"rd": rd, "rs1": 0, "rs2": rs})
+        return True
+
+    def gen_j(self, mnemonic, ops):
+        self.add_branch("JAL", {"rd": 0}, self.get_target(ops[0]), self.rvc)
+        return True
+
+    def gen_jal(self, mnemonic, ops):
+        if len(ops) != 1:
+            return False
+        self.add_branch("JAL", {"rd": 1}, self.get_target(ops[0]), self.rvc)
+        return True
+
+    def gen_jr(self, mnemonic, ops):
+        return self.gen_indirect_jump(0, ops)
+
+    def gen_jalr(self, mnemonic, ops):
+        if len(ops) == 3:
+            return False
+        if len(ops) == 2 and ops[0].lower() in GPR_INDEX and self.get_mem_operand(ops[1]):
+            # jalr rd, imm(rs1)
+            imm, rs1 = self.get_mem_operand(ops[1])
+            self.add_instr("JALR", {"rd": self.get_gpr(ops[0]), "rs1": self.get_gpr(rs1),
+                                    "imm": imm})
+            return True
+        if len(ops) == 2 and ops[1].lower() in GPR_INDEX:
+            # jalr rd, rs1
+            self.add_instr("JALR", {"rd": self.get_gpr(ops[0]), "rs1": self.get_gpr(ops[1]),
+                                    "imm": 0})
+            return True
+        return self.gen_indirect_jump(1, ops)
+
+    # jr/jalr with the link register implied: "rs1", "imm(rs1)" or "rs1, imm"
+    def gen_indirect_jump(self, rd, ops):
+        if len(ops) == 1 and self.get_mem_operand(ops[0]) is None:
+            rs1 = self.get_gpr(ops[0])
+            if self.rvc and rs1 != 0:
+                self.add_instr("C_JR" if rd == 0 else "C_JALR", {"rs1": rs1})
+            else:
+                self.add_instr("JALR", {"rd": rd, "rs1": rs1, "imm": 0})
+        elif len(ops) == 1:
+            imm, rs1 = self.get_mem_operand(ops[0])
+            self.add_instr("JALR", {"rd": rd, "rs1": self.get_gpr(rs1), "imm": imm})
+        elif len(ops) == 2:
+            self.add_instr("JALR", {"rd": rd, "rs1": self.get_gpr(ops[0]),
+                                    "imm": self.get_imm(ops[1])})
+        else:
+            self.error("Wrong number of operands")
+        return True
+
+    def gen_ret(self, mnemonic, ops):
+        return self.gen_indirect_jump(0, ["ra"])
+
+    def gen_branch_zero(self, mnemonic, ops):
+        rs = self.get_gpr(ops[0])
+        target = self.get_target(ops[1])
+        if mnemonic in ["beqz", "bnez"]:
+            self.add_branch("BEQ" if mnemonic == "beqz" else "BNE", {"rs1": rs, "rs2": 0},
+                            target, self.rvc and is_c_gpr(rs))
+        elif mnemonic in ["bgez", "bltz"]:
+            self.add_branch("BGE" if mnemonic == "bgez" else "BLT", {"rs1": rs, "rs2": 0},
+                            target, False)
+        else:
+            self.add_branch("BGE" if mnemonic == "blez" else "BLT", {"rs1": 0, "rs2": rs},
+                            target, False)
+        return True
+
+    def gen_branch_swap(self, mnemonic, ops):
+        name = {"bgt": "BLT", "ble": "BGE", "bgtu": "BLTU", "bleu": "BGEU"}[mnemonic]
+        self.add_branch(name, {"rs1": self.get_gpr(ops[1]), "rs2": self.get_gpr(ops[0])},
+                        self.get_target(ops[2]), False)
+        return True
+
+    def gen_csr(self, mnemonic, ops):
+        if mnemonic == "csrr":
+            self.add_instr("CSRRS", {"rd": self.get_gpr(ops[0]), "csr": self.get_csr(ops[1]),
+                                     "rs1": 0})
+            return True
+        name = {"csrw": "CSRRW", "csrs": "CSRRS", "csrc": "CSRRC"}.get(mnemonic[:4])
+        csr = self.get_csr(ops[0])
+        if mnemonic.endswith("i") or ops[1].lower() not in GPR_INDEX:
+            self.add_instr(name + "I", {"rd": 0, "csr": csr, "imm": self.get_imm(ops[1])})
+        else:
+            self.add_instr(name, {"rd": 0, "csr": csr, "rs1": self.get_gpr(ops[1])})
+        return True
+
+    # Floating point CSR accesses: frcsr/fscsr, frrm/fsrm/fsrmi and frflags/fsflags/fsflagsi
+    def gen_fcsr(self, mnemonic, ops):
+        csr = {"csr": privileged_reg_t.FCSR, "rm": privileged_reg_t.FRM,
+               "flags": privileged_reg_t.FFLAGS}[mnemonic[2:].rstrip("i")]
+        if mnemonic.startswith("fr"):
+            self.add_instr("CSRRS", {"rd": self.get_gpr(ops[0]), "csr": csr, "rs1": 0})
+            return True
+        rd = self.get_gpr(ops[0]) if len(ops) == 2 else 0
+        if mnemonic.endswith("i"):
+            self.add_instr("CSRRWI", {"rd": rd, "csr": csr, "imm": self.get_imm(ops[-1])})
+        else:
+            self.add_instr("CSRRW", {"rd": rd, "csr": csr, "rs1": self.get_gpr(ops[-1])})
+        return True
+
+    def gen_fsgnj(self, mnemonic, ops):
+        op, fmt = mnemonic.split(".")
+        name = {"fmv": "FSGNJ", "fneg": "FSGNJN", "fabs": "FSGNJX"}[op] + "_" + fmt.upper()
+        fs = self.get_fpr(ops[1])
+        self.add_instr(name, {"fd": self.get_fpr(ops[0]), "fs1": fs, "fs2": fs})
+        return True
+
+    def gen_ebreak(self, mnemonic, ops):
+        self.add_instr("C_EBREAK" if self.rvc and self.has_template("C_EBREAK")
+                       else "EBREAK", {})
+        return True
+
+    # convert2bin encodes sfence.vma as "sfence.vma x0, x0", the only form generated
+    def gen_sfence_vma(self, mnemonic, ops):
+        if any(self.get_gpr(op) != 0 for op in ops):
+            self.error("Only sfence.vma x0, x0 is supported")
+        self.add_instr("SFENCE_VMA", {})
+        return True
+
+    # ------------------------------------------------------------------------------
+    # Layout
+    # ------------------------------------------------------------------------------
+
+    # Size the branches of a section. GAS sees code alignment at its worst case padding, as
+    # ld only removes the excess nops after the branches are sized, and grows a branch when
+    # its target is out of reach. Start from the shortest forms and repeat until no branch
+    # grows, the first pass only records the label offsets.
+    def relax_section(self, section):
+        self.layout_section(section, True)
+        while self.layout_section(section, True):
+            pass
+        self.layout_section(section, False)
+
+    def layout_section(self, section, worst_case):
+        offset = 0
+        changed = False
+        for item in section.items:
+            kind = item[0]
+            if kind == "bytes":
+                offset += len(item[1])
+            elif kind == "label":
+                self.label_offset[item[1]] = offset
+            elif kind == "branch":
+                size = self.get_branch_size(item, offset, section)
+                if size > item[5]:
+                    item[5] = size
+                    changed = True
+                offset += item[5]
+            elif kind == "pcrel":
+                offset += 8
+            elif kind == "data":
+                offset += item[1]
+            else:
+                offset += self.get_align_padding(section, item, offset, worst_case)
+        section.size = offset
+        return changed
+
+    def get_align_padding(self, section, item, offset, worst_case):
+        align, insn_align = item[1], item[2]
+        if section.is_code:
+            if align <= insn_align:
+                return 0
+            if worst_case:
+                return align - insn_align
+        return -offset % align
+
+    def get_branch_size(self, item, offset, section):
+        name, symbol, addend, size, rvc = item[1], item[3], item[4], item[5], item[6]
+        jump = name == "JAL"
+        if self.label_section.get(symbol) is not section:
+            return 4 if jump else 8
+        if symbol not in self.label_offset:
+            return size
+        delta = self.label_offset[symbol] + addend - offset
+        if rvc and is_simm(delta, 12 if jump else 9):
+            return 2
+        if is_simm(delta, 13) or jump:
+            return 4
+        return 6 if rvc else 8
+
+    # Parse the output section statements of the linker script
+    def get_link_script(self):
+        with open(LINK_SCRIPT, "r") as f:
+            script = re.sub(r"/\*.*?\*/", "", f.read(), flags = re.S)
+        m = re.search(r"ENTRY\s*\(\s*([\w.$]+)\s*\)", script)
+        if m:
+            self.entry = m.group(1)
+        statements = []
+        body = script[script.index("SECTIONS"):]
+        for m in re.finditer(r"\.\s*=\s*ALIGN\s*\(\s*(\w+)\s*\)\s*;|\.\s*=\s*(\w+)\s*;|"
+                             r"(\.[\w.]+)\s*:\s*\{([^}]*)\}|([\w.$]+)\s*=\s*\.\s*;", body):
+            if m.group(1):
+                statements.append(["align", int(m.group(1), 0)])
+            elif m.group(2):
+                statements.append(["addr", int(m.group(2), 0)])
+            elif m.group(3):
+                inputs = []
+                for pattern in re.findall(r"\*\(([^)]*)\)", m.group(4)):
+                    inputs.extend(pattern.split())
+                statements.append(["section", m.group(3), inputs])
+            else:
+                statements.append(["symbol", m.group(5)])
+        return statements
+
+    # Assign the section addresses. Sections the script does not name are placed like ld
+    # places orphans: after .text for code and after .data for data, in source order.
+    def place_sections(self):
+        statements = self.get_link_script()
+        placed = set()
+        for statement in statements:
+            if statement[0] == "section":
+                placed.update(statement[2])
+        after = {}
+        for name, section in self.sections.items():
+            if name in placed:
+                continue
+            anchor = ".text" if section.is_code else ".data"
+            index = after.get(anchor)
+            if index is None:
+                index = next((i for i, statement in enumerate(statements)
+                              if statement[0] == "section" and statement[1] == anchor),
+                             len(statements) - 1)
+            statements.insert(index + 1, ["section", name, [name]])
+            for key in after:
+                if after[key] > index:
+                    after[key] += 1
+            after[anchor] = index + 1
+        dot = 0
+        for statement in statements:
+            if statement[0] == "addr":
+                dot = statement[1]
+            elif statement[0] == "align":
+                dot = align_up(dot, statement[1])
+            elif statement[0] == "symbol":
+                self.symbols[statement[1]] = (dot, None)
+            else:
+                inputs = [self.sections[name] for name in statement[2]
+                          if name in self.sections]
+                if not inputs:
+                    continue
+                dot = align_up(dot, max(section.align for section in inputs))
+                start = dot
+                for section in inputs:
+                    section.addr = align_up(dot, section.align)
+                    dot = section.addr + section.size
+                if any(section.size for section in inputs):
+                    self.output_sections.append([statement[1], start, dot - start, inputs])
+        for name, section in self.label_section.items():
+            self.symbols[name] = (section.addr + self.label_offset[name], section)
+
+    def get_symbol_addr(self, symbol):
+        if symbol not in self.symbols:
+            self.error("Undefined symbol {}".format(symbol))
+        return self.symbols[symbol][0]
+
+    def gen_section_data(self, section):
+        data = section.data
+        for item in section.items:
+            kind = item[0]
+            pc = section.addr + len(data)
+            if kind == "bytes":
+                data.extend(item[1])
+            elif kind == "branch":
+                self.stmt = "{} {}".format(item[1].lower(), item[3])
+                offset = self.get_symbol_addr(item[3]) + item[4] - pc
+                data.extend(self.encode_branch(item[1], item[2], offset, item[5]))
+            elif kind == "pcrel":
+                self.stmt = "{} {}".format(item[1].lower(), item[4])
+                offset = self.get_symbol_addr(item[4]) + item[5] - pc
+                hi = (offset + 0x800) >> 12
+                if not is_simm(hi, 20):
+                    self.error("Symbol out of range")
+                data.extend(self.encode("AUIPC", {"rd": item[3], "imm": hi}))
+                data.extend(self.encode(item[1], dict(item[2], imm = offset - (hi << 12))))
+            elif kind == "data":
+                self.stmt = item[2]
+                value = self.get_symbol_addr(item[2]) + item[3]
+                data.extend((value & ((1 << (item[1] * 8)) - 1)).to_bytes(item[1], "little"))
+            elif kind == "align":
+                padding = self.get_align_padding(section, item, len(data), False)
+                if section.is_code:
+                    data.extend(bytes(padding % 2))
+                    data.extend(NOP_BIN.to_bytes(4, "little") * (padding // 4))
+                    if padding % 4 >= 2:
+                        data.extend(C_NOP_BIN.to_bytes(2, "little"))
+                else:
+                    data.extend(bytes(padding))
+
+    # ------------------------------------------------------------------------------
+    # Output files
+    # ------------------------------------------------------------------------------
+
+    def get_output_data(self, output):
+        name, addr, size, inputs = output
+        data = bytearray(size)
+        for section in inputs:
+            offset = section.addr - addr
+            data[offset:offset + len(section.data)] = section.data
+        return data
+
+    # Raw image of the loadable sections, like "objcopy -O binary"
+    def write_bin(self, file_name):
+        outputs = [output for output in self.output_sections if not output[3][0].nobits]
+        image = bytearray()
+        if outputs:
+            base = outputs[0][1]
+            for output in outputs:
+                offset = output[1] - base
+                image.extend(bytes(offset - len(image)))
+                image[offset:offset + output[2]] = self.get_output_data(output)
+        with open(file_name, "wb") as f:
+            f.write(image)
+        logging.info("{} is generated".format(file_name))
+
+    # Minimal executable ELF: one PT_LOAD segment per output section and a symbol table
+    def write_elf(self, file_name):
+        is_64 = rcs.XLEN == 64
+        addr_fmt = "Q" if is_64 else "I"
+        ehdr_size, phdr_size, shdr_size = (64, 56, 64) if is_64 else (52, 32, 40)
+        # Section header string table and symbol table
+        shstrtab = bytearray(b"\0")
+        strtab = bytearray(b"\0")
+
+        def add_string(table, string):
+            index = len(table)
+            table.extend(string.encode() + b"\0")
+            return index
+
+        shndx = {}
+        for i, output in enumerate(self.output_sections):
+            for section in output[3]:
+                shndx[section.name] = i + 1
+        local_syms = []
+        global_syms = []
+        for name, (value, section) in self.symbols.items():
+            if name.startswith(".L"):
+                continue
+            index = shndx.get(section.name, SHN_ABS) if section is not None else SHN_ABS
+            bind = STB_GLOBAL if name in self.global_symbols or section is None else STB_LOCAL
+            entry = (add_string(strtab, name), value, bind << 4, index)
+            (global_syms if bind == STB_GLOBAL else local_syms).append(entry)
+        symtab = bytearray()
+        for name_index, value, info, index in [(0, 0, 0, 0)] + local_syms + global_syms:
+            if is_64:
+                symtab.extend(struct.pack("<IBBHQQ", name_index, info, 0, index, value, 0))
+            else:
+                symtab.extend(struct.pack("<IIIBBH", name_index, value, 0, info, 0, index))
+        # File layout: headers, section contents, tables, section headers
+        phnum = sum(1 for output in self.output_sections if not output[3][0].nobits)
+        offset = ehdr_size + phdr_size * phnum
+        contents = bytearray()
+        phdrs = bytearray()
+        shdrs = bytearray(shdr_size)
+        for output in self.output_sections:
+            name, addr, size, inputs = output
+            align = max(section.align for section in inputs)
+            flags = SHF_ALLOC
+            if inputs[0].is_writable:
+                flags |= SHF_WRITE
+            if inputs[0].is_code:
+                flags |= SHF_EXECINSTR
+            nobits = inputs[0].nobits
+            pad = align_up(offset + len(contents), align) - offset - len(contents)
+            contents.extend(bytes(pad))
+            file_offset = offset + len(contents)
+            if not nobits:
+                contents.extend(self.get_output_data(output))
+                p_flags = 0x4 | (0x2 if flags & SHF_WRITE else 0) | \
+                    (0x1 if flags & SHF_EXECINSTR else 0)
+                if is_64:
+                    phdrs.extend(struct.pack("<IIQQQQQQ", PT_LOAD, p_flags, file_offset, addr,
+                                             addr, size, size, align))
+                else:
+                    phdrs.extend(struct.pack("<IIIIIIII", PT_LOAD, file_offset, addr, addr,
+                                             size, size, p_flags, align))
+            shdrs.extend(self.pack_shdr(is_64, add_string(shstrtab, name),
+                                        SHT_NOBITS if nobits else SHT_PROGBITS, flags, addr,
+                                        file_offset, size, 0, 0, align, 0))
+        symtab_index = len(self.output_sections) + 1
+        tables = [(".symtab", SHT_SYMTAB, symtab, symtab_index + 1, 1 + len(local_syms),
+                   8 if is_64 else 4, 24 if is_64 else 16),
+                  (".strtab", SHT_STRTAB, strtab, 0, 0, 1, 0)]
+        shstrtab_name = add_string(shstrtab, ".shstrtab")
+        for name, sh_type, table, link, info, align, entsize in tables:
+            contents.extend(bytes(align_up(offset + len(contents), align) -
+                                  offset - len(contents)))
+            shdrs.extend(self.pack_shdr(is_64, add_string(shstrtab, name), sh_type, 0, 0,
+                                        offset + len(contents), len(table), link, info, align,
+                                        entsize))
+            contents.extend(table)
+        shdrs.extend(self.pack_shdr(is_64, shstrtab_name, SHT_STRTAB, 0, 0,
+                                    offset + len(contents), len(shstrtab), 0, 0, 1, 0))
+        contents.extend(shstrtab)
+        contents.extend(bytes(align_up(offset + len(contents), 8) - offset - len(contents)))
+        shoff = offset + len(contents)
+        shnum = len(shdrs) // shdr_size
+        if self.entry in self.symbols:
+            entry = self.symbols[self.entry][0]
+        else:
+            entry = self.output_sections[0][1] if self.output_sections else 0
+        ident = b"\x7fELF" + bytes([2 if is_64 else 1, 1, 1]) + bytes(9)
+        ehdr = ident + struct.pack("<HHI" + addr_fmt * 3 + "IHHHHHH", ET_EXEC, EM_RISCV, 1,
+                                   entry, ehdr_size if phnum else 0, shoff,
+                                   EF_RISCV_RVC if self.has_rvc else 0, ehdr_size,
+                                   phdr_size, phnum, shdr_size, shnum, shnum - 1)
+        with open(file_name, "wb") as f:
+            f.write(ehdr + phdrs + contents + shdrs)
+        logging.info("{} is generated".format(file_name))
+
+    @staticmethod
+    def pack_shdr(is_64, name, sh_type, flags, addr, offset, size, link, info, align, entsize):
+        if is_64:
+            return struct.pack("<IIQQQQIIQQ", name, sh_type, flags, addr, offset, size, link,
+                               info, align, entsize)
+        return struct.pack("<IIIIIIIIII", name, sh_type, flags, addr, offset, size, link, info,
+                           align, entsize)
@@ -10,6 +10,7 @@ distributed under the License is distributed on an "AS IS" BASIS,
 WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 """
 
+import os
 import logging
 import vsc
 import random
@@ -31,21 +32,34 @@ class riscv_data_page_gen:
 
     # The data section can be initialized with different data pattern:
     # - Random value, incremental value, all zeros
+    # All the bytes of a memory region are generated at once
     @staticmethod
-    def gen_data(idx, pattern, num_of_bytes, data):
-        temp_data = 0
-        data = [0] * num_of_bytes
-        for i in range(len(data)):
-            if pattern == data_pattern_t.RAND_DATA:
-                temp_data = random.randrange(0, (2**8) - 1)
-                data[i] = temp_data
-            elif pattern == data_pattern_t.INCR_VAL:
-                data[i] = (idx + i) % 256
-        return data
+    def gen_data(pattern, num_of_bytes):
+        if pattern == data_pattern_t.RAND_DATA:
+            return random.randbytes(num_of_bytes)
+        elif pattern == data_pattern_t.INCR_VAL:
+            return (bytes(range(256)) * (num_of_bytes // 256 + 1))[:num_of_bytes]
+        return bytes(num_of_bytes)
 
-    # Generate data pages for all memory regions
-    def gen_data_page(self, hart_id, pattern, is_kernel=0, amo=0):
-        temp_data = []
+    # Format the data of a region as .word rows of 32 bytes
+    @staticmethod
+    def format_rows(data):
+        hex_str = data.hex()
+        words = [hex_str[i:i + 8] for i in range(0, len(hex_str), 8)]
+        return [".word 0x" + ", 0x".join(words[i:i + 8]) for i in range(0, len(words), 8)]
+
+    # Memory image of the .word rows, each word is stored little endian
+    @staticmethod
+    def get_word_image(data):
+        image = bytearray(len(data))
+        for i in range(4):
+            image[i::4] = data[3 - i::4]
+        return image
+
+    # Generate data pages for all memory regions. With data_file_prefix, the regions are
+    # written to binary files next to the test and included with .incbin by file name, the
+    # assembler finds them in the directory of the test
+    def gen_data_page(self, hart_id, pattern, is_kernel=0, amo=0, data_file_prefix=None):
         self.data_page_str.clear()
         if is_kernel:
             self.mem_region_setting = cfg.s_mem_region
@@ -59,34 +73,32 @@ class riscv_data_page_gen:
                          self.mem_region_setting[i].size_in_bytes,
                          self.mem_region_setting[i].xwr))
             if amo:
-                if cfg.use_push_data_section:
-                    self.data_page_str.append(".pushsection .{},\"aw\",@progbits;"
-                                              .format(self.mem_region_setting[i].name))
-                else:
-                    self.data_page_str.append(".section .{},\"aw\",@progbits;"
-                                              .format(self.mem_region_setting[i].name))
-                self.data_page_str.append("{}:".format(self.mem_region_setting[i].name))
+                region_name = self.mem_region_setting[i].name
             else:
-                if cfg.use_push_data_section:
-                    self.data_page_str.append(".pushsection .{},\"aw\",@progbits;"
-                                              .format(pkg_ins.hart_prefix(hart_id) +
-                                                      self.mem_region_setting[i].name))
-                else:
-                    self.data_page_str.append(".section .{},\"aw\",@progbits;"
-                                              .format(pkg_ins.hart_prefix(hart_id) +
-                                                      self.mem_region_setting[i].name))
-                self.data_page_str.append("{}:".format(pkg_ins.hart_prefix(hart_id) +
-                                                       self.mem_region_setting[i].name))
+                region_name = pkg_ins.hart_prefix(hart_id) + self.mem_region_setting[i].name
+            if cfg.use_push_data_section:
+                self.data_page_str.append(".pushsection .{},\"aw\",@progbits;"
+                                          .format(region_name))
+            else:
+                self.data_page_str.append(".section .{},\"aw\",@progbits;"
+                                          .format(region_name))
+            self.data_page_str.append("{}:".format(region_name))
             page_size = self.mem_region_setting[i].size_in_bytes
-            for i in range(0, page_size, 32):
-                if page_size - 1 >= 32:
-                    temp_data = self.gen_data(idx=i, pattern=pattern,
-                                              num_of_bytes=32, data=temp_data)
+            if page_size - 1 >= 32:
+                # Rows of 32 bytes, the last one may run past the end of the region
+                data = self.gen_data(pattern, (page_size + 31) // 32 * 32)
+                if data_file_prefix is not None:
+                    data_file = "{}_{}.dat".format(data_file_prefix, region_name)
+                    with open(data_file, "wb") as f:
+                        f.write(self.get_word_image(data))
+                    self.data_page_str.append(".incbin \"{}\""
+                                              .format(os.path.basename(data_file)))
                 else:
-                    temp_data = self.gen_data(idx=i, pattern=pattern,
-                                              num_of_bytes=page_size - 1, data=temp_data)
-                tmp_str = pkg_ins.format_string(".word {}".format(pkg_ins.format_data(temp_data)),
+                    self.data_page_str.extend(self.format_rows(data))
+            elif page_size > 0:
+                data = self.gen_data(pattern, page_size - 1)
+                tmp_str = pkg_ins.format_string(".word {}".format(pkg_ins.format_data(data)),
                                                 pkg_ins.LABEL_STR_LEN)
                 self.data_page_str.append(tmp_str)
-                if cfg.use_push_data_section:
-                    self.data_page_str.append(".popsection")
+            if cfg.use_push_data_section:
+                self.data_page_str.append(".popsection")
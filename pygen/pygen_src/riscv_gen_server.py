@@ -0,0 +1,153 @@
+"""
+Copyright 2020 Google LLC
+Copyright 2020 PerfectVIPs Inc.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import signal
+import select
+import socket
+import argparse
+import tempfile
+import traceback
+import socketserver
+
+# Target the generator modules of this server are loaded for
+server_target = None
+
+
+# Run a generator test script in this process, with the arguments of the job
+def run_test(script, args):
+    from pygen_src.riscv_instr_gen_config import cfg
+    sys.argv = [script] + args
+    # Same module search path as "python3 <script>"
+    sys.path.insert(0, os.path.dirname(script))
+    rc = 0
+    try:
+        # Every generator module refers to the cfg object built at import time, construct
+        # it again from the job arguments instead of creating a new one
+        vars(cfg).clear()
+        cfg.__init__()
+        if cfg.argv.target != server_target:
+            print("Generator server is running {}, cannot generate a {} test".format(
+                server_target, cfg.argv.target))
+            return 1
+        runpy.run_path(script, run_name = "__main__")
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            rc = e.code
+        elif e.code is not None:
+            print(e.code)
+            rc = 1
+    except BaseException:
+        traceback.print_exc()
+        rc = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return rc
+
+
+# Run one job in a forked process, so that nothing it changes reaches the next jobs.
+# The job is killed when the client connection conn is closed, like run.py does when
+# another job fails. Returns the exit code, None if the job timed out or was killed,
+# and the output of the job
+def run_job(script, args, timeout_s, conn = None):
+    with tempfile.TemporaryFile() as log:
+        pid = os.fork()
+        if pid == 0:
+            # Own process group, the generator workers are killed with it on timeout
+            os.setpgid(0, 0)
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+            os._exit(run_test(script, args))
+        deadline = time.time() + timeout_s if timeout_s else None
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                rc = os.waitstatus_to_exitcode(status)
+                break
+            if (deadline and time.time() > deadline) or is_closed(conn):
+                os.killpg(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                rc = None
+                break
+            time.sleep(0.05)
+        log.seek(0)
+        return rc, log.read().decode(errors = "replace")
+
+
+# The client sends nothing after its request, a readable connection has been closed
+def is_closed(conn):
+    if conn is None or not select.select([conn], [], [], 0)[0]:
+        return False
+    try:
+        return not conn.recv(1, socket.MSG_PEEK)
+    except OSError:
+        return True
+
+
+# A request is one JSON line {"script", "args", "timeout"}, the reply one JSON line
+# {"rc", "output"}
+class riscv_gen_handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        req = json.loads(self.rfile.readline())
+        rc, output = run_job(req["script"], req["args"], req.get("timeout"),
+                             self.connection)
+        try:
+            self.wfile.write(json.dumps({"rc": rc, "output": output}).encode() + b"\n")
+        except OSError:
+            # The client is gone
+            pass
+
+
+# Every connection is handled in a fork of the server, which already imported the
+# generator modules and built the instruction prototypes of the target
+class riscv_gen_server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    max_children = 256
+
+    def __init__(self, socket_path):
+        super().__init__(socket_path, riscv_gen_handler)
+        self.parent_pid = os.getppid()
+
+    # Stop when the run.py process that started the server is gone
+    def service_actions(self):
+        super().service_actions()
+        if os.getppid() != self.parent_pid:
+            sys.exit(0)
+
+
+def main():
+    global server_target
+    parse = argparse.ArgumentParser()
+    parse.add_argument('--socket', help = 'Unix socket the server listens on', required = True)
+    parse.add_argument('--target', help = 'target', default = "rv32imc")
+    argv = parse.parse_args()
+    server_target = argv.target
+    # The generator configuration is parsed from sys.argv on import, load the modules for
+    # the target without running any test
+    sys.argv = [sys.argv[0], "--target", argv.target, "--gen_test", "riscv_gen_server"]
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import pygen_src.test.riscv_instr_base_test  # NOQA
+    from pygen_src.isa.riscv_instr import riscv_instr
+    riscv_instr.create_instr_prototypes()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with riscv_gen_server(argv.socket) as server:
+        print("Generator server for {} listening on {}".format(argv.target, argv.socket))
+        sys.stdout.flush()
+        server.serve_forever(poll_interval = 1)
+
+
+if __name__ == "__main__":
+    main()
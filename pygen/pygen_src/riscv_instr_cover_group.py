@@ -18,7 +18,30 @@ from pygen_src.isa.riscv_cov_instr import *
 
 
 class riscv_instr_cover_group:
-    def __init__(self):
+    # ISA extension of the covergroups which are not tied to a single instruction,
+    # and of the instruction covergroups missing from the instruction attribute table
+    cg_group = {
+        "opcode_cg": riscv_instr_group_t.RV32I,
+        "rv32i_misc_cg": riscv_instr_group_t.RV32I,
+        "mepc_alignment_cg": riscv_instr_group_t.RV32I,
+        "hint_cg": riscv_instr_group_t.RV32C,
+        "illegal_compressed_instr_cg": riscv_instr_group_t.RV32C,
+        "fcvt_l_s_cg": riscv_instr_group_t.RV64F,
+        "fcvt_lu_s_cg": riscv_instr_group_t.RV64F,
+        "fcvt_s_l_cg": riscv_instr_group_t.RV64F,
+        "fcvt_s_lu_cg": riscv_instr_group_t.RV64F,
+        "fcvt_l_d_cg": riscv_instr_group_t.RV64D,
+        "fcvt_lu_d_cg": riscv_instr_group_t.RV64D,
+        "fcvt_d_l_cg": riscv_instr_group_t.RV64D,
+        "fcvt_d_lu_cg": riscv_instr_group_t.RV64D,
+        "fmv_x_d_cg": riscv_instr_group_t.RV64D,
+        "fmv_d_x_cg": riscv_instr_group_t.RV64D,
+    }
+    # Micro-architecture related covergroups, removed in compliance mode
+    non_compliance_cg = ("rv32i_misc_cg", "mepc_alignment_cg", "hint_cg",
+                         "illegal_compressed_instr_cg")
+
+    def __init__(self, compliance_mode=0, cov_isa=None):
         self.pre_instr = riscv_cov_instr()
         self.cfg = None
         self.instr_list = []
@@ -34,8 +57,11 @@ class riscv_instr_cover_group:
         is sampled.
         '''
         self.compliance_mode = vsc.bit_t(1)
+        self.compliance_mode.set_val(int(compliance_mode))
         self.select_isa = vsc.bit_t(1)  # Select an ISA extension to cover
-        self.cov_isa = None
+        self.select_isa.set_val(int(cov_isa is not None))
+        self.cov_isa = cov_isa
+        # The covergroup table depends on the mode and the covered ISA
         self.cg_instantiation()
 
     '''Format specific covergroups'''
@@ -7927,157 +7953,211 @@ class riscv_instr_cover_group:
                 lambda: self.instr.fs1_value[62:pkg_ins.DOUBLE_PRECISION_FRACTION_BITS - 1] == 0,
                 cp_t=vsc.bit_t(), options = dict(weight = not precision),type_options = dict(weight = not precision))
 
+    # Build the covergroup dispatch table. A covergroup is only created the first
+    # time it is sampled, and the covergroups of the ISA extensions which are not
+    # covered are left out up front
     def cg_instantiation(self):
-        self.opcode_cg_i = self.opcode_cg()
-        self.csrrw_cg_i = self.csrrw_cg()
-        self.rv32i_misc_cg_i = self.rv32i_misc_cg()
-        self.mepc_alignment_cg_i = self.mepc_alignment_cg()
-        # self.compressed_opcode_cg_i = self.compressed_opcode_cg()
-        self.beq_cg_i = self.beq_cg()
-        self.jal_cg_i = self.jal_cg()
-        self.lui_cg_i = self.lui_cg()
-        self.addi_cg_i = self.addi_cg()
-        self.auipc_cg_i = self.auipc_cg()
-        self.ori_cg_i = self.ori_cg()
-        self.add_cg_i = self.add_cg()
-        self.sub_cg_i = self.sub_cg()
-        self.sra_cg_i = self.sra_cg()
-        self.andi_cg_i = self.andi_cg()
-        self.srli_cg_i = self.srli_cg()
-        self.and_cg_i = self.and_cg()
-        self.srl_cg_i = self.srl_cg()
-        self.sll_cg_i = self.sll_cg()
-        self.xor_cg_i = self.xor_cg()
-        self.or_cg_i = self.or_cg()
-        self.sltu_cg_i = self.sltu_cg()
-        self.sltiu_cg_i = self.sltiu_cg()
-        self.xori_cg_i = self.xori_cg()
-        self.slti_cg_i = self.slti_cg()
-        self.srai_cg_i = self.srai_cg()
-        self.slt_cg_i = self.slt_cg()
-        self.slli_cg_i = self.slli_cg()
-        self.mul_cg_i = self.mul_cg()
-        self.mulh_cg_i = self.mulh_cg()
-        self.mulhsu_cg_i = self.mulhsu_cg()
-        self.mulhu_cg_i = self.mulhu_cg()
-        self.div_cg_i = self.div_cg()
-        self.divu_cg_i = self.divu_cg()
-        self.rem_cg_i = self.rem_cg()
-        self.remu_cg_i = self.remu_cg()
-        self.c_lw_cg_i = self.c_lw_cg()
-        self.c_lwsp_cg_i = self.c_lwsp_cg()
-        self.c_sw_cg_i = self.c_sw_cg()
-        self.c_swsp_cg_i = self.c_swsp_cg()
-        self.c_addi4spn_cg_i = self.c_addi4spn_cg()
-        self.c_addi_cg_i = self.c_addi_cg()
-        self.c_addi16sp_cg_i = self.c_addi16sp_cg()
-        self.c_li_cg_i = self.c_li_cg()
-        self.c_lui_cg_i = self.c_lui_cg()
-        self.c_sub_cg_i = self.c_sub_cg()
-        self.c_add_cg_i = self.c_add_cg()
-        self.c_mv_cg_i = self.c_mv_cg()
-        self.c_andi_cg_i = self.c_andi_cg()
-        self.c_xor_cg_i = self.c_xor_cg()
-        self.c_or_cg_i = self.c_or_cg()
-        self.c_and_cg_i = self.c_and_cg()
-        self.c_beqz_cg_i = self.c_beqz_cg()
-        self.c_bnez_cg_i = self.c_bnez_cg()
-        self.c_srli_cg_i = self.c_srli_cg()
-        self.c_srai_cg_i = self.c_srai_cg()
-        self.c_slli_cg_i = self.c_slli_cg()
-        self.c_j_cg_i = self.c_j_cg()
-        self.c_jal_cg_i = self.c_jal_cg()
-        self.c_jr_cg_i = self.c_jr_cg()
-        self.c_jalr_cg_i = self.c_jalr_cg()
-        self.hint_cg_i = self.hint_cg()
-        self.illegal_compressed_instr_cg_i = self.illegal_compressed_instr_cg()
-        self.flw_cg_i = self.flw_cg(1, 0)
-        self.fld_cg_i = self.fld_cg(0)
-        self.fsw_cg_i = self.fsw_cg(1)
-        self.fsw_cg_i = self.fsw_cg(0)
-        self.fadd_s_cg_i = self.fadd_s_cg(1)
-        self.fadd_d_cg_i = self.fadd_d_cg(0)
-        self.fsub_s_cg_i = self.fsub_s_cg(1)
-        self.fsub_d_cg_i = self.fsub_d_cg(0)
-        self.fmul_s_cg_i = self.fmul_s_cg(1)
-        self.fmul_d_cg_i = self.fmul_d_cg(0)
-        self.fdiv_s_cg_i = self.fdiv_s_cg(1)
-        self.fdiv_d_cg_i = self.fdiv_d_cg(0)
-        self.fsqrt_s_cg_i = self.fsqrt_s_cg(1)
-        self.fsqrt_d_cg_i = self.fsqrt_d_cg(0)
-        self.fmin_s_cg_i = self.fmin_s_cg(1)
-        self.fmin_d_cg_i = self.fmin_d_cg(0)
-        self.fmax_s_cg_i = self.fmax_s_cg(1)
-        self.fmax_d_cg_i = self.fmax_d_cg(0)
-        self.fmadd_s_cg_i = self.fmadd_s_cg(1)
-        self.fmadd_d_cg_i = self.fmadd_d_cg(0)
-        self.fnmadd_s_cg_i = self.fnmadd_s_cg(1)
-        self.fnmadd_d_cg_i = self.fnmadd_d_cg(0)
-        self.fmsub_s_cg_i = self.fmsub_s_cg(1)
-        self.fmsub_d_cg_i = self.fmsub_d_cg(0)
-        self.fnmsub_s_cg_i = self.fnmsub_s_cg(1)
-        self.fnmsub_d_cg_i = self.fnmsub_d_cg(0)
-        self.fcvt_s_d_cg_i = self.fcvt_s_d_cg()
-        self.fcvt_d_s_cg_i = self.fcvt_d_s_cg()
-        self.fcvt_w_s_cg_i = self.fcvt_w_s_cg(1,'sign')
-        self.fcvt_wu_s_cg_i = self.fcvt_wu_s_cg(1,'unsign')
-        self.fcvt_l_s_cg_i = self.fcvt_l_s_cg(1,'sign')
-        self.fcvt_lu_s_cg_i = self.fcvt_lu_s_cg(1,'unsign')
-        self.fcvt_l_d_cg_i = self.fcvt_l_d_cg(0,'sign')
-        self.fcvt_lu_d_cg_i = self.fcvt_lu_d_cg(0,'unsign')
-        self.fcvt_w_d_cg_i = self.fcvt_w_d_cg(0,'sign')
-        self.fcvt_wu_d_cg_i = self.fcvt_wu_d_cg(0,'unsign')
-        self.fcvt_s_w_cg_i = self.fcvt_s_w_cg(1,'sign')
-        self.fcvt_s_wu_cg_i = self.fcvt_s_wu_cg(1,'unsign')
-        self.fcvt_s_l_cg_i = self.fcvt_s_l_cg(1,'sign')
-        self.fcvt_d_l_cg_i = self.fcvt_d_l_cg(1,'sign')
-        self.fcvt_s_lu_cg_i = self.fcvt_s_lu_cg(1,'unsign')
-        self.fcvt_d_w_cg_i = self.fcvt_d_w_cg(0,'sign')
-        self.fcvt_d_lu_cg_i = self.fcvt_d_lu_cg(0,'unsign')
-        self.fcvt_d_wu_cg_i = self.fcvt_d_wu_cg(0,'unsign')
-        self.fsgnj_s_cg_i = self.fsgnj_s_cg(1)
-        self.fsgnj_d_cg_i = self.fsgnj_d_cg(0)
-        self.fsgnjn_s_cg_i = self.fsgnjn_s_cg(1)
-        self.fsgnjn_d_cg_i = self.fsgnjn_d_cg(0)
-        self.fsgnjx_s_cg_i = self.fsgnjx_s_cg(1)
-        self.fsgnjx_d_cg_i = self.fsgnjx_d_cg(0)
-        self.fmv_x_w_cg_i = self.fmv_x_w_cg(1)
-        self.fmv_x_d_cg_i = self.fmv_x_d_cg(0)
-        self.fmv_w_x_cg_i = self.fmv_w_x_cg(1)
-        self.fmv_d_x_cg_i = self.fmv_d_x_cg(0)
-        self.feq_s_cg_i = self.feq_s_cg(1)
-        self.feq_d_cg_i = self.feq_d_cg(0)
-        self.flt_s_cg_i = self.flt_s_cg(1)
-        self.flt_d_cg_i = self.flt_d_cg(0)
-        self.fle_s_cg_i = self.fle_s_cg(1)
-        self.fle_d_cg_i = self.fle_d_cg(0)
-        self.fclass_s_cg_i = self.fclass_s_cg(1)
-        self.fclass_d_cg_i = self.fclass_d_cg(0)
-        self.mulw_cg_i = self.mulw_cg()
-        self.divw_cg_i = self.divw_cg()
-        self.divuw_cg_i = self.divuw_cg()
-        self.remw_cg_i = self.remw_cg()
-        self.remuw_cg_i = self.remuw_cg()
-        self.c_addiw_cg_i = self.c_addiw_cg()
-        self.c_subw_cg_i = self.c_subw_cg()
-        self.c_addw_cg_i = self.c_addw_cg()
-        self.c_ld_cg_i = self.c_ld_cg()
-        self.c_sd_cg_i = self.c_sd_cg()
-        self.c_ldsp_cg_i = self.c_ldsp_cg()
-        self.c_sdsp_cg_i = self.c_sdsp_cg()
-        self.lwu_cg_i = self.lwu_cg()
-        self.ld_cg_i = self.ld_cg()
-        self.sd_cg_i = self.sd_cg()
-        self.addiw_cg_i = self.addiw_cg()
-        self.slliw_cg_i = self.slliw_cg()
-        self.srliw_cg_i = self.srliw_cg()
-        self.sraiw_cg_i = self.sraiw_cg()
-        self.addw_cg_i = self.addw_cg()
-        self.subw_cg_i = self.subw_cg()
-        self.sllw_cg_i = self.sllw_cg()
-        self.srlw_cg_i = self.srlw_cg()
-        self.sraw_cg_i = self.sraw_cg()
-
+        cg_list = [
+            ("opcode_cg", ()),
+            ("csrrw_cg", ()),
+            ("rv32i_misc_cg", ()),
+            ("mepc_alignment_cg", ()),
+            # ("compressed_opcode_cg", ()),
+            ("beq_cg", ()),
+            ("jal_cg", ()),
+            ("lui_cg", ()),
+            ("addi_cg", ()),
+            ("auipc_cg", ()),
+            ("ori_cg", ()),
+            ("add_cg", ()),
+            ("sub_cg", ()),
+            ("sra_cg", ()),
+            ("andi_cg", ()),
+            ("srli_cg", ()),
+            ("and_cg", ()),
+            ("srl_cg", ()),
+            ("sll_cg", ()),
+            ("xor_cg", ()),
+            ("or_cg", ()),
+            ("sltu_cg", ()),
+            ("sltiu_cg", ()),
+            ("xori_cg", ()),
+            ("slti_cg", ()),
+            ("srai_cg", ()),
+            ("slt_cg", ()),
+            ("slli_cg", ()),
+            ("mul_cg", ()),
+            ("mulh_cg", ()),
+            ("mulhsu_cg", ()),
+            ("mulhu_cg", ()),
+            ("div_cg", ()),
+            ("divu_cg", ()),
+            ("rem_cg", ()),
+            ("remu_cg", ()),
+            ("c_lw_cg", ()),
+            ("c_lwsp_cg", ()),
+            ("c_sw_cg", ()),
+            ("c_swsp_cg", ()),
+            ("c_addi4spn_cg", ()),
+            ("c_addi_cg", ()),
+            ("c_addi16sp_cg", ()),
+            ("c_li_cg", ()),
+            ("c_lui_cg", ()),
+            ("c_sub_cg", ()),
+            ("c_add_cg", ()),
+            ("c_mv_cg", ()),
+            ("c_andi_cg", ()),
+            ("c_xor_cg", ()),
+            ("c_or_cg", ()),
+            ("c_and_cg", ()),
+            ("c_beqz_cg", ()),
+            ("c_bnez_cg", ()),
+            ("c_srli_cg", ()),
+            ("c_srai_cg", ()),
+            ("c_slli_cg", ()),
+            ("c_j_cg", ()),
+            ("c_jal_cg", ()),
+            ("c_jr_cg", ()),
+            ("c_jalr_cg", ()),
+            ("hint_cg", ()),
+            ("illegal_compressed_instr_cg", ()),
+            ("flw_cg", (1, 0)),
+            ("fld_cg", (0,)),
+            ("fsw_cg", (0,)),
+            ("fadd_s_cg", (1,)),
+            ("fadd_d_cg", (0,)),
+            ("fsub_s_cg", (1,)),
+            ("fsub_d_cg", (0,)),
+            ("fmul_s_cg", (1,)),
+            ("fmul_d_cg", (0,)),
+            ("fdiv_s_cg", (1,)),
+            ("fdiv_d_cg", (0,)),
+            ("fsqrt_s_cg", (1,)),
+            ("fsqrt_d_cg", (0,)),
+            ("fmin_s_cg", (1,)),
+            ("fmin_d_cg", (0,)),
+            ("fmax_s_cg", (1,)),
+            ("fmax_d_cg", (0,)),
+            ("fmadd_s_cg", (1,)),
+            ("fmadd_d_cg", (0,)),
+            ("fnmadd_s_cg", (1,)),
+            ("fnmadd_d_cg", (0,)),
+            ("fmsub_s_cg", (1,)),
+            ("fmsub_d_cg", (0,)),
+            ("fnmsub_s_cg", (1,)),
+            ("fnmsub_d_cg", (0,)),
+            ("fcvt_s_d_cg", ()),
+            ("fcvt_d_s_cg", ()),
+            ("fcvt_w_s_cg", (1, 'sign')),
+            ("fcvt_wu_s_cg", (1, 'unsign')),
+            ("fcvt_l_s_cg", (1, 'sign')),
+            ("fcvt_lu_s_cg", (1, 'unsign')),
+            ("fcvt_l_d_cg", (0, 'sign')),
+            ("fcvt_lu_d_cg", (0, 'unsign')),
+            ("fcvt_w_d_cg", (0, 'sign')),
+            ("fcvt_wu_d_cg", (0, 'unsign')),
+            ("fcvt_s_w_cg", (1, 'sign')),
+            ("fcvt_s_wu_cg", (1, 'unsign')),
+            ("fcvt_s_l_cg", (1, 'sign')),
+            ("fcvt_d_l_cg", (1, 'sign')),
+            ("fcvt_s_lu_cg", (1, 'unsign')),
+            ("fcvt_d_w_cg", (0, 'sign')),
+            ("fcvt_d_lu_cg", (0, 'unsign')),
+            ("fcvt_d_wu_cg", (0, 'unsign')),
+            ("fsgnj_s_cg", (1,)),
+            ("fsgnj_d_cg", (0,)),
+            ("fsgnjn_s_cg", (1,)),
+            ("fsgnjn_d_cg", (0,)),
+            ("fsgnjx_s_cg", (1,)),
+            ("fsgnjx_d_cg", (0,)),
+            ("fmv_x_w_cg", (1,)),
+            ("fmv_x_d_cg", (0,)),
+            ("fmv_w_x_cg", (1,)),
+            ("fmv_d_x_cg", (0,)),
+            ("feq_s_cg", (1,)),
+            ("feq_d_cg", (0,)),
+            ("flt_s_cg", (1,)),
+            ("flt_d_cg", (0,)),
+            ("fle_s_cg", (1,)),
+            ("fle_d_cg", (0,)),
+            ("fclass_s_cg", (1,)),
+            ("fclass_d_cg", (0,)),
+            ("mulw_cg", ()),
+            ("divw_cg", ()),
+            ("divuw_cg", ()),
+            ("remw_cg", ()),
+            ("remuw_cg", ()),
+            ("c_addiw_cg", ()),
+            ("c_subw_cg", ()),
+            ("c_addw_cg", ()),
+            ("c_ld_cg", ()),
+            ("c_sd_cg", ()),
+            ("c_ldsp_cg", ()),
+            ("c_sdsp_cg", ()),
+            ("lwu_cg", ()),
+            ("ld_cg", ()),
+            ("sd_cg", ()),
+            ("addiw_cg", ()),
+            ("slliw_cg", ()),
+            ("srliw_cg", ()),
+            ("sraiw_cg", ()),
+            ("addw_cg", ()),
+            ("subw_cg", ()),
+            ("sllw_cg", ()),
+            ("srlw_cg", ()),
+            ("sraw_cg", ()),
+        ]
+        # Arguments of the enabled covergroups, keyed by covergroup name
+        self.cg_args = {name: args for name, args in cg_list
+                        if self.is_cg_enabled(name)}
+        self.cg_inst = {}
+        # Covergroup of every instruction, keyed by riscv_instr_name_t
+        self.instr_cg_name = {}
+        for instr_name in riscv_instr_name_t:
+            name = instr_name.name.lower() + "_cg"
+            if name in self.cg_args:
+                self.instr_cg_name[instr_name] = name
+
+    # ISA extension of a covergroup, the one of its instruction for the instruction
+    # covergroups
+    def get_cg_group(self, name):
+        if name in self.cg_group:
+            return self.cg_group[name]
+        instr_name = name[:-len("_cg")].upper()
+        attr_list = instr_attr_table[riscv_instr_name_t[instr_name]]
+        return attr_list[2]
+
+    def is_cg_enabled(self, name):
+        group = self.get_cg_group(name)
+        if group not in rcs.supported_isa:
+            return False
+        if (self.select_isa.get_val() and self.cov_isa is not None and
+                group != self.cov_isa):
+            return False
+        if self.compliance_mode.get_val() and name in self.non_compliance_cg:
+            return False
+        return True
+
+    # Get a covergroup, created on first use. Returns None for the covergroups which
+    # are not enabled
+    def get_cg(self, name):
+        cg = self.cg_inst.get(name)
+        if cg is None and name in self.cg_args:
+            cg = getattr(self, name)(*self.cg_args[name])
+            self.cg_inst[name] = cg
+        return cg
+
+    def sample_cg(self, name, instr):
+        cg = self.get_cg(name)
+        if cg is not None:
+            cg.instr = instr
+            cg.sample()
+
+    # Create the enabled covergroups which were never sampled, so that the coverage
+    # report lists all of them
+    def create_unsampled_cg(self):
+        for name in self.cg_args:
+            self.get_cg(name)
 
     def sample(self, instr):
         self.instr_cnt += 1
@@ -8085,20 +8165,14 @@ class riscv_instr_cover_group:
             instr.check_hazard_condition(self.pre_instr)
         # TODO: sampling for compressed_instr_cg
         if ((instr.binary[1:0] != 3) and (riscv_instr_group_t.RV32C in rcs.supported_isa)):
-            # self.compressed_opcode_cg_i.instr = instr
-            # self.compressed_opcode_cg_i.sample()
-            self.hint_cg_i.instr = instr
-            self.hint_cg_i.sample()
-            self.illegal_compressed_instr_cg_i.instr = instr
-            self.illegal_compressed_instr_cg_i.sample()
+            # self.sample_cg("compressed_opcode_cg", instr)
+            self.sample_cg("hint_cg", instr)
+            self.sample_cg("illegal_compressed_instr_cg", instr)
 
         if instr.binary[1:0] == 3:
-            self.opcode_cg_i.instr = instr
-            self.opcode_cg_i.sample()
+            self.sample_cg("opcode_cg", instr)
         try:
-            setattr(eval("self." + instr.instr.name.lower() + "_cg_i"),
-                    'instr', instr)
-            eval("self." + instr.instr.name.lower() + "_cg_i" + ".sample()")
+            self.sample_cg(self.instr_cg_name[instr.instr], instr)
         except Exception:
             logging.info("Covergroup for instr {} is not supported yet".format(
                 instr.instr.name))
@@ -8106,13 +8180,11 @@ class riscv_instr_cover_group:
             logging.info("Traceback error log: {}".format(traceback.format_exc()))
 
         if instr.group.name == "RV32I":
-            self.rv32i_misc_cg_i.instr = instr
-            self.rv32i_misc_cg_i.sample()
+            self.sample_cg("rv32i_misc_cg", instr)
         if instr.category.name == "CSR":
             # MEPC
             if instr.csr == 833:
-                self.mepc_alignment_cg_i.instr = instr
-                self.mepc_alignment_cg_i.sample()
+                self.sample_cg("mepc_alignment_cg", instr)
         self.pre_instr = instr
 
     def reset(self):
@@ -173,6 +173,8 @@ class riscv_instr_gen_config:
         self.num_of_sub_program = self.argv.num_of_sub_program
         self.instr_cnt = self.argv.instr_cnt
         self.num_of_tests = self.argv.num_of_tests
+        # Number of processes generating the tests, 0 for one per CPU
+        self.num_of_workers = self.argv.num_of_workers
         # For tests doesn't involve load/store, the data section generation could be skipped
         self.no_data_page = self.argv.no_data_page
         # Options to turn off some specific types of instructions
@@ -211,6 +213,15 @@ class riscv_instr_gen_config:
                 logging.error("Illegal boot mode option - {}".format(self.boot_mode_opts))
         self.enable_page_table_exception = self.argv.enable_page_table_exception
         self.no_directed_instr = self.argv.no_directed_instr
+        # Pick GPR operands of random instructions from precomputed legal register tables
+        # instead of calling the constraint solver for every instruction
+        self.fast_gpr_randomization = self.argv.fast_gpr_randomization
+        # Assemble and link the generated program in Python, writing the .o and .bin next
+        # to the assembly file
+        self.direct_binary = self.argv.direct_binary
+        # Write the data pages to binary files next to the assembly file and include them
+        # with .incbin instead of .word rows
+        self.data_page_incbin = self.argv.data_page_incbin
         self.asm_test_suffix = self.argv.asm_test_suffix
         # Enable interrupt bit in MSTATUS (MIE, SIE, UIE)
         self.enable_interrupt = self.argv.enable_interrupt
@@ -548,6 +559,7 @@ class riscv_instr_gen_config:
     def parse_args(self):
         parse = argparse.ArgumentParser()
         parse.add_argument('--num_of_tests', help = 'num_of_tests', type = int, default = 1)
+        parse.add_argument('--num_of_workers', help = 'num_of_workers', type = int, default = 0)
         parse.add_argument('--enable_page_table_exception',
                            help = 'enable_page_table_exception', type = int, default = 0)
         parse.add_argument('--enable_interrupt', help = 'enable_interrupt',
@@ -591,6 +603,12 @@ class riscv_instr_gen_config:
                            choices = [0, 1], type = int, default = 0)
         parse.add_argument('--no_directed_instr', help = 'no_directed_instr',
                            choices = [0, 1], type = int, default = 0)
+        parse.add_argument('--fast_gpr_randomization', help = 'fast_gpr_randomization',
+                           choices = [0, 1], type = int, default = 0)
+        parse.add_argument('--direct_binary', help = 'direct_binary',
+                           choices = [0, 1], type = int, default = 0)
+        parse.add_argument('--data_page_incbin', help = 'data_page_incbin',
+                           choices = [0, 1], type = int, default = 0)
         parse.add_argument('--no_fence', help = 'no_fence',
                            choices = [0, 1], type = int, default = 1)
         parse.add_argument('--no_delegation', help = 'no_delegation',
@@ -663,6 +681,12 @@ class riscv_instr_gen_config:
         parse.add_argument("--enable_visualization", action="store_true", default=False,
                            help="Enabling coverage report visualization for pyflow")
         parse.add_argument('--trace_csv', help='List of csv traces', default="")
+        parse.add_argument("--compliance_mode", action="store_true", default=False,
+                           help="Only sample the coverage related to RISC-V "
+                                "specification compliance")
+        parse.add_argument('--cov_isa', help='Only cover this ISA extension',
+                           choices=[i.name for i in riscv_instr_group_t],
+                           default=None)
         parse.add_argument('--seed', help='Seed value', default=None)
         args, unknown = parse.parse_known_args()
         # TODO
@@ -1371,7 +1371,10 @@ def get_val(in_string, hexa=0):
     return out_val
 
 
-def get_attr_list(instr_name):
+# Attribute table indexed by the riscv_instr_name_t value, every entry is the
+# (format, category, group, imm_type) tuple of an instruction decoded by the
+# coverage model, None for the other instructions
+def build_instr_attr_table():
     switcher = {
         # LOAD instructions
         riscv_instr_name_t.LB: [riscv_instr_format_t.I_FORMAT,
@@ -1890,9 +1893,21 @@ def get_attr_list(instr_name):
                                     riscv_instr_category_t.STORE,
                                     riscv_instr_group_t.RV64C, imm_t.UIMM],
     }
-    # if instruction is not present in the dictionary,second argument well
-    # be assigned as default value of passed argument
-    attr_list = switcher.get(instr_name, "Cannot find instruction")
+    table = [None] * (max(riscv_instr_name_t) + 1)
+    for instr_name, attr_list in switcher.items():
+        imm_type = attr_list[3] if len(attr_list) > 3 else imm_t.IMM
+        table[instr_name] = (attr_list[0], attr_list[1], attr_list[2], imm_type)
+    return tuple(table)
+
+
+# Built once at import, looking up an instruction is a tuple index
+instr_attr_table = build_instr_attr_table()
+
+
+def get_attr_list(instr_name):
+    attr_list = instr_attr_table[instr_name]
+    if attr_list is None:
+        return "Cannot find instruction"
     return attr_list
 
 
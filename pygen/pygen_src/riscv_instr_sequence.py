@@ -135,8 +135,7 @@ class riscv_instr_sequence:
         j = 0
         branch_target = defaultdict(lambda: None)
         # Insert directed instructions, it's randomly mixed with the random instruction stream.
-        for instr in self.directed_instr:
-            self.instr_stream.insert_instr_stream(instr.instr_list)
+        self.instr_stream.insert_instr_streams([instr.instr_list for instr in self.directed_instr])
         # Assign an index for all instructions, these indexes wont change
         # even a new instruction is injected in the post process.
         for i in range(len(self.instr_stream.instr_list)):
@@ -76,21 +76,13 @@ class riscv_instr_stream:
             return
 
         if idx == -1:
-            idx = random.randint(0, current_instr_cnt - 1)
-            # cares must be taken to avoid targeting
-            # an atomic instruction (while atomic, find a new idx)
-            for i in range(10):
-                if self.instr_list[idx].atomic:
-                    break
-                idx = random.randint(0, current_instr_cnt - 1)
-            if self.instr_list[idx].atomic:
-                for i in range(len(self.instr_list)):
-                    if not self.instr_list[i].atomic:
-                        idx = i
-                        break
-                if self.instr_list[idx].atomic:
-                    logging.critical("Cannot inject the instruction")
-                    sys.exit(1)
+            # cares must be taken to avoid targeting an atomic instruction
+            non_atomic_idx = [i for i in range(current_instr_cnt)
+                              if not self.instr_list[i].atomic]
+            if len(non_atomic_idx) == 0:
+                logging.critical("Cannot inject the instruction")
+                sys.exit(1)
+            idx = random.choice(non_atomic_idx)
         elif idx > current_instr_cnt or idx < 0:
             logging.error("Cannot insert instr stream at idx {}".format(idx))
             sys.exit(1)
@@ -100,17 +92,18 @@ class riscv_instr_stream:
         if replace:
             new_instr[0].label = self.instr_list[idx].label
             new_instr[0].has_label = self.instr_list[idx].has_label
-            if idx == 0:
-                self.instr_list = new_instr + self.instr_list[idx + 1:current_instr_cnt]
-            else:
-                self.instr_list = self.instr_list[0:idx] + new_instr + \
-                    self.instr_list[idx + 1:current_instr_cnt]
+            self.instr_list[idx:idx + 1] = new_instr
         else:
-            if idx == 0:
-                self.instr_list = new_instr + self.instr_list[idx:current_instr_cnt]
-            else:
-                self.instr_list = self.instr_list[0:idx] + new_instr + \
-                    self.instr_list[idx:current_instr_cnt]
+            self.instr_list[idx:idx] = new_instr
+
+    # Insert each of the instruction streams at a random non-atomic location, same as calling
+    # insert_instr_stream(new_instr) for them in order. The instruction list is only rebuilt
+    # once, after all the streams have been placed.
+    def insert_instr_streams(self, new_instr_list):
+        instr_list = riscv_instr_insert_list(self.instr_list)
+        for new_instr in new_instr_list:
+            instr_list.insert_instr_stream(new_instr)
+        self.instr_list = instr_list.to_list()
 
     # Mix the input instruction stream with the original instruction, the instruction order is
     # preserved. When 'contained' is set, the original instruction stream will be inside the
@@ -131,8 +124,22 @@ class riscv_instr_stream:
             insert_instr_position[0] = 0
             if new_instr_cnt > 1:
                 insert_instr_position[new_instr_cnt - 1] = current_instr_cnt - 1
-        for i in range(len(new_instr)):
-            self.insert_instr(new_instr[i], insert_instr_position[i] + i)
+        if insert_instr_position != sorted(insert_instr_position):
+            # 'contained' moved the last position below the random ones
+            for i in range(len(new_instr)):
+                self.insert_instr(new_instr[i], insert_instr_position[i] + i)
+            return
+        # Merge both streams in one pass, new_instr[i] goes right before the original
+        # instruction at insert_instr_position[i]
+        instr_list = []
+        j = 0
+        for i in range(current_instr_cnt):
+            while j < new_instr_cnt and insert_instr_position[j] == i:
+                instr_list.append(new_instr[j])
+                j += 1
+            instr_list.append(self.instr_list[i])
+        instr_list.extend(new_instr[j:])
+        self.instr_list = instr_list
 
     def convert2string(self):
         s = ""
@@ -141,6 +148,46 @@ class riscv_instr_stream:
         return s
 
 
+# Instruction list with cheap insertion of instruction streams in front of any non-atomic
+# instruction. Inserted streams are kept aside, keyed by the instruction they precede, and
+# spliced in when the final list is built by to_list().
+class riscv_instr_insert_list:
+    def __init__(self, instr_list):
+        self.instr_list = instr_list
+        # Instructions an instruction stream can be inserted in front of
+        self.non_atomic_instr = [instr for instr in instr_list if not instr.atomic]
+        self.pending_instr = {}
+
+    def insert_instr_stream(self, new_instr):
+        if len(self.instr_list) == 0:
+            self.instr_list = new_instr
+            self.non_atomic_instr = [instr for instr in new_instr if not instr.atomic]
+            return
+        if len(self.non_atomic_instr) == 0:
+            logging.critical("Cannot inject the instruction")
+            sys.exit(1)
+        instr = random.choice(self.non_atomic_instr)
+        self.pending_instr.setdefault(id(instr), []).append(new_instr)
+        self.non_atomic_instr.extend(instr for instr in new_instr if not instr.atomic)
+
+    def to_list(self):
+        instr_list = []
+        # Streams inserted in front of an instruction may themselves hold insertion points
+        stack = [iter(self.instr_list)]
+        while len(stack) > 0:
+            instr = next(stack[-1], stack)
+            if instr is stack:
+                stack.pop()
+                continue
+            new_instr = self.pending_instr.pop(id(instr), None)
+            if new_instr is None:
+                instr_list.append(instr)
+            else:
+                stack.append(iter([instr]))
+                stack.extend(iter(instr_stream) for instr_stream in reversed(new_instr))
+        return instr_list
+
+
 # Generate a random instruction stream based on the configuration
 # There are two ways to use this class to generate instruction stream
 # 1. For short instruction stream, you can call randomize() directly.
@@ -164,7 +211,7 @@ class riscv_rand_instr_stream(riscv_instr_stream):
             self.instr_list.append(None)
 
     def setup_allowed_instr(self, no_branch = 0, no_load_store = 1):
-        self.allowed_instr = riscv_instr.basic_instr
+        self.allowed_instr = list(riscv_instr.basic_instr)
         if no_branch == 0:
             self.allowed_instr.extend(
                 riscv_instr.instr_category[riscv_instr_category_t.BRANCH.name])
@@ -203,8 +250,12 @@ class riscv_rand_instr_stream(riscv_instr_stream):
 
     def gen_instr(self, no_branch = 0, no_load_store = 1, is_debug_program = 0):
         self.setup_allowed_instr(no_branch, no_load_store)
+        exclude_instr = self.get_exclude_instr(is_debug_program)
+        instr_batch = riscv_instr.get_rand_instr_batch(
+            len(self.instr_list), include_instr = self.allowed_instr,
+            exclude_instr = exclude_instr)
         for i in range(len(self.instr_list)):
-            self.instr_list[i] = self.randomize_instr(self.instr_list[i], is_debug_program)
+            self.instr_list[i] = self.randomize_gpr(instr_batch[i])
         # Do not allow branch instruction as the last instruction because there's no
         # forward branch target
         while self.instr_list[-1].category == riscv_instr_category_t.BRANCH:
@@ -213,6 +264,14 @@ class riscv_rand_instr_stream(riscv_instr_stream):
                 break
 
     def randomize_instr(self, instr, is_in_debug = 0, disable_dist = 0, include_group = []):
+        exclude_instr = self.get_exclude_instr(is_in_debug)
+        instr = riscv_instr.get_rand_instr(
+            include_instr = self.allowed_instr, exclude_instr = exclude_instr,
+            include_group = include_group)
+        instr = self.randomize_gpr(instr)
+        return instr
+
+    def get_exclude_instr(self, is_in_debug = 0):
         exclude_instr = []
         is_SP_in_reserved_rd = riscv_reg_t.SP in self.reserved_rd
         is_SP_in_reserved_regs = riscv_reg_t.SP in cfg.reserved_regs
@@ -232,13 +291,17 @@ class riscv_rand_instr_stream(riscv_instr_stream):
             elif (not cfg.no_ebreak and not cfg.enable_ebreak_in_debug_rom):
                 exclude_instr.extend([riscv_instr_name_t.EBREAK.name,
                                       riscv_instr_name_t.C_EBREAK.name])
-        instr = riscv_instr.get_rand_instr(
-            include_instr = self.allowed_instr, exclude_instr = exclude_instr,
-            include_group = include_group)
-        instr = self.randomize_gpr(instr)
-        return instr
+        return exclude_instr
 
     def randomize_gpr(self, instr):
+        if cfg.fast_gpr_randomization and instr.can_fast_randomize():
+            # The solver also randomizes the size of avail_regs, so read its elements from
+            # the model instead of iterating over the list
+            avail_regs = [int(reg.get_val()) for reg in self.avail_regs.get_model().field_l]
+            reserved_rd = [int(reg.get_val()) for reg in self.reserved_rd.get_model().field_l]
+            reserved_rd.extend(cfg.reserved_regs)
+            if instr.fast_randomize(avail_regs, reserved_rd):
+                return instr
         with instr.randomize_with() as it:
             with vsc.if_then(self.avail_regs.size > 0):
                 with vsc.if_then(instr.has_rs1):
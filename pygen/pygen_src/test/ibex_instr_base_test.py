@@ -7,13 +7,7 @@ class ibex_instr_base_test(riscv_instr_base_test):
 
     def _run_phase(self, num):
         logging.info("Called ibex_instr_base_test._run_phase")
-        if num == 0:
-            '''Get the user specified seed value otherwise
-               generate a random seed value from SeedGen method of run.py'''
-            rand_seed = cfg.argv.seed.split("--")[0]
-        else:
-            # Generate random seed value everytime for multiple test iterations
-            rand_seed = random.getrandbits(31)
+        rand_seed = self.get_seed(num)
         # Assign the global seed value for a particular iteration
         random.seed(rand_seed)
         self.randomize_cfg()
@@ -27,6 +21,7 @@ class ibex_instr_base_test(riscv_instr_base_test):
                                      num + self.start_idx)
         self.apply_directed_instr()
         logging.info("All directed instruction is applied")
+        self.asm.open_test_file(test_name)
         self.asm.gen_program()
         self.asm.gen_test_file(test_name)
         logging.info("TEST GENERATED USING SEED VALUE = {}".format(rand_seed))
@@ -32,13 +32,35 @@ class riscv_instr_base_test:
         self.start_idx = cfg.argv.start_idx
         self.asm_file_name = cfg.argv.asm_file_name
         self.asm = ""
+        # Get the user specified seed value, set by SeedGen in run.py, otherwise pick one
+        if cfg.argv.seed is not None:
+            self.base_seed = cfg.argv.seed.split("--")[0]
+        else:
+            self.base_seed = random.getrandbits(31)
 
     def run(self):
-        with multiprocessing.Pool(processes = cfg.num_of_tests) as pool:
-            ret = pool.map(self.run_phase, list(range(cfg.num_of_tests)))
+        num_of_workers = cfg.num_of_workers or multiprocessing.cpu_count()
+        num_of_workers = max(1, min(num_of_workers, cfg.num_of_tests))
+        # Build the instruction prototypes once before forking. Every test then runs in a
+        # fresh fork of this process: the PyVSC solver walks sets ordered by object
+        # address, so a worker reused across tests would not reproduce the same program
+        riscv_instr.create_instr_prototypes()
+        logging.info("Generating {} tests with {} workers".format(cfg.num_of_tests,
+                                                                  num_of_workers))
+        with multiprocessing.Pool(processes = num_of_workers, maxtasksperchild = 1) as pool:
+            ret = list(pool.imap(self.run_phase, range(cfg.num_of_tests), chunksize = 1))
         if 1 in ret:
             raise Exception("Test-generation jobs failed")
 
+    # The first test uses the base seed, the seeds of the others are derived from the base
+    # seed and the test index start_idx + num, so that any worker count generates the same
+    # tests and the batches of a test sharing a base seed don't repeat each other
+    def get_seed(self, num):
+        idx = self.start_idx + num
+        if idx == 0:
+            return self.base_seed
+        return random.Random("{}_{}".format(self.base_seed, idx)).getrandbits(31)
+
     def run_phase(self, num):
         try:
             self._run_phase(num)
@@ -48,13 +70,7 @@ class riscv_instr_base_test:
             return 1
 
     def _run_phase(self, num):
-        if num == 0:
-            '''Get the user specified seed value otherwise
-               generate a random seed value from SeedGen method of run.py'''
-            rand_seed = cfg.argv.seed.split("--")[0]
-        else:
-            # Generate random seed value everytime for multiple test iterations
-            rand_seed = random.getrandbits(31)
+        rand_seed = self.get_seed(num)
         # Assign the global seed value for a particular iteration
         random.seed(rand_seed)
         self.randomize_cfg()
@@ -68,6 +84,7 @@ class riscv_instr_base_test:
                                      num + self.start_idx)
         self.apply_directed_instr()
         logging.info("All directed instruction is applied")
+        self.asm.open_test_file(test_name)
         self.asm.gen_program()
         self.asm.gen_test_file(test_name)
         logging.info("TEST GENERATED USING SEED VALUE = {}".format(rand_seed))
@@ -13,11 +13,17 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 import sys
 import vsc
-import csv
+from io import StringIO
 from tabulate import *  # NOQA
+from ucis.report.text_coverage_report_formatter import \
+    TextCoverageReportFormatter
 sys.path.append("pygen/")
+sys.path.append("scripts/")
+from riscv_trace_csv import open_trace
+from riscv_cov_db import RiscvCoverageDb, COV_DB_EXT
 from pygen_src.riscv_instr_pkg import *  # NOQA
 from pygen_src.isa.riscv_cov_instr import riscv_cov_instr
 from pygen_src.riscv_instr_cover_group import *  # NOQA
@@ -28,10 +34,18 @@ class riscv_instr_cov_test:
     """ Main class for applying the functional coverage test """
 
     def __init__(self):
-        self.instr_cg = riscv_instr_cover_group()
+        cov_isa = None
+        if cfg.argv.cov_isa:
+            cov_isa = riscv_instr_group_t[cfg.argv.cov_isa]
+        self.instr_cg = riscv_instr_cover_group(cfg.argv.compliance_mode,
+                                                cov_isa)
         self.fd_ins = riscv_floating_point_instr()
         self.trace = {}
         self.csv_trace = []
+        # Trace mnemonic to processed instruction name
+        self.instr_names = {}
+        # Trace mnemonics which are covered by the covergroups
+        self.sampled_instr = set()
         self.entry_cnt, self.total_entry_cnt, self.skipped_cnt, \
         self.unexpected_illegal_instr_cnt = 0, 0, 0, 0
         logging.basicConfig(filename='{}'.format(cfg.argv.log_file_name),
@@ -48,55 +62,28 @@ class riscv_instr_cov_test:
 
         expect_illegal_instr = False
         for csv_file in self.csv_trace:
-            with open("{}".format(csv_file)) as trace_file:
-                self.entry_cnt = 0
-                header = []
-                self.instr_cg.reset()
-                csv_reader = csv.reader(trace_file, delimiter=',')
-                line_count = 0
-                # Get the header line
-                for row in csv_reader:
-                    if line_count == 0:
-                        header = row
-                        logging.info("Header: {}".format(header))
-                    else:
-                        entry = row
-                        if len(entry) != len(header):
-                            logging.info("Skipping malformed entry[{}]: "
-                                         "[{}]".format(self.entry_cnt, entry))
-                            self.skipped_cnt += 1
-                        else:
-                            self.trace["csv_entry"] = row
-                            logging.info("-----------------------------"
-                                         "-----------------------------")
-                            for idx in range(len(header)):
-                                if "illegal" in entry[idx]:
-                                    expect_illegal_instr = True
-                                self.trace[header[idx]] = entry[idx]
-                                if header[idx] != "pad":
-                                    logging.info("{} = {}".format(header[idx],
-                                                                  entry[idx]))
-                            self.post_process_trace()
-                            if self.trace["instr"] in ["li", "ret", "la"]:
-                                continue
-                            if ("amo" in self.trace["instr"] or
-                                    "lr" in self.trace["instr"] or
-                                    "sc" in self.trace["instr"]):
-                                # TODO: Enable functional coverage for AMO test
-                                continue
-                            if not self.sample():
-                                if not expect_illegal_instr:
-                                    logging.error("Found unexpected illegal "
-                                                  "instr: {} "
-                                                  "[{}]".format(self.trace[
-                                                                    "instr"],
-                                                                entry))
-                                    self.unexpected_illegal_instr_cnt += 1
-                        self.entry_cnt += 1
-                    line_count += 1
-                logging.info("[{}]: {} instr processed".format(csv_file,
-                                                               self.entry_cnt))
-                self.total_entry_cnt += self.entry_cnt
+            self.instr_cg.reset()
+            columns = self.load_trace(csv_file)
+            self.decode_trace(columns)
+            names = list(columns)
+            instr_col = columns["instr"]
+            for i in range(len(instr_col)):
+                if columns["illegal"][i]:
+                    expect_illegal_instr = True
+                self.trace = {name: columns[name][i] for name in names}
+                self.post_process_trace()
+                if self.trace["instr"] not in self.sampled_instr:
+                    continue
+                if not self.sample():
+                    if not expect_illegal_instr:
+                        logging.error("Found unexpected illegal "
+                                      "instr: {} "
+                                      "[{}]".format(self.trace["instr"],
+                                                    self.trace["csv_entry"]))
+                        self.unexpected_illegal_instr_cnt += 1
+            logging.info("[{}]: {} instr processed".format(csv_file,
+                                                           self.entry_cnt))
+            self.total_entry_cnt += self.entry_cnt
         logging.info("Finished processing {} trace CSV, {} "
                      "instructions".format(len(self.csv_trace),
                                            self.total_entry_cnt))
@@ -106,11 +93,144 @@ class riscv_instr_cov_test:
                                                 self.unexpected_illegal_instr_cnt))
         self.get_coverage_report()
 
+    def load_trace(self, csv_file):
+        """Load a trace file as columns
+
+        Every header field becomes a list holding the field of all the well
+        formed entries, "csv_entry" holds the raw entries and "illegal" flags
+        the entries with an illegal field. The pc, binary and GPR updates of
+        a columnar trace are loaded from its integer columns as the
+        "pc_val", "binary_val" and "gpr_update" columns.
+
+        Args:
+          csv_file : CSV or columnar trace file
+
+        Returns:
+          Dict of the trace columns
+        """
+        self.entry_cnt = 0
+        with open_trace(csv_file) as trace_file:
+            if hasattr(trace_file, "iter_columns"):
+                return self.load_columnar_trace(trace_file)
+            csv_reader = trace_file.iter_rows()
+            header = next(csv_reader, [])
+            logging.info("Header: {}".format(header))
+            entries = []
+            for entry in csv_reader:
+                if len(entry) != len(header):
+                    logging.info("Skipping malformed entry[{}]: "
+                                 "[{}]".format(self.entry_cnt, entry))
+                    self.skipped_cnt += 1
+                else:
+                    entries.append(entry)
+                self.entry_cnt += 1
+        columns = {name: list(col) for name, col in
+                   zip(header, zip(*entries))}
+        for name in header:
+            columns.setdefault(name, [])
+        columns["csv_entry"] = entries
+        columns["illegal"] = [any("illegal" in field for field in entry)
+                              for entry in entries]
+        return columns
+
+    def load_columnar_trace(self, trace_file):
+        """Load the integer and text columns of a columnar trace
+
+        A columnar trace has no raw entries, "csv_entry" holds the
+        instruction text instead.
+
+        Args:
+          trace_file : RiscvInstructionTraceColumnar object
+
+        Returns:
+          Dict of the trace columns
+        """
+        names = ["pc", "binary", "gpr", "instr", "operand", "instr_str"]
+        chunks = list(trace_file.iter_columns(*names))
+        columns = {name: [val for chunk in chunks for val in chunk[name]]
+                   for name in names}
+        columns["pc_val"] = columns.pop("pc")
+        columns["binary_val"] = columns.pop("binary")
+        columns["gpr_update"] = columns.pop("gpr")
+        # Drop the malformed GPR updates, an empty one is no update
+        gpr_update = columns["gpr_update"]
+        for i, gpr in enumerate(gpr_update):
+            if any(val is None for _, val in gpr):
+                for reg_name, val in gpr:
+                    if val is None and reg_name != "":
+                        logging.error("Illegal gpr update format: "
+                                      "{}".format(reg_name))
+                gpr_update[i] = [update for update in gpr
+                                 if update[1] is not None]
+        columns["csv_entry"] = columns["instr_str"]
+        columns["illegal"] = [
+            "illegal" in instr or "illegal" in operand or
+            "illegal" in instr_str for instr, operand, instr_str in
+            zip(columns["instr"], columns["operand"], columns["instr_str"])]
+        self.entry_cnt = len(columns["instr"])
+        return columns
+
+    def decode_trace(self, columns):
+        """Decode the trace columns used for sampling in bulk
+
+        The instruction names are decoded once per distinct mnemonic, the
+        pc, binary and GPR update columns of the entries to be sampled are
+        converted to integers, unless they were loaded as integers.
+
+        Args:
+          columns : Dict of the trace columns, updated in place
+        """
+        for instr in set(columns["instr"]):
+            if instr in self.instr_names:
+                continue
+            self.instr_names[instr] = self.process_instr_name(instr)
+            if (instr not in ["li", "ret", "la"] and
+                    "amo" not in instr and "lr" not in instr and
+                    "sc" not in instr):
+                # TODO: Enable functional coverage for AMO test
+                self.sampled_instr.add(instr)
+        if "pc_val" in columns:
+            return
+        sampled = [instr in self.sampled_instr for instr in columns["instr"]]
+        columns["pc_val"] = [int(pc, 16) if is_sampled else None
+                             for pc, is_sampled in zip(columns["pc"], sampled)]
+        columns["binary_val"] = [int(binary, 16) if is_sampled else None
+                                 for binary, is_sampled in
+                                 zip(columns["binary"], sampled)]
+        columns["gpr_update"] = [self.decode_gpr_update(gpr) if is_sampled
+                                 else None for gpr, is_sampled in
+                                 zip(columns["gpr"], sampled)]
+
+    @staticmethod
+    def decode_gpr_update(gpr):
+        """Split a GPR update field into (reg_name, value) pairs"""
+        gpr_update = []
+        if gpr == "":
+            return gpr_update
+        for dest in gpr.split(";"):
+            pair = dest.split(":")
+            if len(pair) != 2:
+                logging.error("Illegal gpr update format: {}".format(dest))
+            gpr_update.append((pair[0], int(pair[1], 16)))
+        return gpr_update
+
     def get_coverage_report(self):
+        # The covergroups are created on first sample, create the ones never
+        # sampled so that the report lists every covergroup of the covered ISA
+        self.instr_cg.create_unsampled_cg()
+        # Build the report model once for both the detailed and summary report
         model = vsc.get_coverage_report_model()
-        str_report = vsc.get_coverage_report(details=True)
-        logging.info("Report:\n" + str_report)
-        cov_dir = cfg.argv.log_file_name.split("/")[0]
+        # Save the bin hits of this run, which are merged with the other
+        # batches into the total coverage
+        traces = [os.path.abspath(csv_file) for csv_file in self.csv_trace]
+        RiscvCoverageDb.from_report(model, traces).save(
+            os.path.splitext(cfg.argv.log_file_name)[0] + COV_DB_EXT)
+        str_report = StringIO()
+        formatter = TextCoverageReportFormatter(model, str_report)
+        formatter.details = True
+        formatter.report()
+        logging.info("Report:\n" + str_report.getvalue())
+        cov_dir = os.path.dirname(cfg.argv.log_file_name) or "."
         file = open('{}/CoverageReport.txt'.format(cov_dir), 'w')
         file.write("Groups Coverage Summary\n")
         file.write("Total groups in report: {}\n".format(
@@ -130,7 +250,7 @@ class riscv_instr_cov_test:
         pass
 
     def sample(self):
-        processed_instr_name = self.process_instr_name(self.trace["instr"])
+        processed_instr_name = self.instr_names[self.trace["instr"]]
         if processed_instr_name in riscv_instr_name_t.__members__:
             instr_name = riscv_instr_name_t[processed_instr_name]
             instruction = riscv_cov_instr()
@@ -155,8 +275,8 @@ class riscv_instr_cov_test:
         return False
 
     def assign_trace_info_to_instr(self, instruction):
-        instruction.pc.set_val(get_val(self.trace["pc"], hexa=1))
-        instruction.binary.set_val(get_val(self.trace["binary"], hexa=1))
+        instruction.pc.set_val(self.trace["pc_val"])
+        instruction.binary.set_val(self.trace["binary_val"])
         instruction.trace = self.trace["instr_str"]
         if instruction.instr.name in ["NOP", "WFI", "FENCE", "FENCE_I",
                                       "EBREAK", "C_EBREAK", "SFENCE_VMA",
@@ -169,17 +289,12 @@ class riscv_instr_cov_test:
         else:
             instruction.update_src_regs(operands)
 
-        gpr_update = self.trace["gpr"].split(";")
-        if len(gpr_update) == 1 and gpr_update[0] == "":
-            gpr_update = []
-        for dest in gpr_update:
-            pair = dest.split(":")
-            if len(pair) != 2:
-                logging.error("Illegal gpr update format: {}".format(dest))
+        for reg_name, val in self.trace["gpr_update"]:
             if instruction.group.name in ["RV32D", "RV32F"]:
-                self.fd_ins.update_dst_regs(instruction, pair[0], pair[1])
+                self.fd_ins.update_dst_regs(instruction, reg_name,
+                                            "{:x}".format(val))
             else:
-                instruction.update_dst_regs(pair[0], pair[1])
+                instruction.update_dst_reg_val(reg_name, val)
 
     def process_instr_name(self, instruction):
         instruction = instruction.upper()
@@ -22,6 +22,10 @@ import random
 import re
 import sys
 import logging
+import threading
+import io
+import concurrent.futures
+import multiprocessing
 
 from scripts.lib import *
 from scripts.spike_log_to_trace_csv import *
@@ -29,6 +33,8 @@ from scripts.ovpsim_log_to_trace_csv import *
 from scripts.whisper_log_trace_csv import *
 from scripts.sail_log_to_trace_csv import *
 from scripts.instr_trace_compare import *
+from scripts.compile_cache import CompileCache
+from scripts.gen_server import GenServer
 
 from types import SimpleNamespace
 
@@ -231,12 +237,9 @@ def do_compile(compile_cmd, test_list, core_setting_dir, cwd, ext_dir,
                 run_cmd(cmd, debug_cmd=debug_cmd)
 
 
-def run_csr_test(cmd_list, cwd, csr_file, isa, iterations, lsf_cmd,
-                 end_signature_addr, timeout_s, output_dir, debug_cmd):
-    """Run CSR test
-     It calls a separate python script to generate directed CSR test code,
-     located at scripts/gen_csr_test.py.
-    """
+def get_csr_test_cmd(cwd, csr_file, isa, iterations, end_signature_addr,
+                     output_dir):
+    """Get the command generating the directed CSR test code"""
     cmd = "python3 " + cwd + "/scripts/gen_csr_test.py" + \
           (" --csr_file {}".format(csr_file)) + \
           (" --xlen {}".format(
@@ -244,7 +247,18 @@ def run_csr_test(cmd_list, cwd, csr_file, isa, iterations, lsf_cmd,
           (" --iterations {}".format(iterations)) + \
           (" --out {}/asm_test".format(output_dir)) + \
           (" --end_signature_addr {}".format(end_signature_addr))
-    if lsf_cmd:
+    return cmd
+
+
+def run_csr_test(cmd_list, cwd, csr_file, isa, iterations, lsf_cmd,
+                 end_signature_addr, timeout_s, output_dir, debug_cmd, jobs=1):
+    """Run CSR test
+     It calls a separate python script to generate directed CSR test code,
+     located at scripts/gen_csr_test.py.
+    """
+    cmd = get_csr_test_cmd(cwd, csr_file, isa, iterations, end_signature_addr,
+                           output_dir)
+    if lsf_cmd or jobs > 1:
         cmd_list.append(cmd)
     else:
         run_cmd(cmd, timeout_s, debug_cmd=debug_cmd)
@@ -253,7 +267,8 @@ def run_csr_test(cmd_list, cwd, csr_file, isa, iterations, lsf_cmd,
 def do_simulate(sim_cmd, simulator, test_list, cwd, sim_opts, seed_gen,
                 csr_file,
                 isa, end_signature_addr, lsf_cmd, timeout_s, log_suffix,
-                batch_size, output_dir, verbose, check_return_code, debug_cmd, target):
+                batch_size, output_dir, verbose, check_return_code, debug_cmd, target,
+                jobs=1, job_list=None, gen_server=None):
     """Run  the instruction generator
 
     Args:
@@ -274,8 +289,15 @@ def do_simulate(sim_cmd, simulator, test_list, cwd, sim_opts, seed_gen,
       verbose               : Verbose logging
       check_return_code     : Check return code of the command
       debug_cmd             : Produce the debug cmd log without running
+      target                : Pre-defined target passed to the pyflow generator
+      jobs                  : Maximum number of generator runs in parallel
+      job_list              : Collect the generator jobs into this list
+                              instead of running them
+      gen_server            : GenServer running the pyflow generator jobs,
+                              None to start a new process per job
     """
     cmd_list = []
+    server_cmd_list = []
     sim_cmd = re.sub("<out>", os.path.abspath(output_dir), sim_cmd)
     sim_cmd = re.sub("<cwd>", cwd, sim_cmd)
     sim_cmd = re.sub("<sim_opts>", sim_opts, sim_cmd)
@@ -289,10 +311,15 @@ def do_simulate(sim_cmd, simulator, test_list, cwd, sim_opts, seed_gen,
         logging.info("Generating {} {}".format(iterations, test['test']))
         if iterations > 0:
             # Running a CSR test
-            if test['test'] == 'riscv_csr_test':
+            if job_list is not None and test['test'] == 'riscv_csr_test':
+                job_list.append({
+                    'test': test, 'start_idx': 0, 'test_cnt': iterations,
+                    'cmd': get_csr_test_cmd(cwd, csr_file, isa, iterations,
+                                            end_signature_addr, output_dir)})
+            elif test['test'] == 'riscv_csr_test':
                 run_csr_test(cmd_list, cwd, csr_file, isa, iterations, lsf_cmd,
                              end_signature_addr, timeout_s, output_dir,
-                             debug_cmd)
+                             debug_cmd, jobs)
             else:
                 batch_cnt = 1
                 if batch_size > 0:
@@ -349,7 +376,15 @@ def do_simulate(sim_cmd, simulator, test_list, cwd, sim_opts, seed_gen,
                             cmd += test['gen_opts']
                     if not re.search("c", isa):
                         cmd += "+disable_compressed_instr=1 "
-                    if lsf_cmd:
+                    if job_list is not None:
+                        job_list.append({'test': test,
+                                         'start_idx': i * batch_size,
+                                         'test_cnt': test_cnt, 'cmd': cmd,
+                                         'runner': gen_server.run if gen_server
+                                         else run_job})
+                    elif gen_server:
+                        server_cmd_list.append(cmd)
+                    elif lsf_cmd or jobs > 1:
                         cmd_list.append(cmd)
                     else:
                         logging.info(
@@ -363,13 +398,31 @@ def do_simulate(sim_cmd, simulator, test_list, cwd, sim_opts, seed_gen,
         with open(('{}/seed.yaml'.format(os.path.abspath(output_dir))),
                   'w') as outfile:
             yaml.dump(sim_seed, outfile, default_flow_style=False)
-    if lsf_cmd:
-        run_parallel_cmd(cmd_list, timeout_s,
+    if job_list is None and (lsf_cmd or jobs > 1):
+        # Without an explicit job limit, LSF dispatches all batches at once
+        run_parallel_cmd(cmd_list, timeout_s, exit_on_error=1,
                          check_return_code=check_return_code,
-                         debug_cmd=debug_cmd)
+                         debug_cmd=debug_cmd,
+                         jobs=jobs if jobs > 1 else 0)
+    if server_cmd_list:
+        run_parallel_cmd(server_cmd_list, timeout_s, exit_on_error=1,
+                         check_return_code=check_return_code,
+                         debug_cmd=debug_cmd, jobs=jobs,
+                         runner=gen_server.run)
+
 
+def get_gen_timeout(argv):
+    """Get the generator timeout limit in seconds"""
+    if argv.simulator == 'pyflow':
+        """Default timeout of Pyflow is 20 minutes, if the user
+           doesn't specified their own gen_timeout value from CMD
+        """
+        if argv.gen_timeout == 360:
+            return 1200
+    return argv.gen_timeout
 
-def gen(test_list, argv, output_dir, cwd):
+
+def gen(test_list, argv, output_dir, cwd, job_list=None, gen_server=None):
     """Run the instruction generator
 
     Args:
@@ -377,6 +430,10 @@ def gen(test_list, argv, output_dir, cwd):
       argv                  : Configuration arguments
       output_dir            : Output directory of the ELF files
       cwd                   : Filesystem path to RISCV-DV repo
+      job_list              : Collect the generator jobs into this list
+                              instead of running them
+      gen_server            : GenServer running the pyflow generator jobs,
+                              None to start a new process per job
     """
     check_return_code = True
     if argv.simulator == "ius":
@@ -407,16 +464,7 @@ def gen(test_list, argv, output_dir, cwd):
     # Run the instruction generator
     if not argv.co:
         seed_gen = SeedGen(argv.start_seed, argv.seed, argv.seed_yaml)
-        if argv.simulator == 'pyflow':
-            """Default timeout of Pyflow is 20 minutes, if the user
-               doesn't specified their own gen_timeout value from CMD
-            """
-            if argv.gen_timeout == 360:
-                gen_timeout = 1200
-            else:
-                gen_timeout = argv.gen_timeout
-        else:
-            gen_timeout = argv.gen_timeout
+        gen_timeout = get_gen_timeout(argv)
         # do_simulate(python3 <cwd>/pygen/pygen_src/test/<test_name>.py <sim_opts>,pyflow,arithmetic,riscv-dv/,sim_opts="",seed_gen,csr_yaml,rv32imc_csr,fencei,"0","",1200,"",.....)
         do_simulate(sim_cmd, argv.simulator, test_list, cwd, argv.sim_opts,
                     seed_gen,
@@ -424,10 +472,66 @@ def gen(test_list, argv, output_dir, cwd):
                     argv.lsf_cmd,
                     gen_timeout, argv.log_suffix, argv.batch_size,
                     output_dir,
-                    argv.verbose, check_return_code, argv.debug, argv.target)
+                    argv.verbose, check_return_code, argv.debug, argv.target,
+                    argv.jobs, job_list, gen_server)
+
 
+def get_gcc_cmd(test, i, output_dir, isa, mabi, opts, cwd, debug_cmd):
+    """Get the commands compiling one iteration of a generated test
 
-def gcc_compile(test_list, output_dir, isa, mabi, opts, debug_cmd):
+    Args:
+      test       : Test entry of the regression test list
+      i          : Iteration index of the test
+      output_dir : Output directory of the ELF files
+      isa        : ISA variant passed to GCC
+      mabi       : MABI variant passed to GCC
+      opts       : User-defined options for GCC compilation
+      cwd        : Filesystem path to RISCV-DV repo
+      debug_cmd  : Produce the debug cmd log without running
+
+    Returns:
+      asm         : Assembly program to be compiled
+      cmd         : GCC command producing the ELF
+      objcopy_cmd : Command converting the ELF to plain binary
+    """
+    prefix = ("{}/asm_test/{}_{}".format(output_dir, test['test'], i))
+    asm = prefix + ".S"
+    elf = prefix + ".o"
+    binary = prefix + ".bin"
+    test_isa = isa
+    # gcc compilation, the data files of the test are included from its directory
+    cmd = ("{} -static -mcmodel=medany \
+     -fvisibility=hidden -nostdlib \
+     -nostartfiles {} \
+     -I{}/user_extension \
+     -I{} \
+     -T{}/scripts/link.ld {} -o {} ".format(
+        get_env_var("RISCV_GCC", debug_cmd=debug_cmd), asm, cwd,
+        os.path.dirname(asm), cwd, opts, elf))
+    if 'gcc_opts' in test:
+        cmd += test['gcc_opts']
+    if 'gen_opts' in test:
+        # Disable compressed instruction
+        if re.search('disable_compressed_instr', test['gen_opts']):
+            # Note that this substitution assumes the cannonical order
+            # of extensions, i.e. that extensions with preceding
+            # underscores will be provided after all letter extensions.
+            # This assumption should hold true, as this is a
+            # requirement enforced by e.g. gcc
+            test_isa = re.sub(r"(rv.+?)c", r"\1", test_isa)
+    # If march/mabi is not defined in the test gcc_opts, use the default
+    # setting from the command line.
+    if not re.search('march', cmd):
+        cmd += (" -march={}".format(test_isa))
+    if not re.search('mabi', cmd):
+        cmd += (" -mabi={}".format(mabi))
+    objcopy_cmd = ("{} -O binary {} {}".format(
+        get_env_var("RISCV_OBJCOPY", debug_cmd=debug_cmd), elf, binary))
+    return asm, cmd, objcopy_cmd
+
+
+def gcc_compile(test_list, output_dir, isa, mabi, opts, debug_cmd, jobs=1,
+                cache=None):
     """Use riscv gcc toolchain to compile the assembly program
 
     Args:
@@ -436,60 +540,62 @@ def gcc_compile(test_list, output_dir, isa, mabi, opts, debug_cmd):
       isa        : ISA variant passed to GCC
       mabi       : MABI variant passed to GCC
       debug_cmd  : Produce the debug cmd log without running
+      jobs       : Maximum number of tests compiled in parallel
+      cache      : CompileCache reused across runs, None to always compile
     """
     cwd = os.path.dirname(os.path.realpath(__file__))
+    cmd_list = []
+    cache_list = []
     for test in test_list:
         for i in range(0, test['iterations']):
             if 'no_gcc' in test and test['no_gcc'] == 1:
                 continue
-            prefix = ("{}/asm_test/{}_{}".format(output_dir, test['test'], i))
-            asm = prefix + ".S"
-            elf = prefix + ".o"
-            binary = prefix + ".bin"
-            test_isa = isa
+            asm, cmd, objcopy_cmd = get_gcc_cmd(test, i, output_dir, isa,
+                                                mabi, opts, cwd, debug_cmd)
             if not os.path.isfile(asm) and not debug_cmd:
                 logging.error("Cannot find assembly test: {}\n".format(asm))
                 sys.exit(RET_FAIL)
-            # gcc compilation
-            cmd = ("{} -static -mcmodel=medany \
-             -fvisibility=hidden -nostdlib \
-             -nostartfiles {} \
-             -I{}/user_extension \
-             -T{}/scripts/link.ld {} -o {} ".format(
-                get_env_var("RISCV_GCC", debug_cmd=debug_cmd), asm, cwd,
-                cwd, opts, elf))
-            if 'gcc_opts' in test:
-                cmd += test['gcc_opts']
-            if 'gen_opts' in test:
-                # Disable compressed instruction
-                if re.search('disable_compressed_instr', test['gen_opts']):
-                    # Note that this substitution assumes the cannonical order
-                    # of extensions, i.e. that extensions with preceding
-                    # underscores will be provided after all letter extensions.
-                    # This assumption should hold true, as this is a
-                    # requirement enforced by e.g. gcc
-                    test_isa = re.sub(r"(rv.+?)c", r"\1", test_isa)
-            # If march/mabi is not defined in the test gcc_opts, use the default
-            # setting from the command line.
-            # print(cmd)
-            if not re.search('march', cmd):
-                cmd += (" -march={}".format(test_isa))
-            if not re.search('mabi', cmd):
-                cmd += (" -mabi={}".format(mabi))
+            # pyflow already wrote the ELF and binary of +direct_binary=1 tests
+            elf = objcopy_cmd.split()[-2]
+            binary = objcopy_cmd.split()[-1]
+            if (re.search(r'direct_binary=1', test.get('gen_opts', '')) and
+                    os.path.isfile(elf) and os.path.isfile(binary)):
+                logging.info("Using {} generated with the assembly".format(elf))
+                continue
+            key = None
+            if cache and not debug_cmd:
+                key = cache.get_key(asm, [cmd, objcopy_cmd], [elf, binary])
+                if cache.fetch(key, [elf, binary]):
+                    logging.info("Using cached {}".format(elf))
+                    continue
+                cache_list.append((key, [elf, binary]))
+            if jobs > 1:
+                # Compile and convert as one job so that the conversion
+                # never races with the compilation of the same test
+                cmd_list.append("{} && {}".format(" ".join(cmd.split()),
+                                                  objcopy_cmd))
+                continue
             logging.info("Compiling {}".format(asm))
             # print("GCC command for .o file : {}".format(cmd))
             run_cmd_output(cmd.split(), debug_cmd=debug_cmd)
             # Convert the ELF to plain binary, used in RTL sim
-            logging.info("Converting to {}".format(binary))
-            cmd = ("{} -O binary {} {}".format(
-                get_env_var("RISCV_OBJCOPY", debug_cmd=debug_cmd), elf, binary))
+            logging.info("Converting to {}".format(objcopy_cmd.split()[-1]))
             # print("GCC command for .bin file : {}".format(cmd))
-            run_cmd_output(cmd.split(), debug_cmd=debug_cmd)
-            
+            run_cmd_output(objcopy_cmd.split(), debug_cmd=debug_cmd)
+            if key:
+                cache.store(key, [elf, binary])
+    if cmd_list:
+        logging.info("Compiling {} assembly tests with {} jobs".format(
+            len(cmd_list), jobs))
+        run_parallel_cmd(cmd_list, None, exit_on_error=1,
+                         debug_cmd=debug_cmd, jobs=jobs)
+        # Every job passed, a failure exits above
+        for key, outputs in cache_list:
+            cache.store(key, outputs)
 
 
 def run_assembly(asm_test, iss_yaml, isa, mabi, gcc_opts, iss_opts, output_dir,
-                 setting_dir, debug_cmd):
+                 setting_dir, debug_cmd, cache=None):
     """Run a directed assembly test with ISS
 
     Args:
@@ -502,6 +608,7 @@ def run_assembly(asm_test, iss_yaml, isa, mabi, gcc_opts, iss_opts, output_dir,
       output_dir  : Output directory of compiled test files
       setting_dir : Generator setting directory
       debug_cmd   : Produce the debug cmd log without running
+      cache       : CompileCache reused across runs, None to always compile
     """
     if not asm_test.endswith(".S"):
         logging.error("{} is not an assembly .S file".format(asm_test))
@@ -528,12 +635,20 @@ def run_assembly(asm_test, iss_yaml, isa, mabi, gcc_opts, iss_opts, output_dir,
         cwd, gcc_opts, elf))
     cmd += (" -march={}".format(isa))
     cmd += (" -mabi={}".format(mabi))
-    run_cmd_output(cmd.split(), debug_cmd=debug_cmd)
-    # Convert the ELF to plain binary, used in RTL sim
-    logging.info("Converting to {}".format(binary))
-    cmd = ("{} -O binary {} {}".format(
+    objcopy_cmd = ("{} -O binary {} {}".format(
         get_env_var("RISCV_OBJCOPY", debug_cmd=debug_cmd), elf, binary))
-    run_cmd_output(cmd.split(), debug_cmd=debug_cmd)
+    key = None
+    if cache and not debug_cmd:
+        key = cache.get_key(asm_test, [cmd, objcopy_cmd], [elf, binary])
+    if key and cache.fetch(key, [elf, binary]):
+        logging.info("Using cached {}".format(elf))
+    else:
+        run_cmd_output(cmd.split(), debug_cmd=debug_cmd)
+        # Convert the ELF to plain binary, used in RTL sim
+        logging.info("Converting to {}".format(binary))
+        run_cmd_output(objcopy_cmd.split(), debug_cmd=debug_cmd)
+        if key:
+            cache.store(key, [elf, binary])
     log_list = []
     # ISS simulation
     for iss in iss_list:
@@ -550,7 +665,7 @@ def run_assembly(asm_test, iss_yaml, isa, mabi, gcc_opts, iss_opts, output_dir,
 
 
 def run_assembly_from_dir(asm_test_dir, iss_yaml, isa, mabi, gcc_opts, iss,
-                          output_dir, setting_dir, debug_cmd):
+                          output_dir, setting_dir, debug_cmd, cache=None):
     """Run a directed assembly test from a directory with spike
 
     Args:
@@ -563,6 +678,7 @@ def run_assembly_from_dir(asm_test_dir, iss_yaml, isa, mabi, gcc_opts, iss,
       output_dir      : Output directory of compiled test files
       setting_dir     : Generator setting directory
       debug_cmd       : Produce the debug cmd log without running
+      cache           : CompileCache reused across runs, None to always compile
     """
     result = run_cmd("find {} -name \"*.S\"".format(asm_test_dir))
     if result:
@@ -572,7 +688,7 @@ def run_assembly_from_dir(asm_test_dir, iss_yaml, isa, mabi, gcc_opts, iss,
         for asm_file in asm_list:
             run_assembly(asm_file, iss_yaml, isa, mabi, gcc_opts, iss,
                          output_dir,
-                         setting_dir, debug_cmd)
+                         setting_dir, debug_cmd, cache)
             if "," in iss:
                 report = ("{}/iss_regr.log".format(output_dir)).rstrip()
                 save_regr_report(report)
@@ -670,10 +786,36 @@ def run_c_from_dir(c_test_dir, iss_yaml, isa, mabi, gcc_opts, iss,
         logging.error("No c test(*.c) found under {}".format(c_test_dir))
 
 
+def get_iss_sim_cmd(base_cmd, iss, test, i, output_dir):
+    """Get the ISS simulation command of one iteration of a generated test
+
+    Args:
+      base_cmd   : ISS command parsed from the ISS YAML
+      iss        : Instruction set simulator
+      test       : Test entry of the regression test list
+      i          : Iteration index of the test
+      output_dir : Output directory of the ELF files
+
+    Returns:
+      elf        : ELF file to run ISS simulation
+      log        : ISS simulation log
+      cmd        : Command for ISS simulation
+    """
+    elf = ("{}/asm_test/{}_{}.o".format(output_dir, test['test'], i))
+    log = ("{}/{}_sim/{}_{}.log".format(output_dir, iss, test['test'], i))
+    cmd = get_iss_cmd(base_cmd, elf, log)
+    if 'iss_opts' in test:
+        cmd += ' '
+        cmd += test['iss_opts']
+    return elf, log, cmd
+
+
 def iss_sim(test_list, output_dir, iss_list, iss_yaml, iss_opts,
-            isa, priv, setting_dir, timeout_s, debug_cmd):
+            isa, priv, setting_dir, timeout_s, debug_cmd, jobs=1, cache=None):
     """Run ISS simulation with the generated test program
 
+    The simulations run in parallel, the ISS of one test side by side.
+
     Args:
       test_list   : List of assembly programs to be compiled
       output_dir  : Output directory of the ELF files
@@ -685,38 +827,62 @@ def iss_sim(test_list, output_dir, iss_list, iss_yaml, iss_opts,
       setting_dir : Generator setting directory
       timeout_s   : Timeout limit in seconds
       debug_cmd   : Produce the debug cmd log without running
+      jobs        : Maximum number of ISS simulations in parallel, at least
+                    one per ISS
+      cache       : CompileCache of the ISS logs, None to always simulate
     """
+    iss_base_cmd = []
     for iss in iss_list.split(","):
         log_dir = ("{}/{}_sim".format(output_dir, iss))
         base_cmd = parse_iss_yaml(iss, iss_yaml, isa, priv, setting_dir, debug_cmd)
         base_cmd += iss_opts
         logging.info("{} sim log dir: {}".format(iss, log_dir))
         run_cmd_output(["mkdir", "-p", log_dir])
-        for test in test_list:
-            if 'no_iss' in test and test['no_iss'] == 1:
-                continue
-            else:
-                for i in range(0, test['iterations']):
-                    prefix = ("{}/asm_test/{}_{}".format(
-                        output_dir, test['test'], i))
-                    elf = prefix + ".o"
-                    log = ("{}/{}_{}.log".format(log_dir, test['test'], i))
-                    cmd = get_iss_cmd(base_cmd, elf, log)
-                    if 'iss_opts' in test:
-                        cmd += ' '
-                        cmd += test['iss_opts']
-                    logging.info("Running {} sim: {}".format(iss, elf))
-                    if iss == "ovpsim":
-                        run_cmd(cmd, timeout_s, debug_cmd=debug_cmd)
-                    else:
-                        # print("ISS command: {}".format(cmd))
-                        run_cmd(cmd, timeout_s, debug_cmd=debug_cmd)
-                    logging.debug(cmd)
+        iss_base_cmd.append((iss, base_cmd))
+    cmd_list = []
+    cache_list = []
+    for test in test_list:
+        if 'no_iss' in test and test['no_iss'] == 1:
+            continue
+        for i in range(0, test['iterations']):
+            for iss, base_cmd in iss_base_cmd:
+                elf, log, cmd = get_iss_sim_cmd(base_cmd, iss, test, i,
+                                                output_dir)
+                key = None
+                # Without an ELF the simulation fails like an uncached one
+                if cache and not debug_cmd and os.path.isfile(elf):
+                    key = cache.get_key(elf, [cmd], [log])
+                    if cache.fetch(key, [log]):
+                        logging.info("Using cached {} sim log of {}".format(
+                            iss, elf))
+                        continue
+                cmd_list.append(cmd)
+                cache_list.append((key, log))
+    if not cmd_list:
+        return
+    jobs = max(jobs, len(iss_base_cmd))
+    logging.info("Running {} ISS simulations with {} jobs".format(
+        len(cmd_list), jobs))
+    results = run_parallel_cmd(cmd_list, timeout_s, exit_on_error=1,
+                               debug_cmd=debug_cmd, jobs=jobs)
+    for (key, log), (rc, _) in zip(cache_list, results or []):
+        if key and rc == 0:
+            cache.store(key, [log])
+
+
+def get_iss_log_list(iss_list, test, i, output_dir):
+    """Get the ISS logs compared for one iteration of a generated test"""
+    return ["{}/{}_sim/{}_{}.log".format(output_dir, iss, test['test'], i)
+            for iss in iss_list]
 
 
-def iss_cmp(test_list, iss, output_dir, stop_on_first_error, exp, debug_cmd):
+def iss_cmp(test_list, iss, output_dir, stop_on_first_error, exp, debug_cmd,
+            trace_ext=".csv", jobs=1):
     """Compare ISS simulation reult
 
+    The logs of the tests are converted and compared by a pool of worker
+    processes, the report is written once all of them are done.
+
     Args:
       test_list      : List of assembly programs to be compiled
       iss            : List of instruction set simulators
@@ -724,6 +890,9 @@ def iss_cmp(test_list, iss, output_dir, stop_on_first_error, exp, debug_cmd):
       stop_on_first_error : will end run on first error detected
       exp            : Use experimental version
       debug_cmd      : Produce the debug cmd log without running
+      trace_ext      : File extension of the instruction trace, which selects
+                       the trace format
+      jobs           : Maximum number of tests compared in parallel
     """
     if debug_cmd:
         return
@@ -731,31 +900,77 @@ def iss_cmp(test_list, iss, output_dir, stop_on_first_error, exp, debug_cmd):
     if len(iss_list) != 2:
         return
     report = ("{}/iss_regr.log".format(output_dir)).rstrip()
-    run_cmd("rm -rf {}".format(report))
+    cmp_list = []
     for test in test_list:
         for i in range(0, test['iterations']):
             elf = ("{}/asm_test/{}_{}.o".format(output_dir, test['test'], i))
-            logging.info("Comparing ISS sim result {}/{} : {}".format(
-                iss_list[0], iss_list[1], elf))
-            log_list = []
-            run_cmd(("echo 'Test binary: {}' >> {}".format(elf, report)))
-            for iss in iss_list:
-                log_list.append(
-                    "{}/{}_sim/{}.{}.log".format(output_dir, iss, test['test'], i))
-            compare_iss_log(iss_list, log_list, report, stop_on_first_error,
-                            exp)
-    save_regr_report(report)
+            cmp_list.append((elf, get_iss_log_list(iss_list, test, i,
+                                                   output_dir)))
+    logging.info("Comparing {} ISS sim results {}/{} with {} jobs".format(
+        len(cmp_list), iss_list[0], iss_list[1], jobs))
+    if jobs > 1 and len(cmp_list) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(compare_iss_test, iss_list, log_list, elf,
+                                   stop_on_first_error, trace_ext)
+                       for elf, log_list in cmp_list]
+            results = [future.result() for future in futures]
+    else:
+        results = [compare_iss_test(iss_list, log_list, elf,
+                                    stop_on_first_error, trace_ext)
+                   for elf, log_list in cmp_list]
+    with open(report, "w") as fd:
+        for text, _ in results:
+            fd.write(text)
+    save_regr_report(report, [result for _, result in results])
+
+
+def compare_iss_test(iss_list, log_list, elf, stop_on_first_error=0,
+                     trace_ext=".csv"):
+    """Convert and compare the ISS logs of one test
+
+    Args:
+      iss_list            : Names of the two ISS
+      log_list            : ISS logs of the test
+      elf                 : ELF file the ISS simulated
+      stop_on_first_error : will end run on first error detected
+      trace_ext           : File extension of the instruction trace
+
+    Returns:
+      report              : Report text of the test
+      result              : Comparison result
+    """
+    logging.info("Comparing ISS sim result {}/{} : {}".format(
+        iss_list[0], iss_list[1], elf))
+    report = io.StringIO()
+    report.write("Test binary: {}\n".format(elf))
+    result = compare_iss_log(iss_list, log_list, report, stop_on_first_error,
+                             trace_ext=trace_ext)
+    return report.getvalue(), result
 
 
 def compare_iss_log(iss_list, log_list, report, stop_on_first_error=0,
-                    exp=False):
+                    exp=False, trace_ext=".csv"):
+    """Convert two ISS logs to traces and compare them
+
+    Args:
+      iss_list            : Names of the two ISS
+      log_list            : ISS logs to compare
+      report              : Report file name or open file the comparison
+                            is written to
+      stop_on_first_error : will end run on first error detected
+      exp                 : Use experimental version
+      trace_ext           : File extension of the instruction trace
+
+    Returns:
+      Comparison result, None if the logs could not be compared
+    """
     if len(iss_list) != 2 or len(log_list) != 2:
         logging.error("Only support comparing two ISS logs")
     else:
         csv_list = []
         for i in range(2):
             log = log_list[i]
-            csv = log.replace(".log", ".csv")
+            csv = log.replace(".log", trace_ext)
             iss = iss_list[i]
             csv_list.append(csv)
             if iss == "spike":
@@ -772,17 +987,229 @@ def compare_iss_log(iss_list, log_list, report, stop_on_first_error=0,
         result = compare_trace_csv(csv_list[0], csv_list[1], iss_list[0],
                                    iss_list[1], report)
         logging.info(result)
+        return result
 
 
-def save_regr_report(report):
-    passed_cnt = run_cmd("grep PASSED {} | wc -l".format(report)).strip()
-    failed_cnt = run_cmd("grep FAILED {} | wc -l".format(report)).strip()
+def get_trace_ext(trace_format):
+    """Get the file extension of the instruction trace format"""
+    if trace_format == "columnar":
+        return TRACE_COLUMNAR_EXT
+    return ".csv"
+
+
+def save_regr_report(report, results=None):
+    """Append the PASSED/FAILED summary to the ISS regression report
+
+    Args:
+      report  : ISS regression report
+      results : Comparison results of the tests, the result lines of the
+                report are counted when None
+    """
+    if results is None:
+        with open(report, "r") as fd:
+            results = [line for line in fd
+                       if "PASSED" in line or "FAILED" in line]
+    passed_cnt = sum(1 for result in results if result and "PASSED" in result)
+    failed_cnt = sum(1 for result in results if result and "FAILED" in result)
     summary = ("{} PASSED, {} FAILED".format(passed_cnt, failed_cnt))
     logging.info(summary)
-    run_cmd(("echo {} >> {}".format(summary, report)))
+    with open(report, "a") as fd:
+        fd.write(summary + "\n")
     logging.info("ISS regression report is saved to {}".format(report))
 
 
+def run_pipeline(test_list, argv, output_dir, cwd, cache=None,
+                 gen_server=None, iss_cache=None):
+    """Run the regression steps as a per-test pipeline
+
+    Each generated test goes through gcc_compile, iss_sim and iss_cmp as soon
+    as its previous step is done, so the steps of different tests overlap
+    instead of waiting for a step to finish for the whole test list. At most
+    argv.jobs commands are running at any time.
+
+    Args:
+      test_list  : List of assembly programs to be compiled
+      argv       : Configuration arguments
+      output_dir : Output directory of the ELF files
+      cwd        : Filesystem path to RISCV-DV repo
+      cache      : CompileCache reused across runs, None to always compile
+      gen_server : GenServer running the pyflow generator jobs, None to start
+                   a new process per job
+      iss_cache  : CompileCache of the ISS logs, None to always simulate
+    """
+    steps = [step for step in ["gen", "gcc_compile", "iss_sim", "iss_cmp"]
+             if argv.steps == "all" or re.match(".*{}.*".format(step),
+                                                argv.steps)]
+    iss_list = argv.iss.split(",")
+    iss_base_cmd = {}
+    if "iss_sim" in steps:
+        for iss in iss_list:
+            iss_base_cmd[iss] = parse_iss_yaml(iss, argv.iss_yaml, argv.isa,
+                                               argv.priv,
+                                               argv.core_setting_dir,
+                                               argv.debug) + argv.iss_opts
+            run_cmd_output(["mkdir", "-p", "{}/{}_sim".format(output_dir, iss)])
+    compare = "iss_cmp" in steps and len(iss_list) == 2
+    report = ("{}/iss_regr.log".format(output_dir)).rstrip()
+    # Report text and comparison result of every compared test
+    cmp_results = {}
+    check_return_code = argv.simulator != "ius"
+    gen_timeout = get_gen_timeout(argv)
+    children = ChildProcesses()
+    failed = []
+    lock = threading.Lock()
+    iss_pending = {}
+    iss_failed = set()
+
+    def run_step(cmd, timeout_s, check=True, runner=run_job):
+        rc, output = runner(cmd, timeout_s, children)
+        if rc is None or (rc and check and rc > 0):
+            if rc is not None:
+                logging.info(output)
+                logging.error("ERROR return code: {}, cmd:{}".format(rc, cmd))
+            failed.append(cmd)
+            return False
+        logging.debug(output)
+        return True
+
+    def gen_step(job):
+        logging.info("Generating {} {} from index {}".format(
+            job['test_cnt'], job['test']['test'], job['start_idx']))
+        if not run_step(job['cmd'], gen_timeout, check_return_code,
+                        job.get('runner', run_job)):
+            return []
+        return [(gcc_step, job['test'], i) for i in
+                range(job['start_idx'], job['start_idx'] + job['test_cnt'])]
+
+    def gcc_step(test, i):
+        if "gcc_compile" in steps and test.get('no_gcc') != 1:
+            asm, cmd, objcopy_cmd = get_gcc_cmd(test, i, output_dir, argv.isa,
+                                                argv.mabi, argv.gcc_opts, cwd,
+                                                argv.debug)
+            outputs = objcopy_cmd.split()[-2:]
+            # pyflow already wrote the ELF and binary of +direct_binary=1 tests
+            if (re.search(r'direct_binary=1', test.get('gen_opts', '')) and
+                    all(os.path.isfile(output) for output in outputs)):
+                logging.info("Using {} generated with the assembly".format(
+                    outputs[0]))
+            else:
+                key = cache.get_key(asm, [cmd, objcopy_cmd],
+                                    outputs) if cache else None
+                if key and cache.fetch(key, outputs):
+                    logging.info("Using cached {}".format(outputs[0]))
+                else:
+                    logging.info("Compiling {}".format(asm))
+                    if not run_step("{} && {}".format(" ".join(cmd.split()),
+                                                      objcopy_cmd), None):
+                        return []
+                    if key:
+                        cache.store(key, outputs)
+        if "iss_sim" not in steps or test.get('no_iss') == 1:
+            return [(cmp_step, test, i)]
+        iss_pending[(test['test'], i)] = len(iss_list)
+        return [(iss_step, test, i, iss) for iss in iss_list]
+
+    def iss_step(test, i, iss):
+        elf, log, cmd = get_iss_sim_cmd(iss_base_cmd[iss], iss, test, i,
+                                        output_dir)
+        key = None
+        if iss_cache and os.path.isfile(elf):
+            key = iss_cache.get_key(elf, [cmd], [log])
+        if key and iss_cache.fetch(key, [log]):
+            logging.info("Using cached {} sim log of {}".format(iss, elf))
+            passed = True
+        else:
+            logging.info("Running {} sim: {}".format(iss, elf))
+            passed = run_step(cmd, argv.iss_timeout)
+            if passed and key:
+                iss_cache.store(key, [log])
+        # The comparison starts once every ISS is done with this test
+        with lock:
+            iss_pending[(test['test'], i)] -= 1
+            if not passed:
+                iss_failed.add((test['test'], i))
+            ready = (iss_pending[(test['test'], i)] == 0 and
+                     (test['test'], i) not in iss_failed)
+        return [(cmp_step, test, i)] if ready else []
+
+    def cmp_step(test, i):
+        # Converting and comparing the logs is CPU-bound, it runs in the
+        # process pool instead of holding the GIL of the step threads
+        elf = ("{}/asm_test/{}_{}.o".format(output_dir, test['test'], i))
+        future = cmp_pool.submit(
+            compare_iss_test, iss_list,
+            get_iss_log_list(iss_list, test, i, output_dir), elf,
+            argv.stop_on_first_error, get_trace_ext(argv.trace_format))
+        cmp_futures[future] = (test['test'], i)
+        return future
+
+    def submit(step):
+        if step[0] is cmp_step:
+            return cmp_step(*step[1:]) if compare else None
+        return pool.submit(*step)
+
+    gen_jobs = []
+    if "gen" in steps:
+        gen(test_list, argv, output_dir, cwd, gen_jobs, gen_server)
+        first_steps = [(gen_step, job) for job in gen_jobs]
+    else:
+        first_steps = [(gcc_step, test, i) for test in test_list
+                       for i in range(test['iterations'])]
+    logging.info("Running {} in a pipeline with {} jobs".format(
+        ",".join(steps), argv.jobs))
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=argv.jobs)
+    # The compare workers are not forked from this process, whose step
+    # threads may hold locks at the time of the fork
+    cmp_pool = None
+    if compare:
+        cmp_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=argv.jobs,
+            mp_context=multiprocessing.get_context("forkserver"))
+    cmp_futures = {}
+    try:
+        pending = set(filter(None, map(submit, first_steps)))
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in cmp_futures:
+                    # The report is written in test list order once the
+                    # pipeline is drained
+                    cmp_results[cmp_futures.pop(future)] = future.result()
+                    continue
+                for step in future.result():
+                    next_future = submit(step)
+                    if next_future:
+                        pending.add(next_future)
+    except BaseException as e:
+        # A failing step stops the pipeline like Ctrl-C does
+        pool.shutdown(wait=False, cancel_futures=True)
+        if cmp_pool:
+            cmp_pool.shutdown(wait=False, cancel_futures=True)
+        children.kill()
+        for resource in [cache, iss_cache, gen_server]:
+            if resource:
+                resource.close()
+        if isinstance(e, KeyboardInterrupt):
+            logging.info("\nExited Ctrl-C from user request.")
+            sys.exit(130)
+        raise
+    pool.shutdown()
+    if cmp_pool:
+        cmp_pool.shutdown()
+    if compare:
+        results = [cmp_results[(test['test'], i)] for test in test_list
+                   for i in range(test['iterations'])
+                   if (test['test'], i) in cmp_results]
+        with open(report, "w") as fd:
+            for text, _ in results:
+                fd.write(text)
+        save_regr_report(report, [result for _, result in results])
+    if failed:
+        logging.error("{} pipeline commands failed".format(len(failed)))
+        sys.exit(RET_FAIL)
+
+
 def read_seed(arg):
     """Read --seed or --seed_start"""
     try:
@@ -892,6 +1319,36 @@ def parse_args(cwd):
                         help="Run verilog style check")
     parser.add_argument("-d", "--debug", type=str, default="",
                         help="Generate debug command log file")
+    parser.add_argument("--trace_format", type=str, default="csv",
+                        choices=["csv", "columnar"],
+                        help="Format of the instruction trace converted from "
+                             "the ISS logs for iss_cmp")
+    parser.add_argument("--pipeline", action="store_true", default=False,
+                        help="Run gen, gcc_compile, iss_sim and iss_cmp as a "
+                             "per-test pipeline instead of one step after "
+                             "the other, use with --jobs")
+    parser.add_argument("--compile_cache", type=str, default="",
+                        help="Directory of a cache of the compiled tests, "
+                             "reused when the assembly, the GCC command "
+                             "line and the toolchain are unchanged")
+    parser.add_argument("--iss_cache", type=str, default="",
+                        help="Directory of a cache of the ISS simulation "
+                             "logs, reused when the ELF, the ISS command "
+                             "line and the ISS are unchanged")
+    parser.add_argument("--compile_cache_size", type=int, default=2048,
+                        help="Size limit of the compile and ISS caches in MB")
+    parser.add_argument("--compile_cache_age", type=int, default=30,
+                        help="Days after which an unused compile or ISS "
+                             "cache entry is evicted")
+    parser.add_argument("--gen_server", action="store_true", default=False,
+                        help="Run the pyflow generator jobs on a server "
+                             "process that loads the generator modules once, "
+                             "instead of starting Python for every job")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Maximum number of generator, GCC and ISS jobs "
+                             "run in parallel on the local machine. With "
+                             "--lsf_cmd it caps the number of jobs submitted "
+                             "at once, otherwise all of them are submitted")
 
     rsg = parser.add_argument_group('Random seeds',
                                     'To control random seeds, use at most one '
@@ -920,6 +1377,10 @@ def parse_args(cwd):
         logging.error('--start_seed and --seed are mutually exclusive.')
         sys.exit(RET_FAIL)
 
+    if args.jobs < 1:
+        logging.error('--jobs must be a positive integer.')
+        sys.exit(RET_FAIL)
+
     if args.seed is not None:
         if args.iterations == 0:
             args.iterations = 1
@@ -1029,6 +1490,14 @@ def main():
 
         # Create output directory
         output_dir = create_output(args.o, args.noclean)
+        cache = None
+        if args.compile_cache and not args.debug:
+            cache = CompileCache(args.compile_cache, args.compile_cache_size,
+                                 args.compile_cache_age)
+        iss_cache = None
+        if args.iss_cache and not args.debug:
+            iss_cache = CompileCache(args.iss_cache, args.compile_cache_size,
+                                     args.compile_cache_age, "ISS cache")
 
         if args.verilog_style_check:
             logging.debug("Run style check")
@@ -1046,16 +1515,19 @@ def main():
                     run_assembly_from_dir(full_path, args.iss_yaml, args.isa,
                                           args.mabi,
                                           args.gcc_opts, args.iss, output_dir,
-                                          args.core_setting_dir, args.debug)
+                                          args.core_setting_dir, args.debug,
+                                          cache)
                 # path_asm_test is an assembly file
                 elif os.path.isfile(full_path) or args.debug:
                     run_assembly(full_path, args.iss_yaml, args.isa, args.mabi,
                                  args.gcc_opts,
                                  args.iss, output_dir, args.core_setting_dir,
-                                 args.debug)
+                                 args.debug, cache)
                 else:
                     logging.error('{} does not exist'.format(full_path))
                     sys.exit(RET_FAIL)
+            if cache:
+                cache.close()
             return
 
         # Run any handcoded/directed c tests specified by args.c_test
@@ -1081,6 +1553,9 @@ def main():
             return
 
         run_cmd_output(["mkdir", "-p", ("{}/asm_test".format(output_dir))])
+        # The debug command log is written step by step, there is nothing to
+        # overlap between the steps
+        use_pipeline = args.pipeline and not args.co and not args.debug
         # Process regression test list
         matched_list = []
         # Any tests in the YAML test list that specify a directed assembly test
@@ -1120,6 +1595,16 @@ def main():
                     c_directed_list) == 0:
                 sys.exit("Cannot find {} in {}".format(args.test, args.testlist))
 
+        gen_server = None
+        if (args.gen_server and args.simulator == "pyflow" and matched_list
+                and (args.steps == "all" or re.match(".*gen.*", args.steps))):
+            if args.lsf_cmd or args.debug:
+                logging.warning("--gen_server is ignored with --lsf_cmd or "
+                                "--debug")
+            else:
+                gen_server = GenServer(cwd, args.target,
+                                       "{}/gen_server.log".format(output_dir))
+
         # Run instruction generator
         if args.steps == "all" or re.match(".*gen.*", args.steps):
             # Run any handcoded/directed assembly tests specified in YAML format
@@ -1137,13 +1622,14 @@ def main():
                                                   gcc_opts, args.iss,
                                                   output_dir,
                                                   args.core_setting_dir,
-                                                  args.debug)
+                                                  args.debug, cache)
                         # path_asm_test is an assembly file
                         elif os.path.isfile(path_asm_test):
                             run_assembly(path_asm_test, args.iss_yaml, args.isa,
                                          args.mabi, gcc_opts,
                                          args.iss, output_dir,
-                                         args.core_setting_dir, args.debug)
+                                         args.core_setting_dir, args.debug,
+                                         cache)
                         else:
                             if not args.debug:
                                 logging.error(
@@ -1175,30 +1661,41 @@ def main():
                                 sys.exit(RET_FAIL)
 
             # Run remaining tests using the instruction generator
-            gen(matched_list, args, output_dir, cwd)
+            if not use_pipeline:
+                gen(matched_list, args, output_dir, cwd, None, gen_server)
             #gen(arithmetic_basic,args,output_dir,cwd)
 
-        if not args.co:
+        if use_pipeline:
+            run_pipeline(matched_list, args, output_dir, cwd, cache,
+                         gen_server, iss_cache)
+        elif not args.co:
             # Compile the assembly program to ELF, convert to plain binary
             if args.steps == "all" or re.match(".*gcc_compile.*", args.steps):
                 gcc_compile(matched_list, output_dir, args.isa, args.mabi,
-                            args.gcc_opts, args.debug)
+                            args.gcc_opts, args.debug, args.jobs, cache)
 
             # Run ISS simulation
             if args.steps == "all" or re.match(".*iss_sim.*", args.steps):
                 iss_sim(matched_list, output_dir, args.iss, args.iss_yaml,
                         args.iss_opts,
                         args.isa, args.priv, args.core_setting_dir, args.iss_timeout,
-                        args.debug)
+                        args.debug, args.jobs, iss_cache)
 
             # Compare ISS simulation result
             if args.steps == "all" or re.match(".*iss_cmp.*", args.steps):
 
                 iss_cmp(matched_list, args.iss, output_dir,
                         args.stop_on_first_error,
-                        args.exp, args.debug)
+                        args.exp, args.debug, get_trace_ext(args.trace_format),
+                        args.jobs)
                 # Creates a report only when exactly two ISS are used
 
+        if cache:
+            cache.close()
+        if iss_cache:
+            iss_cache.close()
+        if gen_server:
+            gen_server.close()
         sys.exit(RET_SUCCESS)
     except KeyboardInterrupt:
         logging.info("\nExited Ctrl-C from user request.")
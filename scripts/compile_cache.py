@@ -0,0 +1,222 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Content-addressed cache of the compiled assembly tests and their ISS logs
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+
+class CompileCache:
+    """Cache of the files produced from a test by a list of commands
+
+    The ELF and binary files compiled from an assembly test, or the log of an
+    ISS simulation of an ELF file. An entry is keyed by the hash of the input
+    file, the command lines with the file names taken out, the version of the
+    tools, and the linker script, include and other files the commands refer
+    to. Cached files are copied into place rather than hard-linked: the tools
+    and the ISS log redirections truncate their output files in place, which
+    would overwrite the cache entry through a shared inode.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=2048, max_age_days=30,
+                 name="Compile cache"):
+        """
+        Args:
+          cache_dir    : Directory holding the cache entries
+          max_size_mb  : Total size the entries are evicted down to
+          max_age_days : Entries not used for this long are evicted
+          name         : Name of the cache in the statistics log
+        """
+        self.name = name
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = max_size_mb * 1024 * 1024
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.tool_version = {}
+        self.file_digest = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_tool_version(self, tool):
+        """Version string of a tool, read once per tool
+
+        Tools without a --version option, like most ISS, are identified by the
+        hash of their executable instead.
+        """
+        with self.lock:
+            if tool in self.tool_version:
+                return self.tool_version[tool]
+        try:
+            version = subprocess.check_output([tool, "--version"],
+                                              stderr=subprocess.STDOUT,
+                                              timeout=30)
+        except (OSError, subprocess.CalledProcessError,
+                subprocess.TimeoutExpired):
+            path = shutil.which(tool)
+            version = self.get_file_digest(path) if path else b""
+        with self.lock:
+            self.tool_version[tool] = version
+        return version
+
+    def get_file_digest(self, path):
+        """Hash of a file the commands depend on, read once per file version"""
+        stat = os.stat(path)
+        file_id = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if file_id in self.file_digest:
+                return self.file_digest[file_id]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.digest()
+        with self.lock:
+            self.file_digest[file_id] = digest
+        return digest
+
+    def get_key(self, src, cmd_list, outputs):
+        """Hash the inputs of a compilation or simulation
+
+        Args:
+          src      : Assembly test or ELF file
+          cmd_list : Commands producing the outputs from the source file
+          outputs  : Output files of the commands
+
+        Returns:
+          key      : Hex digest identifying the outputs
+        """
+        sha = hashlib.sha256()
+        with open(src, "rb") as f:
+            text = f.read()
+        sha.update(text)
+        if src.endswith(".S"):
+            # Data files the assembly includes, written by the generator next
+            # to the test
+            for name in re.findall(rb'\.incbin\s+"([^"]+)"', text):
+                path = os.path.join(os.path.dirname(src), name.decode())
+                if os.path.isfile(path):
+                    sha.update(name + b"\0" + self.get_file_digest(path))
+        for cmd in cmd_list:
+            args = cmd.split()
+            sha.update(self.get_tool_version(args[0]))
+            deps = []
+            for i, arg in enumerate(args):
+                if arg == src:
+                    arg = "<src>"
+                elif arg in outputs:
+                    arg = "<output{}>".format(outputs.index(arg))
+                elif arg.startswith("-T"):
+                    deps.append(arg[2:] or args[i + 1])
+                elif arg == "-I" + os.path.dirname(src):
+                    # The included data files of the test are hashed above
+                    arg = "-I<src_dir>"
+                elif arg.startswith("-I") and os.path.isdir(arg[2:]):
+                    deps.extend(sorted(os.path.join(arg[2:], name)
+                                       for name in os.listdir(arg[2:])))
+                elif i > 0 and os.path.isfile(arg):
+                    # Configuration files of the ISS
+                    deps.append(arg)
+                sha.update(arg.encode() + b"\0")
+            for dep in deps:
+                if os.path.isfile(dep):
+                    sha.update(dep.encode() + b"\0" + self.get_file_digest(dep))
+        return sha.hexdigest()
+
+    def get_entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, outputs):
+        """Copy the cached outputs into place
+
+        Returns:
+          True if every output was found in the cache
+        """
+        entry = self.get_entry(key)
+        cached = [os.path.join(entry, str(i)) for i in range(len(outputs))]
+        if not all(os.path.isfile(f) for f in cached):
+            with self.lock:
+                self.misses += 1
+            return False
+        for src, dst in zip(cached, outputs):
+            if os.path.lexists(dst):
+                os.remove(dst)
+            shutil.copyfile(src, dst)
+        # The entry age used for eviction counts from its last use
+        os.utime(entry)
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, outputs):
+        """Add the outputs of a finished compilation to the cache"""
+        entry = self.get_entry(key)
+        if os.path.isdir(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Fill a temporary directory and rename it, so that concurrent runs
+        # never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        try:
+            for i, output in enumerate(outputs):
+                shutil.copyfile(output, os.path.join(tmp_dir, str(i)))
+            os.rename(tmp_dir, entry)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self):
+        """Remove the entries unused for too long, then the least recently
+        used ones until the cache fits in its size limit"""
+        entries = []
+        now = time.time()
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, name)
+                try:
+                    mtime = os.stat(entry).st_mtime
+                    size = sum(os.stat(os.path.join(entry, f)).st_size
+                               for f in os.listdir(entry))
+                except OSError:
+                    continue
+                entries.append((mtime, size, entry))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, entry in entries:
+            if now - mtime <= self.max_age and total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            self.evicted += 1
+
+    def close(self):
+        """Evict old entries and report the cache statistics"""
+        if self.hits or self.misses:
+            self.evict()
+            logging.info("{} {}: {} hits, {} misses, {} evicted".format(
+                self.name, self.cache_dir, self.hits, self.misses,
+                self.evicted))
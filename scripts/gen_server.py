@@ -0,0 +1,120 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Client of the persistent pyflow generator server
+"""
+
+import atexit
+import json
+import logging
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from scripts.lib import RET_FAIL, ChildProcesses
+
+
+class GenServer:
+    """Pyflow generator server running the generator jobs of one target
+
+    The server imports the generator modules and builds the instruction
+    prototypes once, then forks a process per job. A job is the same command
+    line run.py would otherwise start as a new Python process.
+    """
+
+    def __init__(self, cwd, target, log):
+        """
+        Args:
+          cwd    : Filesystem path to RISCV-DV repo
+          target : Pre-defined target the server generates tests for
+          log    : Log file of the server
+        """
+        self.tmp_dir = tempfile.mkdtemp(prefix="riscv_dv_gen_")
+        self.socket = os.path.join(self.tmp_dir, "gen.sock")
+        with open(log, "w") as fd:
+            self.ps = subprocess.Popen(
+                [sys.executable,
+                 os.path.join(cwd, "pygen/pygen_src/riscv_gen_server.py"),
+                 "--socket", self.socket, "--target", target],
+                stdout=fd, stderr=subprocess.STDOUT)
+        atexit.register(self.close)
+        logging.info("Starting the {} generator server".format(target))
+        while not os.path.exists(self.socket):
+            if self.ps.poll() is not None:
+                logging.error("Generator server failed to start, see {}".format(
+                    log))
+                sys.exit(RET_FAIL)
+            time.sleep(0.1)
+
+    def run(self, cmd, timeout_s, children=None):
+        """Run a generator command on the server, same interface as run_job
+
+        Args:
+          cmd       : Generator command line
+          timeout_s : Timeout limit in seconds for this command
+          children  : ChildProcesses of the job list. The connection to the
+                      server is registered with them, killing them closes it
+                      and the server kills the job. The server also kills
+                      the timed out jobs
+
+        Returns:
+          rc        : Return code, None if the command timed out or the jobs
+                      were killed before it started
+          output    : command output
+        """
+        if children is None:
+            children = ChildProcesses()
+        args = shlex.split(cmd)
+        script = next(i for i, arg in enumerate(args) if arg.endswith(".py"))
+        req = {"script": os.path.abspath(args[script]),
+               "args": args[script + 1:], "timeout": timeout_s}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            with children.lock:
+                if children.stop.is_set():
+                    return None, ""
+                children.add(sock)
+            try:
+                sock.connect(self.socket)
+                # Killed while connecting, the connection was not shut down
+                if children.stop.is_set():
+                    return None, ""
+                sock.sendall(json.dumps(req).encode() + b"\n")
+                with sock.makefile("rb") as fd:
+                    reply = fd.readline()
+            except OSError:
+                reply = b""
+            finally:
+                with children.lock:
+                    children.discard(sock)
+        if children.stop.is_set():
+            return None, ""
+        if not reply:
+            return 1, "Generator server exited while running: {}".format(cmd)
+        reply = json.loads(reply)
+        if reply["rc"] is None:
+            logging.error("Timeout[{}s]: {}".format(timeout_s, cmd))
+        return reply["rc"], reply["output"]
+
+    def close(self):
+        """Stop the server"""
+        if self.ps.poll() is None:
+            self.ps.terminate()
+            self.ps.wait()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
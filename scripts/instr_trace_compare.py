@@ -32,7 +32,11 @@ def compare_trace_csv(csv1, csv2, name1, name2, log,
                       verbose=0,
                       mismatch_print_limit=5,
                       compare_final_value_only=0):
-    """Compare two trace CSV file"""
+    """Compare two trace CSV file
+
+    The result is appended to the log file, log can also be an open file
+    which is left open, or None to print it.
+    """
     matched_cnt = 0
     mismatch_cnt = 0
 
@@ -40,21 +44,25 @@ def compare_trace_csv(csv1, csv2, name1, name2, log,
     if compare_final_value_only:
         in_order_mode = 0
 
-    if log:
+    close_log = False
+    if hasattr(log, "write"):
+        fd = log
+    elif log:
         fd = open(log, 'a+')
+        close_log = True
     else:
         fd = sys.stdout
 
     fd.write("{} : {}\n".format(name1, csv1))
     fd.write("{} : {}\n".format(name2, csv2))
 
-    with open(csv1, "r") as fd1, open(csv2, "r") as fd2:
-        instr_trace_1 = []
-        instr_trace_2 = []
-        trace_csv_1 = RiscvInstructionTraceCsv(fd1)
-        trace_csv_2 = RiscvInstructionTraceCsv(fd2)
-        trace_csv_1.read_trace(instr_trace_1)
-        trace_csv_2.read_trace(instr_trace_2)
+    with open_trace(csv1) as trace_csv_1, open_trace(csv2) as trace_csv_2:
+        # Both traces are streamed, only the current entry of trace 1 and a
+        # one entry lookahead of trace 2 are kept in memory. The GPR updates
+        # are compared as integers, the columnar traces provide them without
+        # any string parsing.
+        instr_trace_1 = trace_csv_1.iter_gpr_update()
+        instr_trace_2 = trace_csv_2.iter_gpr_update()
         trace_1_index = 0
         trace_2_index = 0
         mismatch_cnt = 0
@@ -62,76 +70,64 @@ def compare_trace_csv(csv1, csv2, name1, name2, log,
         if in_order_mode:
             gpr_val_1 = {}
             gpr_val_2 = {}
-            for trace in instr_trace_1:
+            gpr = None
+            entry = None
+            gpr_2 = None
+            entry_2 = None
+            next_trace_2 = next(instr_trace_2, None)
+            for gpr, entry in instr_trace_1:
                 trace_1_index += 1
-                if len(trace.gpr) == 0:
+                if len(gpr) == 0:
                     continue
                 # Check if there's a GPR change caused by this instruction
-                gpr_state_change_1 = check_update_gpr(trace.gpr, gpr_val_1)
+                gpr_state_change_1 = check_update_gpr(gpr, gpr_val_1)
                 if gpr_state_change_1 == 0:
                     continue
                 # Move forward the other trace until a GPR update happens
                 gpr_state_change_2 = 0
-                while (gpr_state_change_2 == 0 and trace_2_index < len(
-                        instr_trace_2)):
-                    gpr_state_change_2 = check_update_gpr(
-                        instr_trace_2[trace_2_index].gpr,
-                        gpr_val_2)
+                while gpr_state_change_2 == 0 and next_trace_2 is not None:
+                    gpr_2, entry_2 = next_trace_2
+                    gpr_state_change_2 = check_update_gpr(gpr_2, gpr_val_2)
                     trace_2_index += 1
+                    next_trace_2 = next(instr_trace_2, None)
                 # Check if the GPR update is the same between trace 1 and 2
                 if gpr_state_change_2 == 0:
                     mismatch_cnt += 1
                     fd.write("Mismatch[{}]:\n[{}] {} : {}\n".format(
-                      mismatch_cnt, trace_1_index, name1,trace.get_trace_string()))
+                      mismatch_cnt, trace_1_index, name1,
+                      trace_csv_1.get_trace_string(entry)))
                     fd.write("{} instructions left in trace {}\n".format(
-                      len(instr_trace_1) - trace_1_index + 1, name1))
-                elif len(trace.gpr) != len(
-                        instr_trace_2[trace_2_index - 1].gpr):
+                      sum(1 for _ in instr_trace_1) + 1, name1))
+                elif gpr != gpr_2:
                     mismatch_cnt += 1
                     # print first few mismatches
                     if mismatch_cnt <= mismatch_print_limit:
                         fd.write("Mismatch[{}]:\n{}[{}] : {}\n".format(
                           mismatch_cnt, name1, trace_2_index - 1,
-                          trace.get_trace_string()))
+                          trace_csv_1.get_trace_string(entry)))
                         fd.write("{}[{}] : {}\n".format(
                           name2, trace_2_index - 1,
-                          instr_trace_2[
-                            trace_2_index - 1].get_trace_string()))
+                          trace_csv_2.get_trace_string(entry_2)))
                 else:
-                    found_mismatch = 0
-                    for i in range(len(trace.gpr)):
-                        if trace.gpr[i] != instr_trace_2[trace_2_index - 1].gpr[i]:
-                            mismatch_cnt += 1
-                            found_mismatch = 1
-                            # print first few mismatches
-                            if mismatch_cnt <= mismatch_print_limit:
-                                fd.write("Mismatch[{}]:\n{}[{}] : {}\n".format(
-                                    mismatch_cnt, name1, trace_2_index - 1,
-                                    trace.get_trace_string()))
-                                fd.write("{}[{}] : {}\n".format(
-                                    name2, trace_2_index - 1,
-                                    instr_trace_2[
-                                        trace_2_index - 1].get_trace_string()))
-                            break
-                    if not found_mismatch:
-                        matched_cnt += 1
+                    matched_cnt += 1
                 # Break the loop if it reaches the end of trace 2
-                if trace_2_index == len(instr_trace_2):
+                if next_trace_2 is None:
                     break
             # Check if there's remaining instruction that change architectural state
-            if trace_2_index != len(instr_trace_2):
-                while trace_2_index < len(instr_trace_2):
-                    gpr_state_change_2 = check_update_gpr(
-                        instr_trace_2[trace_2_index].gpr,
-                        gpr_val_2)
-                    if gpr_state_change_2 == 1:
-                        fd.write("Mismatch[{}]:\n[{}] {} : {}\n".format(
-                            mismatch_cnt, trace_1_index, name1,trace.get_trace_string()))
-                        fd.write("{} instructions left in trace {}\n".format(
-                          len(instr_trace_2) - trace_2_index, name2))
-                        mismatch_cnt += len(instr_trace_2) - trace_2_index
-                        break
-                    trace_2_index += 1
+            while next_trace_2 is not None:
+                gpr_state_change_2 = check_update_gpr(next_trace_2[0],
+                                                      gpr_val_2)
+                if gpr_state_change_2 == 1:
+                    left_cnt = sum(1 for _ in instr_trace_2) + 1
+                    fd.write("Mismatch[{}]:\n[{}] {} : {}\n".format(
+                        mismatch_cnt, trace_1_index, name1,
+                        trace_csv_1.get_trace_string(entry)))
+                    fd.write("{} instructions left in trace {}\n".format(
+                      left_cnt, name2))
+                    mismatch_cnt += left_cnt
+                    break
+                trace_2_index += 1
+                next_trace_2 = next(instr_trace_2, None)
         else:
             pass
             # TODO: Enable out of order comparison
@@ -216,7 +212,7 @@ def compare_trace_csv(csv1, csv2, name1, name2, log,
             compare_result = "[FAILED]: {} matched, {} mismatch\n".format(
                 matched_cnt, mismatch_cnt)
         fd.write(compare_result + "\n")
-        if log:
+        if close_log:
             fd.close()
         return compare_result
 
@@ -234,21 +230,19 @@ def compare_trace_csv(csv1, csv2, name1, name2, log,
 
 
 def check_update_gpr(gpr_update, gpr):
+    """Update the GPR values with the (reg, value) pairs of an entry
+
+    Returns:
+      1 if a GPR value is changed, 0 otherwise
+    """
     gpr_state_change = 0
-    for update in gpr_update:
-        if update == "":
-            return 0
-        item = update.split(":")
-        if len(item) != 2:
-            sys.exit("Illegal GPR update format:" + update)
-        rd = item[0]
-        rd_val = item[1]
-        if rd in gpr:
-            if rd_val != gpr[rd]:
-                gpr_state_change = 1
-        else:
-            if int(rd_val, 16) != 0:
-                gpr_state_change = 1
+    for rd, rd_val in gpr_update:
+        if rd_val is None:
+            if rd == "":
+                return 0
+            sys.exit("Illegal GPR update format:" + rd)
+        if gpr.get(rd, 0) != rd_val:
+            gpr_state_change = 1
         gpr[rd] = rd_val
     return gpr_state_change
 
@@ -257,9 +251,9 @@ def main():
     # Parse input arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--csv_file_1", type=str,
-                        help="Instruction trace 1 CSV")
+                        help="Instruction trace 1 CSV or columnar trace")
     parser.add_argument("--csv_file_2", type=str,
-                        help="Instruction trace 2 CSV")
+                        help="Instruction trace 2 CSV or columnar trace")
     parser.add_argument("--csv_name_1", type=str,
                         help="Instruction trace 1 name")
     parser.add_argument("--csv_name_2", type=str,
@@ -16,6 +16,8 @@ limitations under the License.
 Parse the regression testlist in YAML format
 """
 
+import concurrent.futures
+import gzip
 import os
 import random
 import sys
@@ -24,7 +26,10 @@ import subprocess
 import time
 import yaml
 import logging
+import mmap
 import signal
+import socket
+import threading
 
 from datetime import date
 
@@ -32,6 +37,9 @@ RET_SUCCESS = 0
 RET_FAIL    = 1
 RET_FATAL   = -1
 
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
 
 def setup_logging(verbose):
     """Setup the root logger.
@@ -140,54 +148,163 @@ def run_cmd(cmd, timeout_s=3600, exit_on_error=1, check_return_code=True,
     return output
 
 
+def kill_process_group(ps):
+    """Terminate a child process together with its process group"""
+    try:
+        os.killpg(os.getpgid(ps.pid), signal.SIGTERM)
+    except AttributeError: #killpg not available on windows
+        ps.kill()
+    except ProcessLookupError:
+        pass
+
+
+class ChildProcesses(set):
+    """Running child processes of a job list
+
+    Once the jobs are killed, the stop event keeps the jobs still being
+    started from running their command. The lock makes checking the event
+    and adding a new process atomic with the kill. Jobs running on a server
+    register their connection instead, which is shut down on kill.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def kill(self):
+        """Terminate the running processes and start no new ones"""
+        with self.lock:
+            self.stop.set()
+            procs = list(self)
+        for ps in procs:
+            if isinstance(ps, socket.socket):
+                try:
+                    ps.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            else:
+                kill_process_group(ps)
+
+
+def run_job(cmd, timeout_s, children=None):
+    """Run a single shell command of a parallel job list
+
+    Unlike run_cmd, a failure never exits the script, the caller decides what
+    to do with the return code.
+
+    Args:
+      cmd       : shell command to run
+      timeout_s : Timeout limit in seconds for this command
+      children  : ChildProcesses of the running jobs, shared with the
+                  scheduler
+
+    Returns:
+      rc        : Return code, None if the command timed out or the jobs
+                  were killed before it started
+      output    : command output
+    """
+    if children is None:
+        children = ChildProcesses()
+    with children.lock:
+        if children.stop.is_set():
+            return None, ""
+        # No "exec" prefix so that chained commands (a && b) run as one job,
+        # the whole process group is terminated on timeout anyway
+        ps = subprocess.Popen(cmd,
+                              shell=True,
+                              executable='/bin/bash',
+                              universal_newlines=True,
+                              start_new_session=True,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT)
+        children.add(ps)
+    try:
+        output = ps.communicate(timeout=timeout_s)[0]
+        rc = ps.returncode
+    except subprocess.TimeoutExpired:
+        logging.error("Timeout[{}s]: {}".format(timeout_s, cmd))
+        kill_process_group(ps)
+        output = ps.communicate()[0]
+        rc = None
+    finally:
+        with children.lock:
+            children.discard(ps)
+    return rc, output
+
+
 def run_parallel_cmd(cmd_list, timeout_s=999, exit_on_error=0,
-                     check_return_code=True, debug_cmd=None):
+                     check_return_code=True, debug_cmd=None, jobs=0,
+                     runner=run_job):
     """Run a list of commands in parallel
 
+    At most `jobs` commands are running at any time, the rest are queued and
+    started as soon as a running command finishes. Commands are reaped in
+    completion order and each of them gets its own timeout.
+
     Args:
-      cmd_list: command list
+      cmd_list          : command list
+      timeout_s         : Timeout limit in seconds of each command
+      exit_on_error     : Stop all commands and exit on the first failure
+      check_return_code : Check return code of the commands
+      debug_cmd         : Produce the debug cmd log without running
+      jobs              : Maximum number of concurrent commands, 0 means
+                          all commands are started at once
+      runner            : Function running one command, same interface as
+                          run_job
 
     Returns:
-      command output
+      List of (return code, output) of each command, in cmd_list order
     """
     if debug_cmd:
         for cmd in cmd_list:
             debug_cmd.write(cmd)
             debug_cmd.write("\n\n")
         return
-    children = []
-    for cmd in cmd_list:
-        ps = subprocess.Popen("exec " + cmd,
-                              shell=True,
-                              executable='/bin/bash',
-                              universal_newlines=True,
-                              start_new_session=True,
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.STDOUT)
-        children.append(ps)
-    for i in range(len(children)):
-        logging.info("Command progress: {}/{}".format(i + 1, len(children)))
-        logging.debug("Waiting for command: {}".format(cmd_list[i]))
-        try:
-            output = children[i].communicate(timeout=timeout_s)[0]
-        except KeyboardInterrupt:
-            logging.info("\nExited Ctrl-C from user request.")
-            sys.exit(130)
-        except subprocess.TimeoutExpired:
-            logging.error("Timeout[{}s]: {}".format(timeout_s, cmd))
-            try:
-                os.killpg(os.getpgid(children[i].pid), signal.SIGTERM)
-            except AttributeError: #killpg not available on windows
-                children[i].kill()
-        rc = children[i].returncode
-        if rc and check_return_code and rc > 0:
-            logging.info(output)
-            logging.error("ERROR return code: {}, cmd:{}".format(rc, cmd))
-            if exit_on_error:
-                sys.exit(RET_FAIL)
-        # Restore stty setting otherwise the terminal may go crazy
-        os.system("stty sane")
-        logging.debug(output)
+    if not cmd_list:
+        return []
+    if jobs <= 0 or jobs > len(cmd_list):
+        jobs = len(cmd_list)
+    results = [None] * len(cmd_list)
+    children = ChildProcesses()
+    done_cnt = 0
+    failed = False
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    try:
+        futures = {pool.submit(runner, cmd, timeout_s, children): i
+                   for i, cmd in enumerate(cmd_list)}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            cmd = cmd_list[i]
+            rc, output = future.result()
+            results[i] = (rc, output)
+            done_cnt += 1
+            logging.info("Command progress: {}/{}".format(done_cnt,
+                                                          len(cmd_list)))
+            logging.debug("Finished command: {}".format(cmd))
+            # A timed out command is a failure, run_job has logged it
+            if rc is None or (rc and check_return_code and rc > 0):
+                if rc is not None:
+                    logging.info(output)
+                    logging.error("ERROR return code: {}, cmd:{}".format(
+                        rc, cmd))
+                if exit_on_error:
+                    failed = True
+                    break
+            logging.debug(output)
+    except KeyboardInterrupt:
+        logging.info("\nExited Ctrl-C from user request.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        children.kill()
+        sys.exit(130)
+    if failed:
+        pool.shutdown(wait=False, cancel_futures=True)
+        children.kill()
+        sys.exit(RET_FAIL)
+    pool.shutdown()
+    # Restore stty setting otherwise the terminal may go crazy
+    os.system("stty sane")
+    return results
 
 
 def run_cmd_output(cmd, debug_cmd=None):
@@ -263,6 +380,90 @@ def create_output(output, noclean, prefix="out_"):
     return output
 
 
+def read_log_lines(path, block_size=1 << 24):
+    """Iterate over the lines of a simulation log, without line ending
+
+    The log is memory-mapped and decoded one block of lines at a time, which
+    is much cheaper than reading and decoding it line by line. gzip and zstd
+    compressed logs are decompressed on the fly.
+
+    Args:
+      path       : Simulation log
+      block_size : Size of the blocks decoded at once in bytes
+    """
+    with open(path, "rb") as fd:
+        magic = fd.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC) or magic == ZSTD_MAGIC:
+        yield from read_compressed_log_lines(path, magic, block_size)
+        return
+    with open(path, "rb") as fd:
+        size = os.fstat(fd.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            start = 0
+            while start < size:
+                end = buf.rfind(b"\n", start, start + block_size) + 1
+                if end <= start:
+                    # A line longer than the block
+                    end = buf.find(b"\n", start + block_size) + 1 or size
+                lines = buf[start:end].decode(errors="replace").split("\n")
+                if not lines[-1]:
+                    # The block ends with a line ending
+                    lines.pop()
+                yield from lines
+                start = end
+
+
+def read_compressed_log_lines(path, magic, block_size):
+    """Iterate over the lines of a gzip or zstd compressed simulation log
+
+    zstd logs are decompressed by the zstandard package, or by the zstd
+    command when the package is not installed.
+    """
+    proc = None
+    if magic.startswith(GZIP_MAGIC):
+        stream = gzip.open(path, "rb")
+    else:
+        try:
+            import zstandard
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                open(path, "rb"), closefd=True)
+        except ImportError:
+            try:
+                proc = subprocess.Popen(["zstd", "-dcq", path],
+                                        stdout=subprocess.PIPE)
+            except OSError:
+                logging.error("Please install the zstandard package to read "
+                              "zstd compressed logs: pip install zstandard")
+                sys.exit(RET_FAIL)
+            stream = proc.stdout
+    try:
+        rest = b""
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+            block = rest + block
+            end = block.rfind(b"\n") + 1
+            rest = block[end:]
+            if end:
+                lines = block[:end].decode(errors="replace").split("\n")
+                lines.pop()
+                yield from lines
+        # A truncated or corrupt log must not pass as a shorter trace
+        if proc is not None and proc.wait():
+            logging.error("Cannot decompress {}, zstd return code: {}".format(
+                path, proc.returncode))
+            sys.exit(RET_FAIL)
+        if rest:
+            yield rest.decode(errors="replace")
+    finally:
+        stream.close()
+        if proc is not None:
+            proc.wait()
+
+
 def gpr_to_abi(gpr):
     """Convert a general purpose register to its corresponding abi name"""
     switcher = {
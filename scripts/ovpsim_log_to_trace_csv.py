@@ -17,7 +17,6 @@ limitations under the License.
 Convert ovpsim sim log to standard riscv-dv .csv instruction trace format
 """
 import re
-import os
 import argparse
 import logging
 
@@ -69,50 +68,59 @@ def process_ovpsim_sim_log(ovpsim_log, csv,
     log and save to a list.
     """
     logging.info("Processing ovpsim log : {}".format(ovpsim_log))
-
-    # Remove the header part of ovpsim log
-    cmd = ("sed -i '/Info 1:/,$!d' {}".format(ovpsim_log))
-    os.system(cmd)
-    # Remove all instructions after end of trace data (end of program excecution)
     if dont_truncate_after_first_ecall:
-        cmd = ("sed -i '/^Info --/q' {}".format(ovpsim_log))
         logging.info("Dont truncate logfile after first ecall: {}".format(ovpsim_log))
-    else:
-        cmd = ("sed -i '/ecall/q' {}".format(ovpsim_log))
-    os.system(cmd)
 
     instr_cnt = 0
-    with open(ovpsim_log, "r") as f, open(csv, "w") as csv_fd:
-        trace_csv = RiscvInstructionTraceCsv(csv_fd)
+    in_trace = False
+    with open_trace(csv, "w") as trace_csv:
         trace_csv.start_new_trace()
         prev_trace = 0
-        for line in f:
-            # Extract instruction infromation
-            m = INSTR_RE.search(line)
+        entries = []
+        # The log may be gzip or zstd compressed, and is left untouched
+        for line in read_log_lines(ovpsim_log):
+            # Skip the header part of ovpsim log
+            if not in_trace:
+                if "Info 1:" not in line:
+                    continue
+                in_trace = True
+            # Stop after the end of trace data (end of program excecution)
+            if dont_truncate_after_first_ecall:
+                end_of_trace = line.startswith("Info --")
+            else:
+                end_of_trace = "ecall" in line
+            # Extract instruction infromation, only the instruction lines
+            # mention the cpu and only the register changes have an arrow
+            m = INSTR_RE.search(line) if "riscvOVPsim" in line else None
             if m:
                 if prev_trace:  # write out the previous one when find next one
-                    trace_csv.write_trace_entry(prev_trace)
+                    entries.append(prev_trace)
                     instr_cnt += 1
-                    prev_trace = 0
+                    if len(entries) == TRACE_BATCH_SIZE:
+                        trace_csv.write_trace_entries(entries)
+                        entries = []
                 prev_trace = RiscvInstructionTraceEntry()
-                prev_trace.instr_str = m.group("instr_str")
-                prev_trace.pc = m.group("addr")
-                prev_trace.mode = convert_mode(m.group("mode"), line)
-                prev_trace.binary = m.group("bin")
+                (prev_trace.instr_str, prev_trace.pc, mode,
+                 prev_trace.binary) = m.group("instr_str", "addr", "mode", "bin")
+                prev_trace.mode = convert_mode(mode, line)
                 if full_trace:
                     prev_trace.instr = prev_trace.instr_str.split(" ")[0]
                     prev_trace.operand = prev_trace.instr_str[
                                          len(prev_trace.instr):]
                     prev_trace.operand = prev_trace.operand.replace(" ", "")
                     process_trace(prev_trace)
-                continue
-            # Extract register change value information
-            c = RD_RE.search(line)
-            if c:
-                if is_csr(c.group("r")):
-                    prev_trace.csr.append(c.group("r") + ":" + c.group("val"))
-                else:
-                    prev_trace.gpr.append(c.group("r") + ":" + c.group("val"))
+            elif " -> " in line:
+                # Extract register change value information
+                c = RD_RE.search(line)
+                if c:
+                    r, val = c.group("r", "val")
+                    if is_csr(r):
+                        prev_trace.csr.append(r + ":" + val)
+                    else:
+                        prev_trace.gpr.append(r + ":" + val)
+            if end_of_trace:
+                break
+        trace_csv.write_trace_entries(entries)
     logging.info("Processed instruction count : {} ".format(instr_cnt))
     if instr_cnt == 0:
         logging.error("No Instructions in logfile: {}".format(ovpsim_log))
@@ -200,8 +208,12 @@ def main():
     """ if used standalone set up for testing """
     # Parse input arguments
     parser = argparse.ArgumentParser()
-    parser.add_argument("--log", type=str, help="Input ovpsim simulation log")
-    parser.add_argument("--csv", type=str, help="Output trace csv_buf file")
+    parser.add_argument("--log", type=str,
+                        help="Input ovpsim simulation log, may be gzip or "
+                             "zstd compressed")
+    parser.add_argument("--csv", type=str,
+                        help="Output trace csv_buf file, a .ctrace file name "
+                             "selects the columnar trace format")
     parser.add_argument("--verbose", dest="verbose", action="store_true",
                         help="Verbose logging")
     parser.add_argument("--stop_on_first_error", dest="stop_on_first_error",
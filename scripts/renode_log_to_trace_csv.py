@@ -127,9 +127,8 @@ def write_csv(file_name, data):
     Writes the trace to CSV
     """
 
-    with open(file_name, "w") as fp:
+    with open_trace(file_name, "w") as writer:
 
-        writer = RiscvInstructionTraceCsv(fp)
         writer.start_new_trace()
 
         for entry in data:
@@ -142,7 +141,9 @@ def main():
     # Parse input arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--log", type=str, help="Input Renode simulation log")
-    parser.add_argument("--csv", type=str, help="Output trace CSV file")
+    parser.add_argument("--csv", type=str,
+                        help="Output trace CSV file, a .ctrace file name "
+                             "selects the columnar trace format")
     parser.add_argument("-v", "--verbose", dest="verbose", action="store_true",
                         help="Verbose logging")
     parser.set_defaults(verbose=False)
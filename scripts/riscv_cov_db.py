@@ -0,0 +1,379 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Mergeable functional coverage database
+"""
+
+import argparse
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from lib import *
+
+COV_DB_EXT = ".covdb"
+COV_DB_VERSION = 1
+
+
+class RiscvCoverageDb(object):
+    """Bin hit counts of the covergroups, which can be merged across runs
+
+    The database is a gzip compressed JSON document:
+
+      {"version": 1,
+       "traces": [<sampled trace>],
+       "covergroups": {<covergroup>: {"weight": <weight>,
+                                      "coverpoints": {<name>: <item>},
+                                      "crosses": {<name>: <item>}}}}
+
+    where an item is {"weight": <weight>, "goal": <at_least>,
+    "bins": [<bin name>], "hits": [<bin hit count>]}.
+    """
+
+    def __init__(self, data=None):
+        if data is None:
+            data = {"version": COV_DB_VERSION, "traces": [], "covergroups": {}}
+        elif data.get("version") != COV_DB_VERSION:
+            raise ValueError("Unsupported coverage database version {}".format(
+                data.get("version")))
+        self.data = data
+        self.traces = data.setdefault("traces", [])
+        self.covergroups = data["covergroups"]
+
+    @classmethod
+    def from_report(cls, report, traces=()):
+        """Build the database from a PyVSC/PyUCIS coverage report model"""
+        db = cls()
+        db.traces.extend(traces)
+        for cg in report.covergroups:
+            db.covergroups[cg.name] = {
+                "weight": cg.weight,
+                "coverpoints": {cp.name: cls.report_item(cp)
+                                for cp in cg.coverpoints},
+                "crosses": {cr.name: cls.report_item(cr)
+                            for cr in cg.crosses}}
+        return db
+
+    @staticmethod
+    def report_item(item):
+        return {"weight": item.weight,
+                "goal": item.bins[0].goal if item.bins else 1,
+                "bins": [b.name for b in item.bins],
+                "hits": [b.count for b in item.bins]}
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt") as fd:
+            return cls(json.load(fd))
+
+    def save(self, path):
+        # Write to a temporary file first, so that an interrupted run never
+        # leaves a truncated database behind
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", compresslevel=6) as fd:
+            json.dump(self.data, fd, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def merge(self, other):
+        """Add the bin hit counts of another database to this one"""
+        self.traces.extend(other.traces)
+        for cg_name, src_cg in other.covergroups.items():
+            dst_cg = self.covergroups.get(cg_name)
+            if dst_cg is None:
+                self.covergroups[cg_name] = copy.deepcopy(src_cg)
+                continue
+            for kind in ("coverpoints", "crosses"):
+                dst_items = dst_cg[kind]
+                for name, src in src_cg[kind].items():
+                    dst = dst_items.get(name)
+                    if dst is None:
+                        dst_items[name] = copy.deepcopy(src)
+                    else:
+                        self.merge_item(dst, src)
+        return self
+
+    @staticmethod
+    def merge_item(dst, src):
+        if dst["bins"] == src["bins"]:
+            dst["hits"] = [a + b for a, b in zip(dst["hits"], src["hits"])]
+            return
+        # The bins differ when the shards were built by different versions of
+        # the coverage model, merge them by name
+        bin_idx = {name: i for i, name in enumerate(dst["bins"])}
+        for name, hits in zip(src["bins"], src["hits"]):
+            i = bin_idx.get(name)
+            if i is None:
+                bin_idx[name] = len(dst["bins"])
+                dst["bins"].append(name)
+                dst["hits"].append(hits)
+            else:
+                dst["hits"][i] += hits
+
+    @staticmethod
+    def get_item_coverage(item):
+        if not item["hits"]:
+            return 0.0
+        goal = item["goal"]
+        hit_cnt = sum(1 for hits in item["hits"] if hits >= goal)
+        return 100.0 * hit_cnt / len(item["hits"])
+
+    def get_covergroup_coverage(self, cg_name):
+        """Coverage of a covergroup, weighted as in the PyUCIS report"""
+        cg = self.covergroups[cg_name]
+        coverage = 0.0
+        div = 0
+        for item in cg["coverpoints"].values():
+            if item["weight"] > 0:
+                coverage += self.get_item_coverage(item) * item["weight"]
+            div += item["weight"]
+        for item in cg["crosses"].values():
+            coverage += self.get_item_coverage(item) * item["weight"]
+            div += item["weight"]
+        if div > 0:
+            coverage /= div
+        return coverage
+
+    def get_coverage(self):
+        """Total coverage of all the covergroups"""
+        coverage = 0.0
+        div = 0
+        for cg_name, cg in self.covergroups.items():
+            if cg["weight"] > 0:
+                coverage += self.get_covergroup_coverage(cg_name) * cg["weight"]
+            div += cg["weight"]
+        if div > 0:
+            coverage /= div
+        return coverage
+
+    def write_summary(self, fd):
+        """Write the covergroup summary in the CoverageReport.txt format"""
+        from tabulate import tabulate
+        fd.write("Groups Coverage Summary\n")
+        fd.write("Total groups in report: {}\n".format(len(self.covergroups)))
+        headers = ["SCORE", "WEIGHT", "NAME"]
+        table = []
+        for cg_name, cg in self.covergroups.items():
+            table.append([self.get_covergroup_coverage(cg_name), cg["weight"],
+                          cg_name])
+        fd.write(tabulate(table, headers, tablefmt="grid",
+                          numalign="center", stralign="center"))
+        fd.write("\nTotal coverage: {:.2f}%\n".format(self.get_coverage()))
+
+
+def find_cov_db(path_list, exclude=()):
+    """Find the coverage databases of a list of files and directories
+
+    Args:
+      path_list : Database files, or directories searched recursively
+      exclude   : Database files to leave out
+
+    Returns:
+      Sorted list of the database paths
+    """
+    exclude = {os.path.realpath(path) for path in exclude}
+    db_list = []
+    for path in path_list:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                db_list.extend(os.path.join(root, name) for name in files
+                               if name.endswith(COV_DB_EXT))
+        else:
+            db_list.append(path)
+    return sorted(path for path in db_list
+                  if os.path.realpath(path) not in exclude)
+
+
+def get_trace_hash(path, block_size=1 << 20):
+    """SHA-1 of the content of a trace file"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RiscvCoverageIndex(object):
+    """Persistent coverage database, updated incrementally
+
+    The database directory holds the coverage databases of the past coverage
+    batches, and an index of the traces folded into each of them. A trace is
+    identified by its path and content hash, the hash is only recomputed when
+    the size or modification time of the trace changed.
+
+      {"version": 1, "next_shard": <n>,
+       "traces": {<trace>: {"size": <size>, "mtime_ns": <mtime>,
+                            "hash": <sha1>, "shard": <database>}}}
+
+    The coverage of a changed or removed trace can't be told apart from the
+    other traces of its batch, the whole batch is dropped and its remaining
+    traces are sampled again.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, self.INDEX_FILE)
+        self.index = {"version": COV_DB_VERSION, "next_shard": 0, "traces": {}}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r") as fd:
+                self.index = json.load(fd)
+        self.traces = self.index["traces"]
+        # Stat and hash of the traces to be sampled
+        self.pending = {}
+        self.stale_shards = set()
+
+    def get_trace_info(self, path):
+        stat = os.stat(path)
+        info = self.traces.get(path)
+        if info is not None and info["size"] == stat.st_size and \
+                info["mtime_ns"] == stat.st_mtime_ns:
+            return info
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "hash": get_trace_hash(path)}
+
+    def get_stale_traces(self, trace_list):
+        """Get the traces which are not folded into the database yet
+
+        Args:
+          trace_list : All the traces to be covered
+
+        Returns:
+          The new or changed traces, and the traces sharing a batch with a
+          changed or removed trace
+        """
+        trace_list = [os.path.abspath(path) for path in trace_list]
+        current = set(trace_list)
+        for path, info in self.traces.items():
+            if path not in current:
+                self.stale_shards.add(info["shard"])
+        for path in trace_list:
+            info = self.get_trace_info(path)
+            old_info = self.traces.get(path)
+            if old_info is None or old_info["hash"] != info["hash"]:
+                if old_info is not None:
+                    self.stale_shards.add(old_info["shard"])
+                self.pending[path] = info
+            elif info is not old_info:
+                # Touched but unchanged
+                old_info.update(size=info["size"], mtime_ns=info["mtime_ns"])
+        for path in trace_list:
+            info = self.traces.get(path)
+            if info is not None and info["shard"] in self.stale_shards:
+                self.pending.setdefault(path, info)
+        logging.info("{} of {} traces to be sampled, {} stale coverage "
+                     "batches".format(len(self.pending), len(trace_list),
+                                      len(self.stale_shards)))
+        return [path for path in trace_list if path in self.pending]
+
+    def update(self, db_list):
+        """Fold the coverage databases of the sampled traces into the index
+
+        Args:
+          db_list : Coverage databases of the traces from get_stale_traces
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.traces = {path: info for path, info in self.traces.items()
+                       if info["shard"] not in self.stale_shards}
+        for db_path in db_list:
+            db = RiscvCoverageDb.load(db_path)
+            if not db.traces or \
+                    not all(path in self.pending for path in db.traces):
+                # Left over by a previous run in the same output directory
+                logging.warning("Skip coverage database of traces which are "
+                                "not being sampled: {}".format(db_path))
+                continue
+            shard = "shard_{}{}".format(self.index["next_shard"], COV_DB_EXT)
+            self.index["next_shard"] += 1
+            shutil.copyfile(db_path, os.path.join(self.path, shard))
+            for path in db.traces:
+                info = self.pending.get(path)
+                if info is None:
+                    info = self.get_trace_info(path)
+                self.traces[path] = dict(info, shard=shard)
+        self.index["traces"] = self.traces
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as fd:
+            json.dump(self.index, fd, indent=1)
+        os.replace(tmp_path, self.index_path)
+        for shard in self.stale_shards:
+            shard_path = os.path.join(self.path, shard)
+            if os.path.isfile(shard_path):
+                os.remove(shard_path)
+        self.pending = {}
+        self.stale_shards = set()
+
+    def get_shards(self):
+        """Coverage databases of all the traces in the index"""
+        return sorted(os.path.join(self.path, shard) for shard in
+                      {info["shard"] for info in self.traces.values()})
+
+
+def merge_cov_db(db_list, output, report=None):
+    """Merge coverage databases
+
+    Args:
+      db_list : Coverage databases to merge
+      output  : Merged coverage database
+      report  : Summary report of the merged database, None to skip it
+
+    Returns:
+      The merged database
+    """
+    merged = RiscvCoverageDb()
+    for path in db_list:
+        logging.debug("Merging coverage database {}".format(path))
+        merged.merge(RiscvCoverageDb.load(path))
+    merged.save(output)
+    if report:
+        with open(report, "w") as fd:
+            merged.write_summary(fd)
+    logging.info("Merged {} coverage databases to {}, total coverage "
+                 "{:.2f}%".format(len(db_list), output, merged.get_coverage()))
+    return merged
+
+
+def main():
+    # Parse input arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", type=str, nargs="+",
+                        help="Coverage databases, or directories searched for "
+                             "*{} files".format(COV_DB_EXT))
+    parser.add_argument("-o", "--output", type=str, required=True,
+                        help="Merged coverage database")
+    parser.add_argument("--report", type=str, default="",
+                        help="Summary report of the merged coverage")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true",
+                        default=False,
+                        help="Verbose logging")
+    args = parser.parse_args()
+    setup_logging(args.verbose)
+
+    db_list = find_cov_db(args.db, exclude=[args.output])
+    if not db_list:
+        logging.error("No coverage database found")
+        sys.exit(RET_FAIL)
+    merge_cov_db(db_list, args.output, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,12 +16,22 @@ limitations under the License.
 Class for RISC-V instruction trace CSV
 """
 
+import array
+import bisect
+import contextlib
 import csv
+import mmap
 import re
 import logging
+import struct
 import sys
 from lib import *
 
+# File extension of the columnar binary trace format
+TRACE_COLUMNAR_EXT = ".ctrace"
+# Number of trace entries written at once by the log converters
+TRACE_BATCH_SIZE = 4096
+
 
 class RiscvInstructionTraceEntry(object):
     """RISC-V instruction trace entry"""
@@ -57,9 +67,26 @@ class RiscvInstructionTraceCsv(object):
                   "operand", "pad"]
         self.csv_writer = csv.DictWriter(self.csv_fd, fieldnames=fields)
         self.csv_writer.writeheader()
+        self.csv_row_writer = csv.writer(self.csv_fd)
+
+    def end_trace(self):
+        """Finish writing the trace"""
+        self.csv_fd.flush()
+
+    def iter_rows(self):
+        """Iterate over the raw CSV rows, header row included"""
+        return csv.reader(self.csv_fd, delimiter=',')
 
     def read_trace(self, trace):
         """Read instruction trace from CSV file"""
+        trace.extend(self.iter_trace())
+
+    def iter_trace(self):
+        """Iterate over the instruction trace of the CSV file
+
+        The entries are parsed one row at a time, so the memory used doesn't
+        depend on the length of the trace.
+        """
         csv_reader = csv.DictReader(self.csv_fd)
         for row in csv_reader:
             new_trace = RiscvInstructionTraceEntry()
@@ -71,7 +98,22 @@ class RiscvInstructionTraceCsv(object):
             new_trace.instr_str = row['instr_str']
             new_trace.instr = row['instr']
             new_trace.mode = row['mode']
-            trace.append(new_trace)
+            yield new_trace
+
+    def iter_gpr_update(self):
+        """Iterate over the GPR updates of the trace
+
+        Returns:
+          Iterator of (gpr_update, entry), gpr_update is a tuple of
+          (reg, value) pairs, see get_reg_value, and entry is passed to
+          get_trace_string
+        """
+        for entry in self.iter_trace():
+            yield tuple(map(get_reg_value, entry.gpr)), entry
+
+    def get_trace_string(self, entry):
+        """Return a short string of a trace entry"""
+        return entry.get_trace_string()
 
     # TODO: Convert pseudo instruction to regular instruction
 
@@ -86,6 +128,400 @@ class RiscvInstructionTraceCsv(object):
                                   'instr'    : entry.instr,
                                   'mode'     : entry.mode})
 
+    def write_trace_entries(self, entries):
+        """Write a list of trace entries to CSV at once"""
+        self.csv_row_writer.writerows(
+            [entry.pc, entry.instr, ";".join(entry.gpr), ";".join(entry.csr),
+             entry.binary, entry.mode, entry.instr_str, entry.operand, ""]
+            for entry in entries)
+
+
+class RiscvInstructionTraceColumnar(object):
+    """RISC-V instruction trace in columnar binary format
+
+    It provides the same read/write functions as RiscvInstructionTraceCsv.
+    The trace is a sequence of chunks of up to CHUNK_SIZE entries, so that
+    the writer only holds one chunk in memory. Every field of a chunk is
+    stored as a packed array: pc, binary and the GPR/CSR write values as
+    64-bit integers, and the GPR/CSR writes of the instruction i are the
+    items [gpr_start[i], gpr_start[i + 1]) of the gpr_* columns. Register
+    names and the values which are not plain lower case hex numbers are kept
+    in the string table of the chunk. The file is memory-mapped when read,
+    and iter_columns gets the integer columns without any string parsing.
+    """
+
+    MAGIC = b"RVTRCOL2"
+    # Column name and array type code, in file order
+    COLUMNS = [("pc", "Q"), ("pc_width", "B"),
+               ("binary", "Q"), ("binary_width", "B"),
+               ("mode", "h"),
+               ("gpr_start", "I"), ("gpr_reg", "I"), ("gpr_val", "Q"),
+               ("gpr_width", "B"),
+               ("csr_start", "I"), ("csr_reg", "I"), ("csr_val", "Q"),
+               ("csr_width", "B"),
+               ("text_start", "I"), ("text", "B"),
+               ("str_start", "I"), ("str", "B")]
+    # Text fields of an entry, in the order of the text column
+    TEXT_FIELDS = ["instr", "operand", "instr_str"]
+    # Number of entries of a chunk
+    CHUNK_SIZE = 65536
+    # Width marking a value held in the string table
+    STR_WIDTH = 0xff
+    # Width marking a register write without ":" separator
+    RAW_WIDTH = 0xfe
+    # Widths of the values which are not plain hex numbers
+    SPECIAL_WIDTHS = [b"\x00", bytes([STR_WIDTH]), bytes([RAW_WIDTH])]
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.columns = {}
+        self.chunks = []
+        self.chunk_strs = []
+        self.chunk_start = [0]
+        self.views = []
+        self.buf = None
+
+    def start_new_trace(self):
+        """Start a new trace, the chunks are written as they fill up"""
+        self.fd.write(self.MAGIC)
+        self.start_new_chunk()
+
+    def start_new_chunk(self):
+        """Clear the columns and the string table for a new chunk"""
+        self.columns = {name: array.array(code) for name, code in self.COLUMNS}
+        self.columns["gpr_start"].append(0)
+        self.columns["csr_start"].append(0)
+        self.columns["text_start"].append(0)
+        self.columns["str_start"].append(0)
+        self.str_idx = {}
+
+    def intern(self, val):
+        """Get the string table index of a string"""
+        idx = self.str_idx.get(val)
+        if idx is None:
+            idx = len(self.str_idx)
+            self.str_idx[val] = idx
+            self.columns["str"].frombytes(val.encode())
+            self.columns["str_start"].append(len(self.columns["str"]))
+        return idx
+
+    def pack_hex(self, val):
+        """Pack a hex string to a (value, width) pair"""
+        if not val:
+            return 0, 0
+        # A signed value would not fit the unsigned columns
+        if len(val) <= 16 and val[0] not in "+-":
+            try:
+                num = int(val, 16)
+                if "{:0{}x}".format(num, len(val)) == val:
+                    return num, len(val)
+            except ValueError:
+                pass
+        return self.intern(val), self.STR_WIDTH
+
+    @classmethod
+    def unpack_hex(cls, strs, num, width):
+        """Unpack a (value, width) pair to a hex string"""
+        if width == 0:
+            return ""
+        if width == cls.STR_WIDTH:
+            return strs[num]
+        return "{:0{}x}".format(num, width)
+
+    def write_reg_update(self, prefix, update):
+        """Write the GPR/CSR updates of an entry"""
+        for item in update:
+            name, sep, val = item.partition(":")
+            if sep:
+                num, width = self.pack_hex(val)
+            else:
+                num, width = 0, self.RAW_WIDTH
+            self.columns[prefix + "_reg"].append(self.intern(name))
+            self.columns[prefix + "_val"].append(num)
+            self.columns[prefix + "_width"].append(width)
+        self.columns[prefix + "_start"].append(len(self.columns[prefix + "_reg"]))
+
+    def write_trace_entry(self, entry):
+        """Write a new trace entry to the columns"""
+        num, width = self.pack_hex(entry.pc)
+        self.columns["pc"].append(num)
+        self.columns["pc_width"].append(width)
+        num, width = self.pack_hex(entry.binary)
+        self.columns["binary"].append(num)
+        self.columns["binary_width"].append(width)
+        mode = entry.mode or ""
+        if mode.isdigit() and int(mode) < 0x8000:
+            self.columns["mode"].append(int(mode))
+        elif mode == "":
+            self.columns["mode"].append(-1)
+        else:
+            self.columns["mode"].append(-2 - self.intern(mode))
+        self.write_reg_update("gpr", entry.gpr)
+        self.write_reg_update("csr", entry.csr)
+        for text in [entry.instr, entry.operand, entry.instr_str]:
+            self.columns["text"].frombytes(text.encode())
+            self.columns["text_start"].append(len(self.columns["text"]))
+        if len(self.columns["pc"]) >= self.CHUNK_SIZE:
+            self.write_chunk()
+
+    def write_trace_entries(self, entries):
+        """Write a list of trace entries to the columns"""
+        for entry in entries:
+            self.write_trace_entry(entry)
+
+    def write_chunk(self):
+        """Write the columns to the trace file as a chunk"""
+        self.fd.write(struct.pack("<{}Q".format(len(self.COLUMNS)),
+                                  *[len(self.columns[name])
+                                    for name, _ in self.COLUMNS]))
+        for name, _ in self.COLUMNS:
+            data = self.columns[name]
+            if sys.byteorder != "little":
+                data = array.array(data.typecode, data)
+                data.byteswap()
+            self.fd.write(data.tobytes())
+            # Keep every column 8-byte aligned
+            self.fd.write(bytes(-len(data) * data.itemsize % 8))
+        self.start_new_chunk()
+
+    def end_trace(self):
+        """Write the last chunk to the trace file"""
+        if len(self.columns["pc"]):
+            self.write_chunk()
+        self.fd.flush()
+
+    def load(self):
+        """Memory-map the trace file and get a view of every column"""
+        if self.buf is not None:
+            return
+        self.buf = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buf[:len(self.MAGIC)] != self.MAGIC:
+            self.close()
+            raise ValueError("Not a columnar trace file: {}".format(
+                self.fd.name))
+        if sys.byteorder != "little":
+            self.close()
+            raise ValueError("Columnar trace is only supported on little "
+                             "endian hosts")
+        header = memoryview(self.buf)
+        self.views.append(header)
+        offset = len(self.MAGIC)
+        while offset < len(self.buf):
+            counts = struct.unpack_from("<{}Q".format(len(self.COLUMNS)),
+                                        self.buf, offset)
+            offset += 8 * len(self.COLUMNS)
+            col = {}
+            for (name, code), count in zip(self.COLUMNS, counts):
+                size = count * array.array(code).itemsize
+                view = header[offset:offset + size].cast(code)
+                self.views.append(view)
+                col[name] = view
+                offset += size + (-size % 8)
+            str_start = col["str_start"].tolist()
+            str_data = bytes(col["str"])
+            self.chunks.append(col)
+            self.chunk_strs.append(
+                [str_data[str_start[k]:str_start[k + 1]].decode()
+                 for k in range(len(str_start) - 1)])
+            self.chunk_start.append(self.chunk_start[-1] + len(col["pc"]))
+
+    def close(self):
+        """Release the memory-mapped trace file"""
+        self.chunks = []
+        self.chunk_strs = []
+        self.chunk_start = [0]
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        if self.buf is not None:
+            self.buf.close()
+            self.buf = None
+
+    def __len__(self):
+        self.load()
+        return self.chunk_start[-1]
+
+    def get_reg_update(self, col, strs, prefix, i):
+        """Get the GPR/CSR updates of the entry i of a chunk as strings"""
+        start = col[prefix + "_start"]
+        reg = col[prefix + "_reg"]
+        val = col[prefix + "_val"]
+        width = col[prefix + "_width"]
+        update = []
+        for j in range(start[i], start[i + 1]):
+            if width[j] == self.RAW_WIDTH:
+                update.append(strs[reg[j]])
+            else:
+                update.append(strs[reg[j]] + ":" +
+                              self.unpack_hex(strs, val[j], width[j]))
+        return update
+
+    def get_trace_entry(self, i):
+        """Get the entry i of the trace"""
+        self.load()
+        chunk = bisect.bisect_right(self.chunk_start, i) - 1
+        col = self.chunks[chunk]
+        strs = self.chunk_strs[chunk]
+        i -= self.chunk_start[chunk]
+        entry = RiscvInstructionTraceEntry()
+        entry.pc = self.unpack_hex(strs, col["pc"][i], col["pc_width"][i])
+        entry.binary = self.unpack_hex(strs, col["binary"][i],
+                                       col["binary_width"][i])
+        mode = col["mode"][i]
+        if mode >= 0:
+            entry.mode = str(mode)
+        elif mode < -1:
+            entry.mode = strs[-2 - mode]
+        entry.gpr = self.get_reg_update(col, strs, "gpr", i)
+        entry.csr = self.get_reg_update(col, strs, "csr", i)
+        text_start = col["text_start"]
+        text = col["text"]
+        entry.instr, entry.operand, entry.instr_str = [
+            bytes(text[text_start[3 * i + k]:text_start[3 * i + k + 1]]).decode()
+            for k in range(3)]
+        return entry
+
+    def get_trace_string(self, i):
+        """Return a short string of the entry i of the trace"""
+        return self.get_trace_entry(i).get_trace_string()
+
+    def read_trace(self, trace):
+        """Read instruction trace from the columnar trace file"""
+        trace.extend(self.iter_trace())
+
+    def iter_trace(self):
+        """Iterate over the instruction trace of the columnar trace file"""
+        for i in range(len(self)):
+            yield self.get_trace_entry(i)
+
+    def iter_rows(self):
+        """Iterate over the trace as CSV rows, header row included"""
+        yield ["pc", "instr", "gpr", "csr", "binary", "mode", "instr_str",
+               "operand", "pad"]
+        for entry in self.iter_trace():
+            yield [entry.pc, entry.instr, ";".join(entry.gpr),
+                   ";".join(entry.csr), entry.binary, entry.mode,
+                   entry.instr_str, entry.operand, ""]
+
+    def get_column(self, col, strs, name):
+        """Decode a column of a chunk, see iter_columns"""
+        if name in self.TEXT_FIELDS:
+            text_start = col["text_start"].tolist()
+            text = bytes(col["text"])
+            return [text[text_start[k]:text_start[k + 1]].decode()
+                    for k in range(self.TEXT_FIELDS.index(name),
+                                   len(text_start) - 1, 3)]
+        if name in ["pc", "binary"]:
+            vals = col[name].tolist()
+            widths = bytes(col[name + "_width"])
+            if any(width in widths for width in self.SPECIAL_WIDTHS):
+                for j, width in enumerate(widths):
+                    if width == 0:
+                        vals[j] = None
+                    elif width == self.STR_WIDTH:
+                        vals[j] = get_hex_value(strs[vals[j]])
+            return vals
+        if name in ["gpr", "csr"]:
+            start = col[name + "_start"].tolist()
+            update = list(zip([strs[reg] for reg in col[name + "_reg"]],
+                              col[name + "_val"].tolist()))
+            widths = bytes(col[name + "_width"])
+            if any(width in widths for width in self.SPECIAL_WIDTHS):
+                for j, width in enumerate(widths):
+                    reg, val = update[j]
+                    if width == 0:
+                        update[j] = get_reg_value(reg + ":")
+                    elif width == self.STR_WIDTH:
+                        update[j] = get_reg_value(reg + ":" + strs[val])
+                    elif width == self.RAW_WIDTH:
+                        update[j] = get_reg_value(reg)
+            return [tuple(update[start[i]:start[i + 1]])
+                    for i in range(len(start) - 1)]
+        raise ValueError("Unknown trace column: {}".format(name))
+
+    def iter_columns(self, *names):
+        """Iterate over the chunks of the trace as integer and text columns
+
+        Args:
+          names : Columns to get, "pc", "binary", "gpr", "csr", "instr",
+                  "operand" or "instr_str"
+
+        Returns:
+          Iterator of a dict per chunk, holding a list of the chunk entries
+          per column: the pc and binary as integers (None if the field is
+          not a hex number), the GPR/CSR updates as tuples of (reg, value)
+          pairs, see get_reg_value, and the text fields as strings
+        """
+        self.load()
+        for col, strs in zip(self.chunks, self.chunk_strs):
+            yield {name: self.get_column(col, strs, name) for name in names}
+
+    def iter_gpr_update(self):
+        """Iterate over the GPR updates of the trace
+
+        Returns:
+          Iterator of (gpr_update, i), gpr_update is a tuple of (reg, value)
+          pairs, see get_reg_value, and i is passed to get_trace_string
+        """
+        i = 0
+        for columns in self.iter_columns("gpr"):
+            for gpr_update in columns["gpr"]:
+                yield gpr_update, i
+                i += 1
+
+
+@contextlib.contextmanager
+def open_trace(path, mode="r"):
+    """Open an instruction trace file
+
+    The trace is in columnar binary format if the file name ends with
+    TRACE_COLUMNAR_EXT, otherwise it is a CSV file.
+
+    Args:
+      path : Trace file
+      mode : "r" to read the trace, "w" to write a new one
+
+    Returns:
+      RiscvInstructionTraceCsv or RiscvInstructionTraceColumnar object
+    """
+    if path.endswith(TRACE_COLUMNAR_EXT):
+        with open(path, mode + "b") as fd:
+            trace = RiscvInstructionTraceColumnar(fd)
+            try:
+                yield trace
+                if mode == "w":
+                    trace.end_trace()
+            finally:
+                trace.close()
+    else:
+        with open(path, mode) as fd:
+            trace = RiscvInstructionTraceCsv(fd)
+            yield trace
+            if mode == "w":
+                trace.end_trace()
+
+
+def get_hex_value(val):
+    """Get the integer value of a hex string, None if it's not a hex number"""
+    try:
+        return int(val, 16)
+    except ValueError:
+        return None
+
+
+def get_reg_value(update):
+    """Split a "reg:value" register update to a (reg, value) pair
+
+    The value is the integer value of the hex value string, the pair is
+    (update, None) if the update is malformed.
+    """
+    reg, sep, val = update.partition(":")
+    if sep and ":" not in val:
+        num = get_hex_value(val)
+        if num is not None:
+            return reg, num
+    return update, None
+
 
 def get_imm_hex_val(imm):
     """Get the hex representation of the imm value"""
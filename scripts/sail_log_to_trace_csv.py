@@ -42,10 +42,9 @@ def process_sail_sim_log(sail_log, csv):
     logging.info("Processing sail log : {}".format(sail_log))
     instr_cnt = 0
 
-    with open(sail_log, "r") as f, open(csv, "w") as csv_fd:
+    with open(sail_log, "r") as f, open_trace(csv, "w") as trace_csv:
         search_start = 0
         instr_start = 0
-        trace_csv = RiscvInstructionTraceCsv(csv_fd)
         trace_csv.start_new_trace()
         instr = None
         for line in f:
@@ -88,7 +87,9 @@ def main():
     # Parse input arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--log", type=str, help="Input sail simulation log")
-    parser.add_argument("--csv", type=str, help="Output trace csv_buf file")
+    parser.add_argument("--csv", type=str,
+                        help="Output trace csv_buf file, a .ctrace file name "
+                             "selects the columnar trace format")
     args = parser.parse_args()
     # Process sail log
     process_sail_sim_log(args.log, args.csv)
@@ -36,6 +36,18 @@ CORE_RE = re.compile(
 ADDR_RE = re.compile(
     r"(?P<rd>[a-z0-9]+?),(?P<imm>[\-0-9]+?)\((?P<rs1>[a-z0-9]+)\)")
 ILLE_RE = re.compile(r"trap_illegal_instruction")
+# Instruction line, or commit line with core prefix, of the log. The groups
+# of the instruction are the ones of CORE_RE, the ones of the commit data the
+# ones of RD_RE
+CORE_LINE_RE = re.compile(
+    r"core\s+\d+:\s+(?:0x(?P<addr>[a-f0-9]+?)\s+\(0x(?P<bin>.*?)\)\s+" \
+    r"(?P<instr>.*?)$|(?P<pri>\d)\s+0x[a-f0-9]+?\s+\(.*?\)\s+" \
+    r"(?P<reg>[xf]\s*\d*?)\s+0x(?P<val>[a-f0-9]+)" \
+    r"(\s+(?P<csr>\S+)\s+0x(?P<csr_val>[a-f0-9]+))?)")
+END_TRAMPOLINE_RE = re.compile(r'core.*: 0x0*1010 ')
+
+# ABI names of the registers of the commit log
+REG_ABI = {}
 
 LOGGER = logging.getLogger()
 
@@ -69,16 +81,16 @@ def read_spike_instr(match, full_trace):
     """
 
     # Extract the disassembled instruction.
-    disasm = match.group('instr')
+    addr, binary, disasm = match.group('addr', 'bin', 'instr')
 
     # Spike's disassembler shows a relative jump as something like "j pc +
     # 0x123" or "j pc - 0x123". We just want the relative offset.
     disasm = disasm.replace('pc + ', '').replace('pc - ', '-')
 
     instr = RiscvInstructionTraceEntry()
-    instr.pc = match.group('addr')
+    instr.pc = addr
     instr.instr_str = disasm
-    instr.binary = match.group('bin')
+    instr.binary = binary
 
     if full_trace:
         opcode = disasm.split(' ')[0]
@@ -91,6 +103,15 @@ def read_spike_instr(match, full_trace):
     return instr
 
 
+def get_reg_abi(reg):
+    """ABI name of a register of the commit log, interned once per name"""
+    abi = REG_ABI.get(reg)
+    if abi is None:
+        abi = sys.intern(gpr_to_abi(reg.replace(' ', '')))
+        REG_ABI[reg] = abi
+    return abi
+
+
 def read_spike_trace(path, full_trace):
     """Read a Spike simulation log at <path>, yielding executed instructions.
 
@@ -123,70 +144,63 @@ def read_spike_trace(path, full_trace):
     # On entry to the loop body, we are in state TRAMPOLINE if in_trampoline is
     # true. Otherwise, we are in state EFFECT if instr is not None, otherwise we
     # are in state INSTR.
-
-    end_trampoline_re = re.compile(r'core.*: 0x0*1010 ')
+    #
+    # Every line is matched once at most: the first character of the line
+    # selects the single regex which can match it.
 
     in_trampoline = True
     instr = None
 
-    with open(path, 'r') as handle:
-        for line in handle:
-            if in_trampoline:
-                # The TRAMPOLINE state
-                if end_trampoline_re.match(line):
-                    in_trampoline = False
-                continue
-
-            if instr is None:
-                # The INSTR state. We expect to see a line matching CORE_RE.
-                # We'll discard any other lines.
-                instr_match = CORE_RE.match(line)
-                if not instr_match:
-                    continue
-
-                instr = read_spike_instr(instr_match, full_trace)
-
-                # If instr.instr_str is 'ecall', we should stop.
+    for line in read_log_lines(path):
+        if in_trampoline:
+            # The TRAMPOLINE state
+            if END_TRAMPOLINE_RE.match(line):
+                in_trampoline = False
+            continue
+
+        if line.startswith("core"):
+            # An instruction, or the commit data of a log with core prefix
+            match = CORE_LINE_RE.match(line)
+            if match and match.group('addr') is not None:
+                # If we were in the EFFECT state, we should have been in
+                # state INSTR, so we yield the instruction we had. If the new
+                # instruction is 'ecall', we should stop.
+                if instr is not None:
+                    yield instr, False
+                instr = read_spike_instr(match, full_trace)
                 if instr.instr_str == 'ecall':
                     break
-
                 continue
-
-            # The EFFECT state. If the line matches CORE_RE, we should have been in
-            # state INSTR, so we yield the instruction we had, read the new
-            # instruction and continue. As above, if the new instruction is 'ecall',
-            # we need to stop immediately.
-            instr_match = CORE_RE.match(line)
-            if instr_match:
-                yield instr, False
-                instr = read_spike_instr(instr_match, full_trace)
-                if instr.instr_str == 'ecall':
-                    break
-                continue
-
-            # The line doesn't match CORE_RE, so we are definitely on a follow-on
-            # line in the log. First, check for illegal instructions
-            if 'trap_illegal_instruction' in line:
-                yield (instr, True)
-                instr = None
-                continue
-
-            # The instruction seems to have been fine. Do we have commit data (from
-            # the --log-commits Spike option)?
-            commit_match = RD_RE.match(line)
-            if commit_match:
-                groups = commit_match.groupdict()
-                instr.gpr.append(gpr_to_abi(groups["reg"].replace(' ', '')) +
-                                 ":" + groups["val"])
-
-                if groups["csr"] and groups["csr_val"]:
-                    instr.csr.append(groups["csr"] + ":" + groups["csr_val"])
-
-                instr.mode = commit_match.group('pri')
-
-        # At EOF, we might have an instruction in hand. Yield it if so.
-        if instr is not None:
-            yield (instr, False)
+        elif instr is not None and line[:1].isdigit():
+            match = RD_RE.match(line)
+        else:
+            match = None
+
+        if instr is None:
+            # The INSTR state. We'll discard any line which isn't an
+            # instruction.
+            continue
+
+        # The EFFECT state, the line is a follow-on line of the instruction.
+        # First, check for illegal instructions
+        if 'trap_illegal_instruction' in line:
+            yield (instr, True)
+            instr = None
+            continue
+
+        # The instruction seems to have been fine. Do we have commit data (from
+        # the --log-commits Spike option)?
+        if match:
+            reg, val, csr, csr_val, pri = match.group('reg', 'val', 'csr',
+                                                      'csr_val', 'pri')
+            instr.gpr.append(get_reg_abi(reg) + ":" + val)
+            if csr and csr_val:
+                instr.csr.append(csr + ":" + csr_val)
+            instr.mode = pri
+
+    # At EOF, we might have an instruction in hand. Yield it if so.
+    if instr is not None:
+        yield (instr, False)
 
 
 def process_spike_sim_log(spike_log, csv, full_trace=0):
@@ -201,9 +215,9 @@ def process_spike_sim_log(spike_log, csv, full_trace=0):
     instrs_in = 0
     instrs_out = 0
 
-    with open(csv, "w") as csv_fd:
-        trace_csv = RiscvInstructionTraceCsv(csv_fd)
+    with open_trace(csv, "w") as trace_csv:
         trace_csv.start_new_trace()
+        entries = []
 
         for (entry, illegal) in read_spike_trace(spike_log, full_trace):
             instrs_in += 1
@@ -222,8 +236,15 @@ def process_spike_sim_log(spike_log, csv, full_trace=0):
                                                                    'ecall']):
                 continue
 
-            trace_csv.write_trace_entry(entry)
-            instrs_out += 1
+            # The entries are written in batches
+            entries.append(entry)
+            if len(entries) == TRACE_BATCH_SIZE:
+                trace_csv.write_trace_entries(entries)
+                instrs_out += len(entries)
+                entries = []
+
+        trace_csv.write_trace_entries(entries)
+        instrs_out += len(entries)
 
     logging.info("Processed instruction count : {}".format(instrs_in))
     logging.info("CSV saved to : {}".format(csv))
@@ -234,7 +255,9 @@ def main():
     # Parse input arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--log", type=str, help="Input spike simulation log")
-    parser.add_argument("--csv", type=str, help="Output trace csv_buf file")
+    parser.add_argument("--csv", type=str,
+                        help="Output trace csv_buf file, a .ctrace file name "
+                             "selects the columnar trace format")
     parser.add_argument("-f", "--full_trace", dest="full_trace",
                         action="store_true",
                         help="Generate the full trace")
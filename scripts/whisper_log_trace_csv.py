@@ -45,8 +45,7 @@ def process_whisper_sim_log(whisper_log, csv, full_trace=0):
     instr_cnt = 0
     whisper_instr = ""
 
-    with open(whisper_log, "r") as f, open(csv, "w") as csv_fd:
-        trace_csv = RiscvInstructionTraceCsv(csv_fd)
+    with open(whisper_log, "r") as f, open_trace(csv, "w") as trace_csv:
         trace_csv.start_new_trace()
         for line in f:
             # Extract instruction infromation
@@ -76,7 +75,9 @@ def main():
     # Parse input arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--log", type=str, help="Input whisper simulation log")
-    parser.add_argument("--csv", type=str, help="Output trace csv_buf file")
+    parser.add_argument("--csv", type=str,
+                        help="Output trace csv_buf file, a .ctrace file name "
+                             "selects the columnar trace format")
     parser.add_argument("-f", "--full_trace", dest="full_trace",
                         action="store_true",
                         help="Generate the full trace")
@@ -0,0 +1,92 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Unit tests of the compile and ISS log cache
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "scripts"))
+
+from compile_cache import CompileCache
+
+
+class CompileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(os.path.join(self.tmp_dir.name, "cache"))
+        self.log = os.path.join(self.tmp_dir.name, "test_0.log")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_fetch_after_store(self):
+        with open(self.log, "w") as f:
+            f.write("ISS LOG\n")
+        self.cache.store("ab" * 32, [self.log])
+        os.remove(self.log)
+        self.assertTrue(self.cache.fetch("ab" * 32, [self.log]))
+        self.assertEqual(self.read(self.log), "ISS LOG\n")
+        self.assertFalse(self.cache.fetch("cd" * 32, [self.log]))
+
+    def test_entry_survives_rewrite_of_fetched_file(self):
+        with open(self.log, "w") as f:
+            f.write("ISS LOG\n")
+        self.cache.store("ab" * 32, [self.log])
+        self.assertTrue(self.cache.fetch("ab" * 32, [self.log]))
+        # A later simulation truncates the log in place, as the ISS command
+        # redirection does
+        subprocess.run("echo OTHER > {}".format(self.log), shell=True,
+                       check=True)
+        entry = os.path.join(self.cache.get_entry("ab" * 32), "0")
+        self.assertEqual(self.read(entry), "ISS LOG\n")
+        self.assertTrue(self.cache.fetch("ab" * 32, [self.log]))
+        self.assertEqual(self.read(self.log), "ISS LOG\n")
+
+    def test_key_independent_of_output_dir(self):
+        keys = []
+        for out in ["out_a", "out_b"]:
+            asm_dir = os.path.join(self.tmp_dir.name, out, "asm_test")
+            os.makedirs(asm_dir)
+            asm = os.path.join(asm_dir, "test_0.S")
+            elf = os.path.join(asm_dir, "test_0.o")
+            with open(asm, "w") as f:
+                f.write(".incbin \"test_0_region_0.dat\"\n")
+            with open(os.path.join(asm_dir, "test_0_region_0.dat"), "wb") as f:
+                f.write(b"\x01\x02")
+            cmd = "riscv-gcc {} -I{} -o {}".format(asm, asm_dir, elf)
+            keys.append(self.cache.get_key(asm, [cmd], [elf]))
+            # Other tests written next to it don't change the key
+            with open(os.path.join(asm_dir, "test_1.S"), "w") as f:
+                f.write("nop\n")
+            keys.append(self.cache.get_key(asm, [cmd], [elf]))
+        self.assertEqual(len(set(keys)), 1)
+        with open(os.path.join(asm_dir, "test_0_region_0.dat"), "wb") as f:
+            f.write(b"\x03\x04")
+        self.assertNotEqual(self.cache.get_key(asm, [cmd], [elf]), keys[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Unit tests of the columnar instruction trace
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "scripts"))
+
+from riscv_trace_csv import (RiscvInstructionTraceColumnar,
+                             RiscvInstructionTraceEntry)
+
+
+class RiscvInstructionTraceColumnarTest(unittest.TestCase):
+
+    def test_values_round_trip(self):
+        entry = RiscvInstructionTraceEntry()
+        entry.pc = "80000000"
+        entry.binary = "fff00513"
+        entry.instr = "addi"
+        entry.operand = "a0,zero,-1"
+        entry.instr_str = "li a0,-1"
+        entry.gpr = ["a0:ffffffff", "a1:-1", "a2:+1", "a3:0x10", "a4"]
+        entry.csr = ["mstatus:00001800"]
+        with tempfile.TemporaryFile() as fd:
+            trace = RiscvInstructionTraceColumnar(fd)
+            trace.start_new_trace()
+            trace.write_trace_entry(entry)
+            trace.end_trace()
+            fd.seek(0)
+            read_trace = RiscvInstructionTraceColumnar(fd)
+            read_entry = read_trace.get_trace_entry(0)
+            self.assertEqual(read_entry.gpr, entry.gpr)
+            self.assertEqual(read_entry.csr, entry.csr)
+            self.assertEqual(read_entry.pc, entry.pc)
+            self.assertEqual(read_entry.operand, entry.operand)
+            read_trace.close()
+
+
+if __name__ == "__main__":
+    unittest.main()